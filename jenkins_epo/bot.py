@@ -14,6 +14,7 @@
 
 import asyncio
 import collections
+from contextlib import contextmanager
 import copy
 import logging
 import pkg_resources
@@ -22,8 +23,13 @@ import reprlib
 import yaml
 
 from .github import GITHUB
+from .metrics import EXTENSION_SECONDS
+from .profiling import PROFILER
+from .repository import CommitStatus
 from .settings import SETTINGS
+from .tracing import span
 from .utils import Bunch, parse_datetime, match, parse_patterns
+from .workers import WORKERS
 
 
 logger = logging.getLogger(__name__)
@@ -66,6 +72,10 @@ See `jenkins: help` for documentation.
         ')'
     )
     ext_patterns = parse_patterns(SETTINGS.EXTENSIONS)
+    # Objects with start(bot), finish(bot), pre(bot, ext, step) and post(bot,
+    # ext, step, wall, calls) methods, called around heads and extension
+    # steps.
+    hooks = [PROFILER]
 
     def __init__(self):
         self.extensions_map = {}
@@ -90,6 +100,7 @@ See `jenkins: help` for documentation.
         self.current = Bunch(copy.deepcopy(self.DEFAULTS))
         self.current.head = head
         self.current.repository = head.repository
+        self.current.contexts = ContextTable(self.current)
         if isinstance(head.repository.SETTINGS, dict):
             # Allow to pass a Mock() as SETTINGS
             self.current.SETTINGS = Bunch(
@@ -106,10 +117,34 @@ See `jenkins: help` for documentation.
             ext.current = self.current
         return self
 
+    @contextmanager
+    def measure(self, ext, step):
+        # Trace and time an extension step, calling hooks.
+        labels = dict(extension=ext.name, step=step)
+        for hook in self.hooks:
+            hook.pre(self, ext, step)
+        trace = None
+        try:
+            with span('extension', **labels) as trace:
+                yield
+        finally:
+            EXTENSION_SECONDS.observe(trace.duration, **labels)
+            for hook in self.hooks:
+                hook.post(self, ext, step, trace.duration, trace.calls)
+
     @asyncio.coroutine
     def run(self, head):
         self.workon(head)
+        for hook in self.hooks:
+            hook.start(self)
+        try:
+            yield from self.run_extensions()
+        finally:
+            for hook in self.hooks:
+                hook.finish(self)
 
+    @asyncio.coroutine
+    def run_extensions(self):
         if self.current.head.payload.get('state') == 'closed':
             return logger.info("Skipping closed head.")
 
@@ -127,7 +162,8 @@ See `jenkins: help` for documentation.
 
         for ext in self.extensions:
             try:
-                ext.begin()
+                with self.measure(ext, 'begin'):
+                    ext.begin()
             except SkipHead:
                 return
 
@@ -141,8 +177,11 @@ See `jenkins: help` for documentation.
         logger.debug("Bot vars: %s", vars_repr)
 
         for ext in self.extensions:
+            # Between extensions, an urgent task may preempt this one.
+            yield from WORKERS.checkpoint()
             try:
-                yield from ext.run()
+                with self.measure(ext, 'run'):
+                    yield from ext.run()
             except SkipHead:
                 return
 
@@ -237,6 +276,91 @@ See `jenkins: help` for documentation.
                 ext.process_instruction(instruction)
 
 
+class ContextTable(dict):
+    # Maps status context to its JobContext for the current head. Contexts of
+    # a spec are listed once, on first query. Statuses are read live from the
+    # bot context and updated through entries, so extensions see each other's
+    # updates.
+
+    def __init__(self, current):
+        super(ContextTable, self).__init__()
+        self.current = current
+        self.specs = {}
+        # Stage name by spec name, as grouped by StagesExtension.
+        self.stages = {}
+
+    def for_spec(self, spec):
+        # Raises KeyError if job is not on Jenkins.
+        job = self.current.jobs[spec.name]
+        indexed = self.specs.get(spec.name)
+        if indexed and indexed[0] is spec and indexed[1] is job:
+            return indexed[2]
+
+        entries = [
+            JobContext(self, context, job, spec)
+            for context in job.list_contexts(spec)
+        ]
+        for entry in entries:
+            self[entry.name] = entry
+        self.specs[spec.name] = spec, job, entries
+        return entries
+
+    def for_specs(self, specs):
+        for spec in specs:
+            yield from self.for_spec(spec)
+
+
+class JobContext(object):
+    def __init__(self, table, name, job, spec):
+        self.table = table
+        self.name = name
+        self.job = job
+        self.spec = spec
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.name)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def has_status(self):
+        return self.name in self.table.current.statuses
+
+    @property
+    def status(self):
+        return self.table.current.statuses.get(self.name, CommitStatus())
+
+    @property
+    def stage(self):
+        return self.table.stages.get(self.spec.name)
+
+    @property
+    def is_queueable(self):
+        return self.status.is_queueable
+
+    @property
+    def is_rebuildable(self):
+        return self.status.is_rebuildable
+
+    @property
+    def is_running(self):
+        return self.status.is_running
+
+    @property
+    def is_skipped(self):
+        return self.status.is_skipped
+
+    def needs_build(self, rebuild_failed=None):
+        return self.status.needs_build(rebuild_failed)
+
+    @asyncio.coroutine
+    def update_status(self, status):
+        status = CommitStatus(status, context=self.name)
+        commit = self.table.current.last_commit
+        return (yield from commit.maybe_update_status(status))
+
+
 class Instruction(object):
     def __init__(self, author, name, args=None, date=None):
         self.name = name
@@ -1,3 +1,4 @@
+from collections.abc import MutableMapping
 import dbm
 import fcntl
 import logging
@@ -12,13 +13,18 @@ logger = logging.getLogger(__name__)
 
 
 class Cache(object):
+    hits = 0
+    misses = 0
+
     def get(self, key):
         try:
             _, value = self.storage[key]
             logger.debug("Hit %s", key)
+            self.hits += 1
             return value
         except KeyError:
             logger.debug("Miss %s", key)
+            self.misses += 1
             raise
         except Exception:
             # Looks like this key is corrupted.
@@ -30,15 +36,30 @@ class Cache(object):
         self.storage[key] = (time.time(), value)
         return self.storage[key]
 
-    def purge(self):
+    def touch(self, key):
+        # Refresh last-seen date of key to save it from purge. Writes only
+        # past half the purge delay, rather than on each hit.
+        try:
+            last_seen_date, value = self.storage[key]
+        except Exception:
+            return
+        if last_seen_date < time.time() - self.purge_delay() / 2:
+            self.set(key, value)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+    def purge_delay(self):
         # Each data is assigned a last-seen-valid date. So if this date is old,
         # this mean we didn't check the validity of the data.  We consider a
         # repository take less 60s to process. If the last-seen hasn't been
         # updated, this mean that the query wont happen anymore (PR is closed,
         # etc.)
         repo_count = len(SETTINGS.REPOSITORIES.split())
-        rounds_delta = 300 + SETTINGS.CACHE_LIFE * repo_count
-        limit = time.time() - rounds_delta
+        return 300 + SETTINGS.CACHE_LIFE * repo_count
+
+    def purge(self):
+        limit = time.time() - self.purge_delay()
         cleaned = 0
         for key in list(self.storage.keys()):
             try:
@@ -61,6 +82,51 @@ class MemoryCache(Cache):
         self.storage = {}
 
 
+class HotTier(MutableMapping):
+    # In-memory copy of dbm records read or written, in front of dbm file.
+    # Values are still pickled, thus each get returns a fresh copy.
+
+    def __init__(self, db):
+        self.db = db
+        self.hot = {}
+
+    def __getitem__(self, key):
+        try:
+            return self.hot[key]
+        except KeyError:
+            value = self.hot[key] = self.db[key]
+            return value
+
+    def __setitem__(self, key, value):
+        self.db[key] = value
+        self.hot[key] = value
+
+    def __delitem__(self, key):
+        self.hot.pop(key, None)
+        del self.db[key]
+
+    def __iter__(self):
+        return iter(self.db.keys())
+
+    def __len__(self):
+        return len(self.db)
+
+    def preload(self):
+        # Generates loaded keys, to let caller pace the load.
+        for key in self.db.keys():
+            if key not in self.hot:
+                self.hot[key] = self.db[key]
+            yield key
+
+    def sync(self):
+        if hasattr(self.db, 'sync'):
+            self.db.sync()
+
+    def close(self):
+        self.hot.clear()
+        self.db.close()
+
+
 class FileCache(Cache):
     def __init__(self):
         self.opened = False
@@ -87,6 +153,7 @@ class FileCache(Cache):
             logger.warn("Dropping corrupted cache on %s", e)
             self.lock.truncate(0)
             self.storage = shelve.open(SETTINGS.CACHE_PATH, mode)
+        self.storage.dict = HotTier(self.storage.dict)
         self.opened = True
 
     def close(self):
@@ -106,6 +173,22 @@ class FileCache(Cache):
         self.open()
         return super(FileCache, self).get(*a, **kw)
 
+    def touch(self, key):
+        self.open()
+        return super(FileCache, self).touch(key)
+
+    def stats(self):
+        stats = super(FileCache, self).stats()
+        if self.opened:
+            stats['hot'] = len(self.storage.dict.hot)
+        return stats
+
+    def preload(self):
+        # Load cache file in memory, yielding each key.
+        self.open()
+        for key in self.storage.dict.preload():
+            yield key.decode(self.storage.keyencoding)
+
     def save(self):
         self.open()
         self.storage.sync()
@@ -512,26 +512,24 @@ class SkipExtension(Extension):
     @asyncio.coroutine
     def process_job_spec(self, spec):
         log_context(self.current.head)
-        job = self.current.jobs[spec.name]
-        for context in job.list_contexts(spec):
-            if match(context, self.current.jobs_match):
+        for entry in self.current.contexts.for_spec(spec):
+            if match(entry.name, self.current.jobs_match):
                 continue
 
-            status = self.current.statuses.get(context, CommitStatus())
+            status = entry.status
             if status.get('state') == 'success':
                 continue
 
-            if status.is_running:
+            if entry.is_running:
                 self.current.cancel_queue.append(
                     (self.current.last_commit, status)
                 )
 
-            logger.info("Skipping %s.", context)
-            new_status = CommitStatus(
-                context=context, target_url=job.baseurl,
+            logger.info("Skipping %s.", entry)
+            yield from entry.update_status(dict(
+                target_url=entry.job.baseurl,
                 state='success', description='Skipped!',
-            )
-            yield from self.current.last_commit.maybe_update_status(new_status)
+            ))
 
 
 class UnskipExtension(Extension):
@@ -544,20 +542,17 @@ class UnskipExtension(Extension):
     @asyncio.coroutine
     def process_job_spec(self, spec):
         log_context(self.current.head)
-        job = self.current.jobs[spec.name]
-        for context in job.list_contexts(spec):
-            if not match(context, self.current.jobs_match):
+        for entry in self.current.contexts.for_spec(spec):
+            if not match(entry.name, self.current.jobs_match):
                 continue
 
-            status = self.current.statuses.get(context, CommitStatus())
-            if not status.is_skipped:
+            if not entry.is_skipped:
                 continue
 
-            logger.info("Unskipping %s.", context)
-            new_status = CommitStatus(
-                status, state='pending', description='Backed',
-            )
-            yield from self.current.last_commit.maybe_update_status(new_status)
+            logger.info("Unskipping %s.", entry)
+            yield from entry.update_status(CommitStatus(
+                entry.status, state='pending', description='Backed',
+            ))
 
     @asyncio.coroutine
     def run(self):
@@ -607,10 +602,11 @@ class YamlExtension(Extension):
             deepupdate(self.current.yaml, args)
             self.current.yaml_date = instruction.date
 
-    def list_job_specs(self, jenkins_yml=None):
+    def list_job_specs(self, jenkins_yml=None, repository=None):
+        repository = repository or self.current.head.repository
         defaults = dict(
             node=SETTINGS.JOBS_NODE,
-            github_repository=self.current.head.repository.url,
+            github_repository=repository.url,
             scm_credentials=SETTINGS.JOBS_CREDENTIALS,
             set_commit_status=not SETTINGS.DRY_RUN,
         )
@@ -621,7 +617,7 @@ class YamlExtension(Extension):
             if not match(job.name, Job.jobs_filter):
                 logger.debug("Skipping %s. Filtered.", job)
                 continue
-            job.repository = self.current.head.repository
+            job.repository = repository
             jobs[job.name] = job
 
         return jobs
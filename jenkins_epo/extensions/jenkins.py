@@ -14,12 +14,15 @@
 
 import asyncio
 from collections import OrderedDict
+from copy import deepcopy
 import logging
 
 from aiohttp.errors import HttpProcessingError
 
 from ..bot import Extension, Error, SkipHead
-from ..jenkins import Build, JENKINS, NotOnJenkins, UnknownJob
+from ..jenkins import (
+    Build, DISPATCHER, JENKINS, NotOnJenkins, QUEUE_TRACKER, UnknownJob,
+)
 from ..repository import Commit, CommitStatus
 from ..utils import log_context, match
 
@@ -37,25 +40,21 @@ class BackedExtension(JenkinsExtension):
 
     @asyncio.coroutine
     def run(self):
-        missing_contextes = [
-            c
-            for spec in self.current.job_specs.values()
-            for c in self.current.jobs[spec.name].list_contexts(spec)
-            if c not in self.current.statuses
+        missing_entries = [
+            entry
+            for entry in self.current.contexts.for_specs(
+                self.current.job_specs.values()
+            )
+            if not entry.has_status
         ]
 
         loop = asyncio.get_event_loop()
         tasks = [
-            loop.create_task(
-                self.current.last_commit.maybe_update_status(
-                    dict(
-                        context=context,
-                        description='Backed',
-                        state='pending',
-                    )
-                )
-            )
-            for context in missing_contextes
+            loop.create_task(entry.update_status(dict(
+                description='Backed',
+                state='pending',
+            )))
+            for entry in missing_entries
         ]
         yield from asyncio.gather(*tasks)
 
@@ -77,27 +76,35 @@ class BuilderExtension(JenkinsExtension):
     @asyncio.coroutine
     def process_job_spec(self, spec):
         log_context(self.current.head)
-        update_status = self.current.last_commit.maybe_update_status
+        table = self.current.contexts
         logger.debug("Processing %s.", spec)
         job = self.current.jobs[spec.name]
-        not_built = self.current.last_commit.filter_not_built_contexts(
-            job.list_contexts(spec),
-            rebuild_failed=self.current.rebuild_failed
-        )
-        queue_empty = yield from JENKINS.is_queue_empty()
+        not_built = [
+            entry.name for entry in table.for_spec(spec)
+            if entry.needs_build(self.current.rebuild_failed)
+        ]
+        admitted = 0
+        if not_built:
+            admitted = yield from DISPATCHER.admit(
+                self.current.repository, spec, len(not_built),
+                url=job.baseurl,
+            )
         toqueue_contexts = []
-        for context in not_built:
+        for i, context in enumerate(not_built):
             logger.debug("Computing next state for %s.", context)
             new_status = self.status_for_new_context(
-                job, context, queue_empty,
+                job, context, i < admitted,
             )
-            yield from update_status(new_status)
-            if new_status.get('description') == 'Queued':
+            yield from table[context].update_status(new_status)
+            # Contexts already queued beyond admission wait for next round.
+            if i < admitted and new_status.get('description') == 'Queued':
                 toqueue_contexts.append(context)
 
-        if toqueue_contexts and queue_empty:
+        if toqueue_contexts and admitted:
             try:
-                yield from job.build(self.current.head, spec, toqueue_contexts)
+                queue_url = yield from job.build(
+                    self.current.head, spec, toqueue_contexts,
+                )
             except Exception as e:
                 if self.current.SETTINGS.DEBUG:
                     raise
@@ -108,9 +115,13 @@ class BuilderExtension(JenkinsExtension):
                         description='Failed to queue job.',
                         target_url=job.baseurl,
                     )
-                    yield from update_status(new_status)
+                    yield from table[context].update_status(new_status)
+            else:
+                QUEUE_TRACKER.track(
+                    queue_url, self.current.last_commit, toqueue_contexts,
+                )
 
-    def status_for_new_context(self, job, context, queue_empty):
+    def status_for_new_context(self, job, context, admitted):
         new_status = CommitStatus(target_url=job.baseurl, context=context)
         if not job.enabled:
             new_status.update({
@@ -118,9 +129,9 @@ class BuilderExtension(JenkinsExtension):
                 'state': 'success',
             })
         else:
-            current_status = self.current.statuses.get(context, {})
+            current_status = self.current.contexts[context].status
             already_queued = 'Queued' == current_status.get('description')
-            queued = queue_empty or already_queued
+            queued = admitted or already_queued
             new_status.update({
                 'description': 'Queued' if queued else 'Backed',
                 'state': 'pending',
@@ -186,6 +197,52 @@ class CancellerExtension(JenkinsExtension):
         yield from asyncio.gather(*tasks)
 
 
+class QueueCancellerExtension(JenkinsExtension):
+    stage = '49'
+
+    def is_superseded(self, item):
+        if item.head_url != self.current.head.url:
+            return False
+
+        job = self.current.jobs.get(item.job_name)
+        revision_param = getattr(job, 'revision_param', None)
+        if revision_param:
+            if item.params.get(revision_param) != self.current.head.fullref:
+                return False
+
+        sha = item.sha
+        tracked = QUEUE_TRACKER.items.get(item.key)
+        if not sha and tracked:
+            _, commit, _ = tracked
+            sha = commit.sha
+        # Without SHA, we can't tell whether item builds current commit.
+        return bool(sha) and sha != self.current.head.sha
+
+    @asyncio.coroutine
+    def run(self):
+        items = yield from JENKINS.fetch_queue()
+        superseded = [i for i in items if self.is_superseded(i)]
+        if not superseded:
+            return
+
+        slots = 0
+        for item in superseded:
+            if self.current.SETTINGS.DRY_RUN:
+                logger.warn("Would cancel queued %s.", item)
+                continue
+            logger.warn("Cancelling queued %s.", item)
+            yield from item.cancel()
+            # A matrix item runs one build per context.
+            tracked = QUEUE_TRACKER.items.get(item.key)
+            slots += len(tracked[2]) if tracked else 1
+
+        if slots:
+            logger.info(
+                "Cancelled %d queued builds. %d executor slots freed.",
+                len(superseded), slots,
+            )
+
+
 class CreateJobsExtension(JenkinsExtension):
     """
     jenkins: refresh-jobs  # Refresh job definition on Jenkins.
@@ -213,12 +270,18 @@ Failed to create or update Jenkins job `%(name)s`.
             self.current.refresh_jobs = instruction.date
 
     def process_job_specs(self):
+        reconciled = self.current.repository.job_configs
         for spec in self.current.job_specs.values():
             current_job = self.current.jobs.get(spec.name)
             if not current_job:
                 yield JENKINS.create_job, spec
                 continue
 
+            if reconciled.get(spec.name) == spec.config:
+                if not self.current.refresh_jobs:
+                    logger.debug("%s already reconciled.", spec)
+                    continue
+
             update = False
             if self.current.refresh_jobs:
                 update = (
@@ -239,7 +302,9 @@ Failed to create or update Jenkins job `%(name)s`.
         if name in self.current.jobs:
             return
         try:
-            self.current.jobs[name] = yield from JENKINS.aget_job(name)
+            self.current.jobs[name] = yield from JENKINS.aget_job(
+                name, self.current.repository,
+            )
         except UnknownJob:
             pass
 
@@ -279,6 +344,48 @@ Failed to create or update Jenkins job `%(name)s`.
         ]
         yield from asyncio.gather(*tasks)
 
+    @asyncio.coroutine
+    def reconcile(self, repository, specs):
+        # Syncs jobs defined in default branch, once per poll round, rather
+        # than in each head's pipeline. Only jobs in sync are recorded, heads
+        # retry and report the others.
+        configs = {
+            name: deepcopy(spec.config) for name, spec in specs.items()
+        }
+        reconciled = {}
+
+        for name in specs:
+            if name in repository.jobs:
+                continue
+            try:
+                repository.jobs[name] = yield from JENKINS.aget_job(
+                    name, repository,
+                )
+            except UnknownJob:
+                pass
+
+        actions = []
+        for spec in specs.values():
+            job = repository.jobs.get(spec.name)
+            if not job:
+                actions.append((spec.name, JENKINS.create_job, spec))
+            elif not job.spec.contains(spec):
+                actions.append((spec.name, job.update, job.spec.merge(spec)))
+            else:
+                reconciled[spec.name] = configs[spec.name]
+
+        for name, action, spec in actions:
+            try:
+                job = yield from action(spec)
+            except Exception as e:
+                logger.error("Failed to reconcile job %s: %s", spec, e)
+                continue
+            if job:
+                repository.jobs[job.name] = job
+                reconciled[name] = configs[name]
+
+        repository.job_configs = reconciled
+
     def process_error(self, spec, e):
         detail = (
             e.args[0]
@@ -384,23 +491,25 @@ class Stage(object):
     def __str__(self):
         return self.name
 
-    def is_complete(self, jobs, statuses):
+    def list_contexts(self, contexts):
+        for spec in self.job_specs:
+            try:
+                entries = contexts.for_spec(spec)
+            except KeyError:
+                continue
+            yield from entries
+
+    def is_complete(self, contexts, statuses):
         for context in self.external_contextes:
             state = statuses.get(context, {}).get('state')
             if state != 'success':
                 logger.debug("Missing context %s for stage %s.", context, self)
                 return False
 
-        for spec in self.job_specs:
-            try:
-                job = jobs[spec.name]
-            except KeyError:
-                continue
-            for context in job.list_contexts(spec):
-                state = statuses.get(context, {}).get('state')
-                if state != 'success':
-                    logger.debug("Missing job %s for stage %s.", spec, self)
-                    return False
+        for entry in self.list_contexts(contexts):
+            if entry.status.get('state') != 'success':
+                logger.debug("Missing job %s for stage %s.", entry.spec, self)
+                return False
         return True
 
 
@@ -425,12 +534,13 @@ class StagesExtension(JenkinsExtension):
                 continue
             stage = spec.config.get('stage', default_stage)
             stages[stage].job_specs.append(spec)
+            self.current.contexts.stages[spec.name] = stage
 
         stage = None
         # Search current stage to build.
         for stage in [s for s in stages.values() if bool(s)]:
             complete = stage.is_complete(
-                self.current.jobs, self.current.statuses
+                self.current.contexts, self.current.statuses
             )
             if not complete:
                 break
@@ -31,8 +31,11 @@ from github import (
 )
 
 from .cache import CACHE
+from .metrics import METRICS, GITHUB_REQUESTS
 from .settings import SETTINGS
-from .utils import parse_links, retry
+from .stats import REQUESTS
+from .tracing import span
+from .utils import deadline_timeout, parse_links, retry
 
 
 logger = logging.getLogger(__name__)
@@ -98,10 +101,12 @@ def cached_arequest(query, **kw):
 
     try:
         response = yield from query.aget(headers=headers, **kw)
+        GITHUB_REQUESTS.inc(cache='miss')
     except ApiError as e:
         if e.response['code'] != 304:
             raise
         else:
+            GITHUB_REQUESTS.inc(cache='hit')
             logger.debug(
                 "Cache up to date (remaining=%s)",
                 GITHUB.x_ratelimit_remaining,
@@ -180,11 +185,21 @@ class CustomGitHub(GitHub):
         session = aiohttp.ClientSession()
         session_method = getattr(session, _method.lower())
         try:
-            response = yield from session_method(
-                url, headers=headers, data=data, timeout=self.TIMEOUT,
-            )
-            self._process_resp(response.headers)
-            post_rate_limit = self.x_ratelimit_remaining
+            with REQUESTS.measure('github'), span(
+                    'http', service='github', method=_method, path=_path,
+            ) as trace:
+                response = yield from session_method(
+                    url, headers=headers, data=data,
+                    timeout=deadline_timeout(self.TIMEOUT),
+                )
+                self._process_resp(response.headers)
+                post_rate_limit = self.x_ratelimit_remaining
+                # 304 are free.
+                trace.attrs.update(
+                    status=response.status,
+                    cost=max(0, pre_rate_limit - post_rate_limit),
+                )
+            REQUESTS.github_remaining = post_rate_limit
             if 'json' in response.content_type:
                 payload = yield from response.json()
             else:
@@ -313,3 +328,7 @@ class LazyGithub(object):
 
 
 GITHUB = LazyGithub()
+METRICS.gauge(
+    'epo_github_rate_limit_remaining', "GitHub API calls remaining.",
+    lambda: REQUESTS.github_remaining,
+)
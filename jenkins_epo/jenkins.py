@@ -14,10 +14,14 @@
 
 
 import asyncio
+from collections import Counter, OrderedDict, defaultdict
 from datetime import datetime, timedelta
+import hashlib
 from itertools import product
 import logging
 import re
+import time
+from urllib.parse import unquote
 
 import aiohttp.errors
 from jenkinsapi.jenkinsbase import JenkinsBase
@@ -25,10 +29,13 @@ from jenkinsapi.jenkins import Jenkins, Requester
 from jenkinsapi.job import Job as JenkinsJob
 from jenkinsapi.custom_exceptions import UnknownJob
 from jenkins_yml import Job as JobSpec
+from yarl import URL
 import yaml
 
+from .cache import CACHE
+from .repository import CommitStatus
 from .settings import SETTINGS
-from .utils import format_duration, match, parse_patterns, retry
+from .utils import Bunch, format_duration, match, parse_patterns, retry
 from .web import fullurl
 from . import rest
 
@@ -57,24 +64,68 @@ JenkinsBase.__init__.__defaults__ = (False,)
 
 class LazyJenkins(object):
     queue_patterns = parse_patterns(SETTINGS.JENKINS_QUEUE)
+    queue_tree = (
+        "items[id,inQueueSince,task[name],actions[parameters[name,value]]]"
+    )
+
+    QUEUE_LIFE = 5
 
-    def __init__(self, instance=None):
+    def __init__(self, instance=None, url=None):
         self._instance = instance
+        self.url = url
         self.rest = None
+        # Serialize config changes per job, and remember last pushed
+        # fingerprint and job, to deduplicate updates from concurrent heads.
+        self.job_locks = defaultdict(asyncio.Lock)
+        self.updates = {}
+        self.queue_lock = asyncio.Lock()
+        self.queue = []
+        self.queue_listed_at = 0
 
     @retry
     def load(self):
         if not self._instance:
-            logger.debug("Connecting to Jenkins %s", SETTINGS.JENKINS_URL)
-            self.rest = rest.Client(SETTINGS.JENKINS_URL)
+            logger.debug("Connecting to Jenkins %s", self.url)
+            self.rest = rest.Client(self.url)
             self._instance = Jenkins(
-                baseurl=SETTINGS.JENKINS_URL,
-                requester=VerboseRequester(baseurl=SETTINGS.JENKINS_URL),
+                baseurl=self.url,
+                requester=VerboseRequester(baseurl=self.url),
                 lazy=True,
             )
 
+    @asyncio.coroutine
+    def fetch_queue(self):
+        # Heads processed within QUEUE_LIFE seconds share one listing.
+        with (yield from self.queue_lock):
+            if time.time() - self.queue_listed_at > self.QUEUE_LIFE:
+                self.load()
+                payload = yield from self.rest.queue.api.python.aget(
+                    tree=self.queue_tree,
+                )
+                self.queue = [
+                    QueueItem(i, master=self) for i in payload['items']
+                ]
+                self.queue_listed_at = time.time()
+        return self.queue
+
+    @asyncio.coroutine
+    def fetch_load(self):
+        # Queued items not covered by an idle executor. Lower is better.
+        self.load()
+        queue = yield from self.rest.queue.api.python.aget(tree='items[id]')
+        payload = yield from self.rest.computer.api.python.aget(
+            tree='computer[offline,executors[idle]]',
+        )
+        idle = sum(
+            len([e for e in computer['executors'] if e['idle']])
+            for computer in payload['computer']
+            if not computer.get('offline')
+        )
+        return len(queue['items']) - idle
+
     @asyncio.coroutine
     def is_queue_empty(self):
+        self.load()
         payload = yield from self.rest.queue.api.python.aget()
         items = [
             i for i in payload['items']
@@ -91,6 +142,8 @@ class LazyJenkins(object):
             data = yield from url.api.python.aget()
         except aiohttp.errors.HttpProcessingError as e:
             if 404 == e.code:
+                # Job deleted on Jenkins, forget last update.
+                self.updates.pop(name, None)
                 raise UnknownJob()
             raise
 
@@ -109,13 +162,21 @@ class LazyJenkins(object):
 """
 
     def preprocess_spec(self, spec):
-        embedded_data = dict(updated_at=datetime.utcnow())
+        spec.config['description'] = re.sub(
+            r"\s*(<!--\nepo:.*-->)", "",
+            spec.config.get('description', ''),
+            flags=re.S,
+        )
+        # Fingerprint config without embedded data, which changes on each
+        # update.
+        spec.fingerprint = hashlib.sha1(
+            spec.as_xml().encode('utf-8')
+        ).hexdigest()
+        embedded_data = dict(
+            fingerprint=spec.fingerprint, updated_at=datetime.utcnow(),
+        )
         spec.config['description'] = self.DESCRIPTION_TMPL % dict(
-            description=re.sub(
-                r"\s*(<!--\nepo:.*-->)", "",
-                spec.config.get('description', ''),
-                flags=re.S,
-            ),
+            description=spec.config['description'],
             embedded_data=yaml.dump(dict(epo=embedded_data)).strip(),
         )
         return spec
@@ -128,16 +189,231 @@ class LazyJenkins(object):
             logger.warn("Would create new Jenkins job %s.", job_spec)
             return None
 
-        yield from self.rest.createItem.apost(
-            name=job_spec.name, data=config,
-            headers={'Content-Type': 'text/xml'},
+        with (yield from self.job_locks[job_spec.name]):
+            fingerprint, job = self.updates.get(job_spec.name, (None, None))
+            if not job:
+                yield from self.rest.createItem.apost(
+                    name=job_spec.name, data=config,
+                    headers={'Content-Type': 'text/xml'},
+                )
+                job = yield from self.aget_job(job_spec.name)
+                self.updates[job_spec.name] = job_spec.fingerprint, job
+                logger.warn("Created new Jenkins job %s.", job_spec.name)
+                return job
+
+        if fingerprint == job_spec.fingerprint:
+            logger.debug("Jenkins job %s already created.", job_spec)
+            return job
+
+        # A concurrent head created the job from another spec.
+        job = yield from job.update(job_spec)
+        return job
+
+
+class JenkinsMasters(object):
+    # Routes Jenkins API to one LazyJenkins per master, by URL or by
+    # repository. Other attributes are those of the default master, so a
+    # single master setup behaves like a plain LazyJenkins.
+
+    def __init__(self):
+        self.masters_setting = None
+        self.masters = OrderedDict()
+        # Repositories are sticky to their master, where their jobs are.
+        self.placements = {}
+
+    def __getattr__(self, name):
+        return getattr(self.default, name)
+
+    def __iter__(self):
+        self.setup()
+        return iter(self.masters.values())
+
+    @staticmethod
+    def parse_urls(raw):
+        return [
+            u.rstrip('/') + '/'
+            for u in raw.replace(' ', ',').split(',') if u
+        ]
+
+    def setup(self):
+        if self.masters_setting == SETTINGS.JENKINS_URL:
+            return
+        self.masters_setting = SETTINGS.JENKINS_URL
+        self.masters = OrderedDict(
+            (url, LazyJenkins(url=url))
+            for url in self.parse_urls(SETTINGS.JENKINS_URL) or ['']
+        )
+        self.placements = {}
+
+    @property
+    def default(self):
+        self.setup()
+        return next(iter(self.masters.values()))
+
+    def for_url(self, url):
+        self.setup()
+        url = str(url)
+        # Without JENKINS_URL, the default master accepts any URL.
+        candidates = [m for m in self.masters if url.startswith(m)]
+        if not candidates:
+            # Accept URL without trailing slash for master root.
+            candidates = [m for m in self.masters if m and m == url + '/']
+        if not candidates:
+            return None
+        return self.masters[max(candidates, key=len)]
+
+    def match_rule(self, qualname):
+        for rule in parse_patterns(SETTINGS.JENKINS_RULES.replace(' ', ',')):
+            pattern, _, url = rule.partition('=')
+            url = url.rstrip('/') + '/'
+            if url in self.masters and match(qualname, [pattern]):
+                return url
+
+    @asyncio.coroutine
+    def least_loaded(self):
+        loop = asyncio.get_event_loop()
+        tasks = [
+            loop.create_task(master.fetch_load()) for master in self
+        ]
+        loads = yield from asyncio.gather(*tasks, return_exceptions=True)
+        candidates = []
+        for master, load in zip(self.masters, loads):
+            if isinstance(load, Exception):
+                logger.warn("Failed to get load of %s: %s", master, load)
+                continue
+            candidates.append((load, master))
+        if not candidates:
+            return self.default.url
+        return min(candidates)[1]
+
+    @asyncio.coroutine
+    def for_repository(self, repository):
+        self.setup()
+        if len(self.masters) < 2 or repository is None:
+            return self.default
+
+        qualname = str(repository)
+        cache_key = 'jenkins_master_' + qualname
+        url = self.placements.get(qualname) or self.match_rule(qualname)
+        if not url:
+            try:
+                url = CACHE.get(cache_key)
+            except (KeyError, TypeError, ValueError):
+                url = None
+        if url not in self.masters:
+            url = yield from self.least_loaded()
+            logger.info("Placing %s on Jenkins %s.", qualname, url)
+        if self.placements.get(qualname) == url:
+            CACHE.touch(cache_key)
+        else:
+            CACHE.set(cache_key, url)
+        self.placements[qualname] = url
+        return self.masters[url]
+
+    @asyncio.coroutine
+    def for_job(self, name, repository=None):
+        # Master hosting job name: repository placement, else the first
+        # master having this job.
+        self.setup()
+        if len(self.masters) < 2:
+            return self.default
+        if repository:
+            return (yield from self.for_repository(repository))
+        for master in self:
+            if name in master.updates:
+                return master
+
+        loop = asyncio.get_event_loop()
+        tasks = []
+        for master in self:
+            master.load()
+            tasks.append(loop.create_task(
+                master.rest.job(name).api.python.aget(tree='name')
+            ))
+        results = yield from asyncio.gather(*tasks, return_exceptions=True)
+        for master, result in zip(self, results):
+            if not isinstance(result, Exception):
+                return master
+        return self.default
+
+    @asyncio.coroutine
+    def aget_job(self, name, repository=None):
+        master = yield from self.for_repository(repository)
+        job = yield from master.aget_job(name)
+        return job
+
+    @asyncio.coroutine
+    def create_job(self, job_spec):
+        master = yield from self.for_repository(
+            getattr(job_spec, 'repository', None),
         )
-        job = yield from self.aget_job(job_spec.name)
-        logger.warn("Created new Jenkins job %s.", job_spec.name)
+        job = yield from master.create_job(job_spec)
         return job
 
+    @asyncio.coroutine
+    def fetch_queue(self):
+        loop = asyncio.get_event_loop()
+        tasks = [loop.create_task(master.fetch_queue()) for master in self]
+        queues = yield from asyncio.gather(*tasks)
+        return [item for queue in queues for item in queue]
+
+    @asyncio.coroutine
+    def is_queue_empty(self, url=None):
+        master = self.for_url(url) if url else self.default
+        empty = yield from (master or self.default).is_queue_empty()
+        return empty
+
+
+JENKINS = JenkinsMasters()
+
 
-JENKINS = LazyJenkins()
+class QueueItem(object):
+    def __init__(self, payload, master=None):
+        self.payload = payload
+        self.master = master
+        self.params = Build.process_params(Build.process_actions(payload))
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.id)
+
+    def __str__(self):
+        return '%s #%s' % (self.payload['task']['name'], self.id)
+
+    @property
+    def id(self):
+        return self.payload['id']
+
+    @property
+    def job_name(self):
+        return self.payload['task']['name']
+
+    @property
+    def queued_at(self):
+        return datetime.utcfromtimestamp(self.payload['inQueueSince'] / 1000.)
+
+    @property
+    def head_url(self):
+        return Build.process_head_url(self.params)
+
+    @property
+    def sha(self):
+        # Commit to build, passed by EPO on queuing. None for items queued by
+        # others or by older EPO.
+        return self.params.get('YML_SHA')
+
+    @property
+    def key(self):
+        return (self.master.url if self.master else None), self.id
+
+    @asyncio.coroutine
+    def cancel(self):
+        master = self.master or JENKINS
+        try:
+            yield from master.rest.queue.cancelItem.apost(id=self.id)
+        except aiohttp.errors.HttpProcessingError as e:
+            # Jenkins answers 404 even on success. See JENKINS-21311.
+            if 404 != e.code:
+                raise
 
 
 class Build(object):
@@ -165,6 +441,15 @@ class Build(object):
             if 'value' in p
         }
 
+    @staticmethod
+    def process_head_url(params):
+        # EPO always tells Jenkins which head to notify at the end of the
+        # build.
+        notify_url = params.get('YML_NOTIFY_URL')
+        if not notify_url:
+            return None
+        return URL(notify_url).query.get('head')
+
     jenkins_tree = (
         "actions[" + (
             "parameters[name,value],"
@@ -176,16 +461,34 @@ class Build(object):
 
     @classmethod
     @asyncio.coroutine
-    def from_url(cls, url):
-        if not url.startswith(SETTINGS.JENKINS_URL):
-            raise NotOnJenkins("%s is not on this Jenkins." % url)
+    def from_url(cls, url, fresh=False):
+        # fresh skips cache of running build, e.g. on completion webhook.
+        if not JENKINS.for_url(url):
+            raise NotOnJenkins("%s is not on managed Jenkins." % url)
 
         if url.endswith("/display/redirect"):
             url = url.replace("/display/redirect", "")
 
+        cache_key = 'jenkins_build_' + url.rstrip('/')
+        try:
+            fetched_at, payload = CACHE.get(cache_key)
+        except (KeyError, TypeError, ValueError):
+            pass
+        else:
+            # A finished build never changes. Running build is cached only
+            # a few seconds.
+            finished = payload.get('result') is not None
+            age = time.time() - fetched_at
+            if finished or (not fresh and age < SETTINGS.BUILD_CACHE_LIFE):
+                CACHE.touch(cache_key)
+                return Build(None, payload)
+
         payload = yield from rest.Client(url).api.python.aget(
             tree=cls.jenkins_tree,
         )
+        # Drop HTTP metadata, cache only the data.
+        payload = dict(payload)
+        CACHE.set(cache_key, (time.time(), payload))
         return Build(None, payload)
 
     def __getattr__(self, name):
@@ -238,6 +541,26 @@ class Build(object):
     def is_running(self):
         return self.payload['building']
 
+    _url_re = re.compile(
+        r'/job/(?P<job>[^/]+)/(?:(?P<combination>[^/]+=[^/]*)/)?\d+/?$'
+    )
+
+    @property
+    def context(self):
+        match = self._url_re.search(self.payload['url'])
+        if not match:
+            raise Exception("Can't infer context from %s." % (
+                self.payload['url'],
+            ))
+        context = match.group('job')
+        if match.group('combination'):
+            context += '/' + match.group('combination')
+        return unquote(context)
+
+    @property
+    def head_url(self):
+        return self.process_head_url(self.params)
+
     _ref_re = re.compile(r'.*origin/(?P<ref>.*)')
 
     @property
@@ -310,6 +633,10 @@ class Job(object):
     def __getattr__(self, name):
         return getattr(self._instance, name)
 
+    @property
+    def master(self):
+        return JENKINS.for_url(self.baseurl) or JENKINS
+
     @property
     def enabled(self):
         return not self._instance._data.get('color', '').startswith('disabled')
@@ -351,6 +678,10 @@ class Job(object):
     def updated_at(self):
         return self.embedded_data.get('updated_at')
 
+    @property
+    def fingerprint(self):
+        return self.embedded_data.get('fingerprint')
+
     @property
     def node_param(self):
         if not hasattr(self, '_node_param'):
@@ -381,16 +712,33 @@ class Job(object):
 
     @asyncio.coroutine
     def update(self, job_spec):
-        job_spec = JENKINS.preprocess_spec(job_spec)
+        master = self.master
+        job_spec = master.preprocess_spec(job_spec)
         config = job_spec.as_xml()
-        if SETTINGS.DRY_RUN:
-            logger.warn("Would update Jenkins job %s.", job_spec)
-            return self
+        with (yield from master.job_locks[job_spec.name]):
+            # Another head may have pushed the same config meanwhile.
+            fingerprint, job = master.updates.get(
+                job_spec.name, (self.fingerprint, self),
+            )
+            if fingerprint == job_spec.fingerprint:
+                logger.debug("Jenkins job %s is up to date.", job_spec)
+                return job
 
-        yield from JENKINS.rest.job(job_spec.name)('config.xml').apost(
-            headers={'Content-Type': 'text/xml'}, data=config,
-        )
-        job = yield from JENKINS.aget_job(job_spec.name)
+            if SETTINGS.DRY_RUN:
+                logger.warn("Would update Jenkins job %s.", job_spec)
+                return self
+
+            try:
+                yield from master.rest.job(job_spec.name)('config.xml').apost(
+                    headers={'Content-Type': 'text/xml'}, data=config,
+                )
+            except aiohttp.errors.HttpProcessingError as e:
+                if 404 == e.code:
+                    master.updates.pop(job_spec.name, None)
+                    raise UnknownJob()
+                raise
+            job = yield from master.aget_job(job_spec.name)
+            master.updates[job_spec.name] = job_spec.fingerprint, job
         logger.warn("Updated Jenkins job %s.", job_spec.name)
         return job
 
@@ -417,15 +765,67 @@ class FreestyleJob(Job):
                 )
 
         params['YML_NOTIFY_URL'] = fullurl(head=head.url)
+        params['YML_SHA'] = head.sha
         params['delay'] = 0
         params['cause'] = 'EPO'
 
         if SETTINGS.DRY_RUN:
             return logger.info("Would queue %s.", log)
 
-        url = JENKINS.rest.job(self.name).buildWithParameters
-        yield from url.apost(**params)
+        url = self.master.rest.job(self.name).buildWithParameters
+        payload = yield from url.apost(**params)
         logger.info("Queued new build %s", log)
+        return payload.headers.get('Location')
+
+
+def combination_filter(names):
+    # Returns a Groovy expression matching exactly the combinations named like
+    # `A=x,B=y`. Axis values leading to the same sub-combinations are merged,
+    # so a full product is filtered with one disjunction per axis instead of
+    # one clause per combination.
+    combinations = sorted(
+        tuple(tuple(axis.split('=', 1)) for axis in name.split(','))
+        for name in set(names) if name
+    )
+    expression, _ = _factorize_combinations(combinations)
+    return expression
+
+
+def _factorize_combinations(combinations):
+    # Returns the expression and whether it is a top level disjunction.
+    if not combinations or not combinations[0]:
+        return None, False
+
+    axis = combinations[0][0][0]
+    remainders = OrderedDict()
+    for (_, value), *remainder in combinations:
+        remainders.setdefault(value, []).append(tuple(remainder))
+
+    groups = OrderedDict()
+    for value, remainder in remainders.items():
+        groups.setdefault(tuple(remainder), []).append(value)
+
+    terms = []
+    for remainder, values in groups.items():
+        condition = ' || '.join('%s == "%s"' % (axis, v) for v in values)
+        sub, sub_disjunction = _factorize_combinations(list(remainder))
+        if sub is None:
+            terms.append((condition, len(values) > 1))
+            continue
+
+        if len(values) > 1:
+            condition = '(%s)' % condition
+        if sub_disjunction:
+            sub = '(%s)' % sub
+        terms.append(('%s && %s' % (condition, sub), False))
+
+    if len(terms) == 1:
+        return terms[0]
+
+    return ' || '.join(
+        term if disjunction else '(%s)' % term
+        for term, disjunction in terms
+    ), True
 
 
 class MatrixJob(Job):
@@ -459,7 +859,38 @@ class MatrixJob(Job):
 
         return self._node_axis
 
+    @property
+    def active_combinations(self):
+        if not hasattr(self, '_active_combinations'):
+            self._active_combinations = frozenset(
+                c['name']
+                for c in self._instance._data['activeConfigurations']
+            )
+        return self._active_combinations
+
     def list_contexts(self, spec):
+        # Contexts are requested by several extensions for each head. Jobs are
+        # replaced on update, so memoizing on the job instance is safe.
+        if not hasattr(self, '_contexts'):
+            self._contexts = {}
+        key = self.contexts_key(spec)
+        if key not in self._contexts:
+            self._contexts[key] = tuple(self.compute_contexts(spec))
+        return self._contexts[key]
+
+    @staticmethod
+    def contexts_key(spec):
+        return (
+            str(spec),
+            spec.config.get('node'),
+            tuple(sorted(spec.config.get('merged_nodes', []))),
+            tuple(sorted(
+                (name, tuple(sorted(map(str, values))))
+                for name, values in spec.config['axis'].items()
+            )),
+        )
+
+    def compute_contexts(self, spec):
         axis = []
         if self.node_axis:
             if 'node' in spec.config:
@@ -480,13 +911,9 @@ class MatrixJob(Job):
                 continue
             axis.append(['%s=%s' % (name, values[0])])
 
-        combinations = [','.join(sorted(a)) for a in product(*axis)]
-        active_combinations = [
-            c['name']
-            for c in self._instance._data['activeConfigurations']
-        ]
-
-        for name in combinations:
+        active_combinations = self.active_combinations
+        for combination in product(*axis):
+            name = ','.join(sorted(combination))
             if name not in active_combinations:
                 logger.debug("%s not active in Jenkins. Skipping.", name)
                 continue
@@ -497,6 +924,7 @@ class MatrixJob(Job):
     def build(self, pr, spec, contexts):
         build_params = {
             'YML_NOTIFY_URL': fullurl(head=pr.url),
+            'YML_SHA': pr.sha,
             'cause': 'EPO',
             'delay': 0,
         }
@@ -509,29 +937,273 @@ class MatrixJob(Job):
 
         if self.combination_param:
             conf_index = len(str(self))+1
-            conditions = []
             not_built = [c[conf_index:] for c in contexts]
-            for name in not_built:
-                condition = (
-                    name
-                    .replace('=', ' == "')
-                    .replace(',', '" && ')
-                    + '"'
-                )
-                conditions.append('(%s)' % condition)
-
-            build_params[self.combination_param] = ' || '.join(conditions)
+            build_params[self.combination_param] = combination_filter(
+                not_built
+            )
 
         if SETTINGS.DRY_RUN:
             for context in contexts:
                 logger.info("Would trigger %s for %s", context, pr.ref)
             return
 
-        url = JENKINS.rest.job(self.name).buildWithParameters
-        yield from url.apost(**build_params)
+        url = self.master.rest.job(self.name).buildWithParameters
+        payload = yield from url.apost(**build_params)
 
         for context in contexts:
             log = '%s/%s' % (self, context)
             if self.revision_param:
                 log += ' for %s' % pr.ref
             logger.info("Triggered new build %s", log)
+        return payload.headers.get('Location')
+
+
+class QueueTracker(object):
+    # Follows queue items returned by buildWithParameters until Jenkins starts
+    # or drops them. All items are checked at once with a single queue
+    # listing. Only items gone from the queue are queried one by one.
+
+    INTERVAL = 5
+
+    _item_re = re.compile(r'/queue/item/(?P<id>\d+)/?$')
+
+    def __init__(self):
+        self.items = {}
+        self.stuck = set()
+
+    def track(self, url, commit, contexts):
+        if not url:
+            return
+        match = self._item_re.search(url)
+        if not match:
+            return logger.debug("%s is not a queue item.", url)
+        logger.debug("Tracking queue item %s.", url)
+        # Items are identified by master and id.
+        master = JENKINS.for_url(url)
+        base = master.url if master else url[:match.start()] + '/'
+        key = base, int(match.group('id'))
+        self.items[key] = (url, commit, list(contexts))
+
+    @asyncio.coroutine
+    def run(self):
+        asyncio.Task.current_task().logging_id = 'queu'
+        while True:
+            yield from asyncio.sleep(self.INTERVAL)
+            if not self.items:
+                continue
+            try:
+                yield from self.poll()
+            except Exception as e:
+                logger.error("Failed to track Jenkins queue: %s", e)
+
+    @asyncio.coroutine
+    def poll(self):
+        loop = asyncio.get_event_loop()
+        masters = sorted({master for master, _ in self.items})
+        tasks = [loop.create_task(self.poll_master(m)) for m in masters]
+        yield from asyncio.gather(*tasks)
+
+    @asyncio.coroutine
+    def poll_master(self, master):
+        payload = yield from rest.Client(master).queue.api.python.aget(
+            tree='items[id,stuck,why]',
+        )
+        queued = {i['id']: i for i in payload['items']}
+
+        left = []
+        for key in [k for k in self.items if k[0] == master]:
+            _, id_ = key
+            item = queued.get(id_)
+            if not item:
+                left.append(key)
+            elif item.get('stuck') and key not in self.stuck:
+                self.stuck.add(key)
+                logger.warn(
+                    "Queue item %s is stuck: %s", id_, item.get('why'),
+                )
+
+        loop = asyncio.get_event_loop()
+        tasks = [loop.create_task(self.process_item(key)) for key in left]
+        yield from asyncio.gather(*tasks)
+
+    @staticmethod
+    def target_url(executable, context):
+        # Matrix configuration builds share the number of their parent build.
+        _, _, combination = context.partition('/')
+        if not combination:
+            return executable['url']
+        base, number = executable['url'].rstrip('/').rsplit('/', 1)
+        return '%s/%s/%s/' % (base, combination, number)
+
+    @asyncio.coroutine
+    def process_item(self, key):
+        url, commit, contexts = self.items[key]
+        _, id_ = key
+        try:
+            payload = yield from rest.Client(url).api.python.aget()
+        except aiohttp.errors.HttpProcessingError as e:
+            if 404 != e.code:
+                raise
+            # Jenkins forgets items a few minutes after they left the queue.
+            logger.debug("Queue item %s is gone.", id_)
+            payload = {}
+
+        executable = payload.get('executable')
+        if executable:
+            logger.info("Queue item %s started %s.", id_, executable['url'])
+            statuses = [
+                CommitStatus(
+                    context=context, state='pending',
+                    target_url=self.target_url(executable, context),
+                    description='Build #%s in progress...' % (
+                        executable['number'],
+                    ),
+                )
+                for context in contexts
+            ]
+        elif payload.get('cancelled'):
+            logger.warn("Queue item %s cancelled.", id_)
+            statuses = [
+                CommitStatus(
+                    context=context, state='error',
+                    description='Cancelled in queue.',
+                )
+                for context in contexts
+            ]
+        elif payload:
+            # Item is between queue and executor. Wait next poll.
+            return
+        else:
+            statuses = []
+
+        del self.items[key]
+        self.stuck.discard(key)
+        for status in statuses:
+            yield from commit.maybe_update_status(status)
+
+
+QUEUE_TRACKER = QueueTracker()
+
+
+class Dispatcher(object):
+    # Admits builds per master and label, from idle executors on Jenkins.
+    # Jenkins nodes and queue are listed at most once per interval. Queued
+    # builds of known jobs, and builds admitted since listing, consume the
+    # capacity of their label. Builds on unknown labels are admitted while
+    # the whole queue is under QUEUE_MAX.
+
+    INTERVAL = 10
+
+    jenkins_tree = (
+        "computer[offline,assignedLabels[name],executors[idle]]"
+    )
+    queue_tree = "items[stuck,task[name]]"
+
+    def __init__(self):
+        self.masters = {}
+        # Repository and label of job names, learnt on admission.
+        self.jobs = {}
+
+    def state(self, master):
+        return self.masters.setdefault(master.url, Bunch(
+            refreshed_at=0, capacity=Counter(), usage=Counter(), queued=0,
+        ))
+
+    @asyncio.coroutine
+    def refresh(self, master):
+        master.load()
+        payload = yield from master.rest.computer.api.python.aget(
+            tree=self.jenkins_tree,
+        )
+        queue = yield from master.rest.queue.api.python.aget(
+            tree=self.queue_tree,
+        )
+        state = self.state(master)
+        state.capacity = self.process_computers(payload['computer'])
+        state.usage, state.queued = self.process_queue(queue['items'])
+        state.refreshed_at = time.time()
+
+    def process_queue(self, items):
+        # Returns usage per label and per repository and label, and count of
+        # items queued, like is_queue_empty().
+        usage = Counter()
+        queued = 0
+        for item in items:
+            if item.get('stuck'):
+                continue
+            name = item['task']['name']
+            if match(name, LazyJenkins.queue_patterns):
+                queued += 1
+            if name in self.jobs:
+                repository, label = self.jobs[name]
+                usage[label] += 1
+                usage[(repository, label)] += 1
+        return usage, queued
+
+    @staticmethod
+    def process_computers(computers):
+        capacity = Counter()
+        for computer in computers:
+            if computer.get('offline'):
+                continue
+            idle = len([e for e in computer['executors'] if e['idle']])
+            # None label means any executor.
+            capacity[None] += idle
+            labels = {label['name'] for label in computer['assignedLabels']}
+            for label in labels:
+                capacity[label] += idle
+
+        logger.debug("Idle executors: %s.", dict(capacity))
+        return capacity
+
+    @staticmethod
+    def label(spec):
+        if spec.config.get('node'):
+            return spec.config['node']
+        nodes = spec.config.get('merged_nodes')
+        return sorted(nodes)[0] if nodes else None
+
+    @asyncio.coroutine
+    def admit(self, repository, spec, count, url=None):
+        master = (JENKINS.for_url(url) if url else None) or JENKINS
+        state = self.state(master)
+        label = self.label(spec)
+        self.jobs[spec.name] = repository, label
+        if time.time() - state.refreshed_at > self.INTERVAL:
+            try:
+                yield from self.refresh(master)
+            except aiohttp.errors.HttpProcessingError as e:
+                logger.warn("Failed to list Jenkins nodes: %s", e)
+                return count
+
+        if label not in state.capacity:
+            # Label expression or unknown label. Let Jenkins manage, up to
+            # QUEUE_MAX.
+            logger.debug("Unknown label %s for %s.", label, spec)
+            admitted = count if state.queued <= SETTINGS.QUEUE_MAX else 0
+            state.queued += admitted
+            return admitted
+
+        available = (
+            state.capacity[label] + SETTINGS.LABEL_QUEUE_MAX -
+            state.usage[label]
+        )
+        if SETTINGS.REPOSITORY_QUOTA:
+            available = min(
+                available,
+                SETTINGS.REPOSITORY_QUOTA - state.usage[(repository, label)],
+            )
+
+        admitted = max(0, min(count, available))
+        state.queued += admitted
+        state.usage[label] += admitted
+        state.usage[(repository, label)] += admitted
+        if admitted < count:
+            logger.info(
+                "Admitted %d/%d builds of %s on %s.",
+                admitted, count, spec, label,
+            )
+        return admitted
+
+
+DISPATCHER = Dispatcher()
@@ -0,0 +1,145 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file implements an append-only journal of queued tasks, replayed on
+# restart.
+
+from collections import OrderedDict
+import importlib
+import json
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def resolve(path):
+    # Returns object from module:qualname path.
+    module, _, qualname = path.partition(':')
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def qualify(obj):
+    # Returns module:qualname path of obj, or None if it can't be resolved
+    # back.
+    path = '%s:%s' % (
+        getattr(obj, '__module__', None), getattr(obj, '__qualname__', None),
+    )
+    try:
+        if resolve(path) is obj:
+            return path
+    except Exception:
+        pass
+    return None
+
+
+class Journal(object):
+    # Each line is a JSON record. put records hold what's needed to rebuild
+    # the task, done records drop it. The journal is rewritten with only
+    # pending records once done records dominate.
+
+    def __init__(self, path, compact_threshold=1024):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self.file = None
+        self.pending = OrderedDict()
+        self.next_id = 0
+        self.lines = 0
+
+    def open(self):
+        # Load pending tasks and start a fresh journal. Returns tasks to
+        # requeue.
+        self.read()
+        tasks = []
+        for id_, record in list(self.pending.items()):
+            try:
+                task = resolve(record['task']).from_journal(record)
+            except Exception as e:
+                logger.warn("Dropping journal record %s: %s", record, e)
+                del self.pending[id_]
+                continue
+            task.journal_id = id_
+            tasks.append(task)
+        self.compact()
+        return tasks
+
+    def read(self):
+        try:
+            fo = open(self.path)
+        except FileNotFoundError:
+            return
+
+        with fo:
+            for line in fo:
+                try:
+                    record = json.loads(line)
+                    id_ = record['id']
+                except (KeyError, TypeError, ValueError):
+                    # Likely the last line, truncated by a crash.
+                    logger.warn("Skipping corrupted journal line %r.", line)
+                    continue
+
+                self.next_id = max(self.next_id, id_ + 1)
+                if record.get('op') == 'done':
+                    self.pending.pop(id_, None)
+                else:
+                    self.pending[id_] = record
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.lines += 1
+
+    def put(self, item):
+        record = item.as_journal()
+        if record is None:
+            return
+
+        if item.journal_id is None:
+            item.journal_id = self.next_id
+            self.next_id += 1
+        record.update(op='put', id=item.journal_id)
+        self.pending[item.journal_id] = record
+        self.write(record)
+
+    def done(self, item):
+        if self.pending.pop(item.journal_id, None) is None:
+            return
+
+        self.write(dict(op='done', id=item.journal_id))
+        if self.lines > max(self.compact_threshold, 2 * len(self.pending)):
+            self.compact()
+
+    def compact(self):
+        self.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fo:
+            for record in self.pending.values():
+                fo.write(json.dumps(record) + '\n')
+            fo.flush()
+            os.fsync(fo.fileno())
+        # Atomic, a crash leaves either the old or the new journal.
+        os.replace(tmp, self.path)
+        self.lines = len(self.pending)
+        self.file = open(self.path, 'a')
+        logger.debug("Compacted %s.", self.path)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
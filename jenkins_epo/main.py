@@ -24,8 +24,12 @@ import sys
 from aiohttp.web import run_app
 
 from .bot import Bot
+from .jenkins import QUEUE_TRACKER
 from . import procedures
 from .settings import SETTINGS
+from .shards import SHARDS
+from . import tracing
+from .watchdog import WATCHDOG
 from .web import app as webapp, register_webhook
 from .workers import WORKERS
 
@@ -41,12 +45,27 @@ def command(callable_):
 
 
 @command
-def bot():
+def bot(processes=1):
     """Poll GitHub to build heads"""
     loop = asyncio.get_event_loop()
-    loop.create_task(WORKERS.start())
-    if SETTINGS.POLL_INTERVAL:
-        loop.create_task(procedures.poll())
+    processes = int(processes)
+    if processes > 1:
+        # Serve webhooks and route them to worker processes.
+        SHARDS.setup_ring(processes)
+        for index in range(processes):
+            loop.create_task(SHARDS.supervise(index))
+        webapp.on_shutdown.append(SHARDS.shutdown)
+    else:
+        loop.create_task(WORKERS.start(replay=True))
+        if SETTINGS.JENKINS_URL:
+            loop.create_task(QUEUE_TRACKER.run())
+        if SETTINGS.POLL_INTERVAL:
+            loop.create_task(procedures.poll())
+
+    # Both frontend and worker processes, started as bot without
+    # --processes, watch their loop.
+    if float(SETTINGS.LOOP_LAG_THRESHOLD):
+        loop.create_task(WATCHDOG.run())
 
     run_app(
         webapp,
@@ -106,6 +125,35 @@ def register():
         sys.exit(1)
 
 
+@command
+def trace_summary(path=None):
+    """Summarize spans traced in TRACE_PATH"""
+    path = path or SETTINGS.TRACE_PATH
+    if not path:
+        logger.error("Use TRACE_PATH or --path to locate trace file.")
+        sys.exit(1)
+
+    summary = tracing.summarize(tracing.read(path))
+    print("%d tasks, %d heads in %.0fs: %.1f heads/min." % (
+        summary['tasks'], summary['heads'], summary['elapsed'],
+        summary['throughput'],
+    ))
+    print("%d HTTP requests, %d not modified, %d GitHub calls spent." % (
+        summary['requests'], summary['cached'], summary['cost'],
+    ))
+    print()
+    print("%-40s %6s %10s %10s" % ('Extension', 'Count', 'Total', 'Mean'))
+    for name, stats in summary['extensions']:
+        print("%-40s %6d %9.1fs %8.0fms" % (
+            name, stats['count'], stats['total'],
+            stats['total'] / stats['count'] * 1000,
+        ))
+    print()
+    print("Slowest heads:")
+    for span in summary['slowest']:
+        print("%8.1fs %s" % (span['duration'], span['url']))
+
+
 def resolve(func):
     while hasattr(func, '__wrapped__'):
         func = func.__wrapped__
@@ -118,13 +166,23 @@ def add_command_parser(subparsers, command):
         help=inspect.cleandoc(command.__doc__ or '').split('\n')[0],
     )
     parser.set_defaults(command_func=command)
-    code = resolve(command).__code__
+    func = resolve(command)
+    code = func.__code__
     argnames = code.co_varnames[:code.co_argcount]
-    for var in argnames:
+    defaults = getattr(func, '__defaults__', None) or ()
+    positionals = argnames[:len(argnames) - len(defaults)]
+    for var in positionals:
         logger.debug("Add %s argument", var.upper())
         parser.add_argument(
             var, metavar=var.upper(), type=str,
         )
+    for var, default in zip(argnames[len(positionals):], defaults):
+        logger.debug("Add --%s option", var)
+        parser.add_argument(
+            '--' + var.replace('_', '-'), dest=var, metavar=var.upper(),
+            # None default means an optional string.
+            type=str if default is None else type(default), default=default,
+        )
 
 
 def main(argv=None, *, loop=None):
@@ -0,0 +1,235 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file implements a registry of metrics, exposed on /metrics in
+# Prometheus text format. Updating a metric is a dict lookup, rendering does
+# the work.
+
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+
+
+DURATION_BUCKETS = (
+    .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+
+def escape(value):
+    return (
+        str(value)
+        .replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    )
+
+
+def format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + sorted(extra.items())
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (n, escape(v)) for n, v in pairs)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def add_label(line, name, value):
+    sample, _, number = line.rpartition(' ')
+    label = '%s="%s"' % (name, escape(value))
+    if sample.endswith('}'):
+        sample = sample[:-1] + ',' + label + '}'
+    else:
+        sample += '{' + label + '}'
+    return '%s %s' % (sample, number)
+
+
+def merge(renders, label):
+    # Merge renders of several registries, as (origin, text) pairs. Samples
+    # are labelled with their origin and stay grouped by metric.
+    families = OrderedDict()
+    for origin, text in renders:
+        for line in text.splitlines():
+            if line.startswith('#'):
+                headers, samples = families.setdefault(
+                    line.split()[2], ([], []),
+                )
+                if line not in headers:
+                    headers.append(line)
+            elif line:
+                samples.append(add_label(line, label, origin))
+
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class Metric(object):
+    type = 'untyped'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+    def key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self):
+        yield '# HELP %s %s' % (self.name, self.description)
+        yield '# TYPE %s %s' % (self.name, self.type)
+        for line in self.samples():
+            yield line
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *a, **kw):
+        super(Counter, self).__init__(*a, **kw)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield '%s%s %s' % (
+                self.name, format_labels(self.labels, key),
+                format_value(value),
+            )
+
+
+class Gauge(Metric):
+    # Value is computed by callback at render time.
+    type = 'gauge'
+
+    def __init__(self, name, description, callback):
+        super(Gauge, self).__init__(name, description)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if value is not None:
+            yield '%s %s' % (self.name, format_value(value))
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, description, labels=(),
+                 buckets=DURATION_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # Per labels: [count per bucket..., count over last bucket, sum].
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        try:
+            counts = self.values[key]
+        except KeyError:
+            counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def samples(self):
+        for key, counts in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '%s_bucket%s %d' % (
+                    self.name,
+                    format_labels(self.labels, key, le=format_value(bound)),
+                    cumulative,
+                )
+            labels = format_labels(self.labels, key)
+            yield '%s_sum%s %s' % (self.name, labels, format_value(counts[-1]))
+            yield '%s_count%s %d' % (self.name, labels, cumulative)
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description, labels=()):
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name, description, callback):
+        return self.register(Gauge(name, description, callback))
+
+    def histogram(self, name, description, labels=(),
+                  buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Registry()
+
+TASKS = METRICS.counter(
+    'epo_tasks_total', "Tasks processed by workers.", ['task', 'outcome'],
+)
+TASK_SECONDS = METRICS.histogram(
+    'epo_task_duration_seconds', "Time spent by workers on tasks.", ['task'],
+)
+HEAD_SECONDS = METRICS.histogram(
+    'epo_head_duration_seconds', "Time spent processing a head.",
+)
+EXTENSION_SECONDS = METRICS.histogram(
+    'epo_extension_duration_seconds', "Time spent per extension step.",
+    ['extension', 'step'],
+)
+GITHUB_REQUESTS = METRICS.counter(
+    'epo_github_cached_requests_total',
+    "Cached GitHub GET, by cache outcome.", ['cache'],
+)
+REQUEST_SECONDS = METRICS.histogram(
+    'epo_request_duration_seconds', "GitHub and Jenkins API latency.",
+    ['service'],
+)
+REQUEST_ERRORS = METRICS.counter(
+    'epo_request_errors_total', "Failed GitHub and Jenkins API calls.",
+    ['service'],
+)
+RETRIES = METRICS.counter(
+    'epo_retries_total', "Calls retried, by exception.", ['exception'],
+)
+STATUSES = METRICS.counter(
+    'epo_commit_statuses_total', "GitHub commit statuses pushed.", ['state'],
+)
@@ -0,0 +1,163 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file schedules repository polling. Each repository has its own
+# interval, adapting to how often its heads change.
+
+import asyncio
+import logging
+import math
+import random
+
+from .cache import CACHE
+from .repository import REPOSITORIES
+from .settings import SETTINGS
+from .shards import SHARDS
+from .tasks import RepositoryPollerTask
+from .utils import Bunch, switch_coro
+from .workers import WORKERS
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel(object):
+    # Hashed timer wheel: a slot per tick, timers beyond one revolution wait
+    # for several rounds.
+
+    def __init__(self, tick=5, size=720):
+        self.tick = tick
+        self.size = size
+        self.slots = [[] for _ in range(size)]
+        self.position = 0
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, delay, item):
+        ticks = max(1, int(math.ceil(delay / self.tick)))
+        index = (self.position + ticks) % self.size
+        self.slots[index].append([(ticks - 1) // self.size, item])
+
+    def advance(self):
+        # Move one tick forward and returns due items.
+        self.position = (self.position + 1) % self.size
+        slot = self.slots[self.position]
+        due = [item for rounds, item in slot if rounds == 0]
+        slot[:] = [[rounds - 1, item] for rounds, item in slot if rounds > 0]
+        return due
+
+
+class PollScheduler(object):
+    # Polls each repository on its own timer. Interval is halved when heads
+    # changed since last poll, and grows by half otherwise, within
+    # POLL_INTERVAL_MIN and POLL_INTERVAL_MAX.
+
+    def __init__(self, task_factory, jobs_task_factory=None):
+        self.task_factory = task_factory
+        self.jobs_task_factory = jobs_task_factory
+        self.wheel = TimerWheel()
+        self.repositories = {}
+
+    def bounds(self):
+        low = min(SETTINGS.POLL_INTERVAL_MIN, SETTINGS.POLL_INTERVAL)
+        high = max(SETTINGS.POLL_INTERVAL_MAX, SETTINGS.POLL_INTERVAL)
+        return low, high
+
+    def jitter(self, interval):
+        # Spread by 10%, to not poll repositories in lock step.
+        return interval * random.uniform(.9, 1.1)
+
+    def schedule(self, qualname, delay):
+        self.wheel.schedule(self.jitter(delay), qualname)
+
+    def observe(self, qualname, heads):
+        # Adapt interval to heads changes. Returns next interval.
+        state = self.repositories.setdefault(qualname, Bunch(
+            interval=SETTINGS.POLL_INTERVAL, signature=None,
+        ))
+        signature = frozenset((head.url, head.sha) for head in heads)
+        low, high = self.bounds()
+        if state.signature is not None and signature != state.signature:
+            state.interval = max(low, state.interval / 2)
+            logger.debug(
+                "%s changed. Polling every %ds.", qualname, state.interval,
+            )
+        elif state.signature is not None:
+            state.interval = min(high, state.interval * 1.5)
+        state.signature = signature
+        return state.interval
+
+    @asyncio.coroutine
+    def poll_repository(self, qualname):
+        try:
+            poller = yield from WORKERS.enqueue(RepositoryPollerTask(
+                qualname, self.task_factory, self.jobs_task_factory,
+            ))
+            queuer = yield from asyncio.wrap_future(poller)
+            heads = yield from asyncio.wrap_future(queuer)
+        except Exception as e:
+            logger.warn("Failed to poll %s: %s", qualname, e)
+            interval = self.repositories.get(
+                qualname, Bunch(interval=SETTINGS.POLL_INTERVAL),
+            ).interval
+        else:
+            interval = self.observe(qualname, heads)
+        self.schedule(qualname, interval)
+
+    @asyncio.coroutine
+    def preload(self, batch=256):
+        # Load cache file in memory, without starving webhooks.
+        count = 0
+        for count, _ in enumerate(CACHE.preload(), 1):
+            if count % batch == 0:
+                yield from switch_coro()
+        logger.info("Preloaded %d cache entries.", count)
+
+    def stagger(self, qualnames):
+        # Spread first polls over POLL_STARTUP_WINDOW rather than
+        # enqueuing all repositories at once.
+        window = SETTINGS.POLL_STARTUP_WINDOW
+        for i, qualname in enumerate(qualnames):
+            self.wheel.schedule(window * i / len(qualnames), qualname)
+
+    @asyncio.coroutine
+    def startup(self):
+        try:
+            yield from self.preload()
+        except Exception as e:
+            logger.warn("Failed to preload cache: %s", e)
+        qualnames = [q for q in REPOSITORIES if SHARDS.owns(q)]
+        random.shuffle(qualnames)
+        self.stagger(qualnames)
+        logger.info(
+            "Polling %d repositories within %ds.",
+            len(qualnames), SETTINGS.POLL_STARTUP_WINDOW,
+        )
+
+    @asyncio.coroutine
+    def run(self):
+        loop = asyncio.get_event_loop()
+        yield from self.startup()
+
+        next_log = loop.time() + SETTINGS.POLL_INTERVAL
+        while True:
+            for qualname in self.wheel.advance():
+                logger.debug("Polling %s.", qualname)
+                loop.create_task(self.poll_repository(qualname))
+
+            if loop.time() > next_log:
+                WORKERS.log_wait_times()
+                next_log = loop.time() + SETTINGS.POLL_INTERVAL
+            yield from asyncio.sleep(self.wheel.tick)
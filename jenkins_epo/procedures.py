@@ -18,10 +18,20 @@ import logging
 
 from .bot import Bot
 from .github import GITHUB, cached_arequest, ApiNotFoundError
-from .repository import Repository, REPOSITORIES, Head, UnauthorizedRepository
+from .metrics import HEAD_SECONDS
+from .polling import PollScheduler
+from .repository import (
+    Commit, CommitStatus, Head, Repository, REPOSITORIES,
+    UnauthorizedRepository,
+)
 from .settings import SETTINGS
-from .tasks import PrinterTask, ProcessTask, RepositoryPollerTask
-from .utils import match, retry, log_context
+from .shards import SHARDS
+from .tasks import (
+    PrinterTask, ProcessTask, ProcessUrlTask, ReconcileJobsTask,
+    RepositoryPollerTask,
+)
+from .tracing import span
+from .utils import deadline_paused, match, retry, log_context
 from .workers import WORKERS
 
 logger = logging.getLogger(__name__)
@@ -31,19 +41,16 @@ def process_task_factory(head):
     return ProcessTask(head, callable_=process_url)
 
 
+def reconcile_task_factory(repository):
+    return ReconcileJobsTask(repository, callable_=reconcile_jobs)
+
+
 @asyncio.coroutine
 def poll():
     yield from whoami()
-    while True:
-        logger.info("Polling repositories.")
-        for qualname in REPOSITORIES:
-            yield from WORKERS.enqueue(
-                RepositoryPollerTask(qualname, process_task_factory)
-            )
-        logger.info("Waiting for workers to consume queue.")
-        yield from WORKERS.queue.join()
-        logger.info("Delaying next poll by %ss.", SETTINGS.POLL_INTERVAL)
-        yield from asyncio.sleep(SETTINGS.POLL_INTERVAL)
+    logger.info("Polling repositories.")
+    scheduler = PollScheduler(process_task_factory, reconcile_task_factory)
+    yield from scheduler.run()
 
 
 @asyncio.coroutine
@@ -55,23 +62,17 @@ def print_heads():
     yield from WORKERS.queue.join()
 
 
-_task_map = {}
-
-
 @asyncio.coroutine
 def process_url(url, throttle=True):
+    # WORKERS never runs the same URL twice at once, new events on a running
+    # head re-run it once done.
     if not match(url, Repository.heads_filter):
         return logger.debug("Skipping %s. Filtered.", url)
 
     task = asyncio.Task.current_task()
-    running_task = _task_map.get(url)
-    if running_task and not running_task.done():
-        logger.debug("Cancelling current task on %s.", url)
-        running_task.cancel()
-    _task_map[url] = task
-
     if throttle:
-        yield from throttle_github()
+        with deadline_paused():
+            yield from throttle_github()
     try:
         head = yield from Head.from_url(url)
     except ApiNotFoundError:
@@ -90,11 +91,83 @@ def process_url(url, throttle=True):
         logger.error("Write access denied to %s.", head.repository)
         return
 
-    yield from bot.run(head)
+    with span('head', url=url, qualname=str(head.repository)), \
+            HEAD_SECONDS.time():
+        yield from bot.run(head)
     logger.info("Processed %s.", head)
 
     del task.logging_id
-    del _task_map[url]
+
+
+@asyncio.coroutine
+def reconcile_jobs(repository):
+    bot = Bot()
+    jobs_ext = bot.extensions_map.get('jenkins-createjobs')
+    yaml_ext = bot.extensions_map.get('yaml')
+    if not jobs_ext or not yaml_ext:
+        return logger.debug("Jobs management disabled.")
+
+    try:
+        jenkins_yml = yield from GITHUB.fetch_file_contents(
+            repository, 'jenkins.yml',
+        )
+    except ApiNotFoundError:
+        return logger.debug("No jenkins.yml in %s.", repository)
+
+    logger.info("Reconciling %s jobs.", repository)
+    try:
+        specs = yaml_ext.list_job_specs(jenkins_yml, repository=repository)
+    except Exception as e:
+        return logger.warn("Failed to list %s jobs: %s", repository, e)
+
+    yield from jobs_ext.reconcile(repository, specs)
+
+
+@asyncio.coroutine
+def process_build(url):
+    # Import here to avoid circular import with web.
+    from .jenkins import Build
+
+    # Build notifies its end, cache may still see it running.
+    build = yield from Build.from_url(url, fresh=True)
+    head_url = build.head_url
+    if not head_url:
+        return logger.warn("%s not triggered by EPO. Skipping.", build)
+
+    if not match(head_url, Repository.heads_filter):
+        return logger.debug("Skipping %s. Filtered.", head_url)
+
+    match_ = Head._url_re.match(head_url)
+    if not match_:
+        return logger.error("Can't infer head from %s.", head_url)
+
+    repository = Repository(match_.group('owner'), match_.group('name'))
+    if repository not in REPOSITORIES:
+        return logger.error("%s not managed.", repository)
+
+    try:
+        commit = Commit(repository, build.sha)
+    except Exception:
+        logger.debug("Can't find commit built by %s.", build)
+    else:
+        log_context(commit)
+        status = CommitStatus(context=build.context, **build.commit_status)
+        yield from commit.push_status(status)
+
+        # Only a successful build can complete a stage and move the head
+        # forward. Other states are reported as is.
+        if status['state'] != 'success':
+            return logger.info("Updated %s from %s.", status, build)
+
+    if not SHARDS.owns(repository):
+        logger.info("Routing %s to owner process.", head_url)
+        yield from SHARDS.forward_frontend('simple-webhook', head=head_url)
+        return
+
+    logger.info("Queuing %s for next stage.", head_url)
+    yield from WORKERS.enqueue(ProcessUrlTask(
+        ('10-webhook', head_url), head_url, callable_=process_url,
+    ))
 
 
 @asyncio.coroutine
@@ -0,0 +1,112 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file profiles bot extensions: wall time and API calls per extension
+# step, and cProfile of one head in PROFILE_SAMPLING.
+
+import cProfile
+from io import StringIO
+from itertools import count
+import logging
+import os
+import pstats
+
+from .settings import SETTINGS
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExtensionProfiler(object):
+    # A Bot hook. Bot calls start and finish around each head, pre and post
+    # around each extension step.
+    #
+    # Only one head is profiled at a time. cProfile is enabled during each
+    # extension step of the sampled head. As extensions yield to the loop,
+    # profiles include other coroutines running meanwhile.
+
+    def __init__(self):
+        self.steps = {}
+        self.heads = count()
+        self.sampled = None
+        self.profile = None
+        self.profiles = {}
+
+    def start(self, bot):
+        sampling = SETTINGS.PROFILE_SAMPLING
+        if not sampling or self.sampled is not None:
+            return
+        if next(self.heads) % sampling == 0:
+            self.sampled = bot
+
+    def pre(self, bot, ext, step):
+        if self.sampled is bot:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def post(self, bot, ext, step, wall, calls):
+        stats = self.steps.setdefault((ext.stage, ext.name, step), dict(
+            count=0, wall=0., max=0., calls=0,
+        ))
+        stats['count'] += 1
+        stats['wall'] += wall
+        stats['max'] = max(stats['max'], wall)
+        stats['calls'] += calls
+
+        if self.sampled is bot and self.profile:
+            self.profile.disable()
+            if ext.name in self.profiles:
+                self.profiles[ext.name].add(self.profile)
+            else:
+                self.profiles[ext.name] = pstats.Stats(self.profile)
+            self.profile = None
+
+    def finish(self, bot):
+        if self.sampled is not bot:
+            return
+        if self.profile:
+            self.profile.disable()
+            self.profile = None
+        self.sampled = None
+        head = getattr(getattr(bot, 'current', None), 'head', None)
+        for name, stats in sorted(self.profiles.items()):
+            self.dump(head, name, stats)
+
+    def dump(self, head, name, stats):
+        # Profiles accumulate over sampled heads.
+        if SETTINGS.PROFILE_PATH:
+            os.makedirs(SETTINGS.PROFILE_PATH, exist_ok=True)
+            path = os.path.join(SETTINGS.PROFILE_PATH, '%s.prof' % name)
+            stats.dump_stats(path)
+            return logger.info("Profile of %s on %s saved.", name, head)
+
+        output = StringIO()
+        stats.stream = output
+        stats.sort_stats('cumulative').print_stats(10)
+        logger.info("Profile of %s on %s.\n%s", name, head, output.getvalue())
+
+    def report(self):
+        # Aggregates, in pipeline order.
+        return [
+            dict(
+                stats,
+                extension=name,
+                step=step,
+                mean=stats['wall'] / stats['count'],
+            )
+            for (stage, name, step), stats in sorted(self.steps.items())
+        ]
+
+
+PROFILER = ExtensionProfiler()
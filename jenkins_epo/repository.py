@@ -25,6 +25,7 @@ from github import ApiError
 import yaml
 
 from .github import cached_arequest, unpaginate, GITHUB, ApiNotFoundError
+from .metrics import STATUSES
 from .settings import SETTINGS
 from .utils import Bunch, match, parse_datetime, parse_patterns, retry
 
@@ -90,6 +91,23 @@ class CommitStatus(dict):
             return True
         return False
 
+    def needs_build(self, rebuild_failed=None):
+        # Skip failed job, unless rebuild asked and old
+        if rebuild_failed and self.is_rebuildable:
+            if self['updated_at'] > rebuild_failed:
+                return False
+            logger.debug(
+                "Requeue context %s failed before %s.",
+                self, rebuild_failed.strftime('%Y-%m-%d %H:%M:%S')
+            )
+        elif self.get('state') == 'pending':
+            # Pending context may be requeued.
+            return self.is_queueable
+        # Other status are considerd built (success, failed, errored).
+        elif self.get('state'):
+            return False
+        return True
+
 
 class RepositoriesRegistry(dict):
     def __init__(self, *a, **kw):
@@ -124,6 +142,8 @@ class Repository(object):
         self.owner = owner
         self.name = name
         self.jobs = jobs or {}
+        # Configs of job specs from default branch, as last reconciled.
+        self.job_configs = {}
         self.SETTINGS = Bunch()
 
     def __str__(self):
@@ -342,24 +362,8 @@ class Commit(object):
     def filter_not_built_contexts(self, contexts, rebuild_failed=None):
         for context in contexts:
             status = CommitStatus(self.statuses.get(context, {}))
-            # Skip failed job, unless rebuild asked and old
-            if rebuild_failed and status.is_rebuildable:
-                if status['updated_at'] > rebuild_failed:
-                    continue
-                else:
-                    logger.debug(
-                        "Requeue context %s failed before %s.",
-                        context, rebuild_failed.strftime('%Y-%m-%d %H:%M:%S')
-                    )
-            elif status.get('state') == 'pending':
-                # Pending context may be requeued.
-                if not status.is_queueable:
-                    continue
-            # Other status are considerd built (success, failed, errored).
-            elif status.get('state'):
-                continue
-
-            yield context
+            if status.needs_build(rebuild_failed):
+                yield context
 
     def process_statuses(self, payload):
         self.statuses = {}
@@ -418,6 +422,7 @@ class Commit(object):
                 GITHUB.repos(self.repository).statuses(self.sha)
                 .apost(**kwargs)
             )
+            STATUSES.inc(state=status['state'])
             return payload
         except ApiError as e:
             logger.debug('ApiError %r', e.response['json'])
@@ -429,7 +434,7 @@ class Head(object):
     contexts_filter = parse_patterns(SETTINGS.JOBS)
 
     _url_re = re.compile(
-        r'^https://github.com/(?P<owner>[\w-]+)/(?P<name>[\w-]+)/'
+        r'^https://github.com/(?P<owner>[\w.-]+)/(?P<name>[\w.-]+)/'
         r'(?P<type>pull|tree)/(?P<id>.*)$'
     )
 
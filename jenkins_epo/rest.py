@@ -19,7 +19,9 @@ import logging
 import aiohttp
 from yarl import URL
 
-from .utils import retry
+from .stats import REQUESTS
+from .tracing import span
+from .utils import deadline_timeout, retry
 
 
 logger = logging.getLogger(__name__)
@@ -56,13 +58,15 @@ class PayloadString(Payload, collections.UserString):
 
 
 class Client(object):
-    def __init__(self, url=''):
+    # service tags requests in REQUESTS and traces.
+    def __init__(self, url='', service='jenkins'):
         self.url = url
+        self.service = service
 
     def __call__(self, url):
         if not url.startswith('http://'):
             url = self.url.rstrip('/') + '/' + str(url)
-        return self.__class__(url)
+        return self.__class__(url, service=self.service)
 
     def __getattr__(self, name):
         return self(name)
@@ -77,12 +81,18 @@ class Client(object):
         if kw:
             url = url.with_query(**kw)
         logger.debug("GET %s", url)
-        try:
-            response = yield from session.get(url, timeout=10)
-            payload = yield from response.read()
-        finally:
-            yield from session.close()
-        response.raise_for_status()
+        with REQUESTS.measure(self.service), span(
+                'http', service=self.service, method='GET', path=url.path,
+        ) as trace:
+            try:
+                response = yield from session.get(
+                    url, timeout=deadline_timeout(10),
+                )
+                trace.attrs['status'] = response.status
+                payload = yield from response.read()
+            finally:
+                yield from session.close()
+            response.raise_for_status()
         payload = payload.decode('utf-8')
         if response.content_type == 'text/x-python':
             payload = ast.literal_eval(payload)
@@ -95,13 +105,18 @@ class Client(object):
         if kw:
             url = url.with_query(**kw)
         logger.debug("POST %s", url)
-        try:
-            response = yield from session.post(
-                url, headers=headers, data=data, timeout=10,
-            )
-            payload = yield from response.read()
-        finally:
-            yield from session.close()
-        response.raise_for_status()
+        with REQUESTS.measure(self.service), span(
+                'http', service=self.service, method='POST', path=url.path,
+        ) as trace:
+            try:
+                response = yield from session.post(
+                    url, headers=headers, data=data,
+                    timeout=deadline_timeout(10),
+                )
+                trace.attrs['status'] = response.status
+                payload = yield from response.read()
+            finally:
+                yield from session.close()
+            response.raise_for_status()
         payload = payload.decode('utf-8')
         return Payload.factory(response.status, response.headers, payload)
@@ -46,12 +46,24 @@ class EnvironmentSettings(Bunch):
 
 
 DEFAULTS = {
-    # Max item count in queue to enqueue new.
+    # Max item count in queue to enqueue new, for jobs on labels unknown to
+    # EPO.
     'QUEUE_MAX': 32,
+    # Max builds queued per label beyond idle executors.
+    'LABEL_QUEUE_MAX': 4,
+    # Max builds a repository can have queued per label. 0 means no quota.
+    'REPOSITORY_QUOTA': 0,
     'CACHE_PATH': '.epo-cache',
     'CACHE_LIFE': 30,
+    # Seconds to cache a running Jenkins build. Finished builds are cached
+    # forever.
+    'BUILD_CACHE_LIFE': 10,
     # Size of worker pool
     'CONCURRENCY': 4,
+    # Bounds of worker pool autoscaling. Autoscaling is disabled unless
+    # CONCURRENCY_MAX is greater than CONCURRENCY_MIN.
+    'CONCURRENCY_MIN': 1,
+    'CONCURRENCY_MAX': 0,
     # Drop into Pdb on unhandled exception
     'DEBUG': False,
     # Do not trigger jobs nor touch GitHub statuses.
@@ -69,15 +81,59 @@ DEFAULTS = {
     # When commenting on PR
     'NAME': 'Jenkins EPO',
     'POLL_INTERVAL': 600,
+    # Bounds of per repository poll interval, adapting to activity.
+    'POLL_INTERVAL_MIN': 60,
+    'POLL_INTERVAL_MAX': 3600,
+    # Seconds before cancelling a task, per task class, not counting GitHub
+    # throttling and waits for a queue slot. 0 disables.
+    'PROCESS_DEADLINE': 600,
+    'QUEUER_DEADLINE': 300,
+    'POLLER_DEADLINE': 120,
+    # Retry a head cancelled on deadline after DEADLINE_BACKOFF seconds,
+    # doubled on each of DEADLINE_RETRIES attempts.
+    'DEADLINE_BACKOFF': 60,
+    'DEADLINE_RETRIES': 3,
+    # Seconds of event loop lag to report as blocking, with the stack of the
+    # blocking call. 0 disables loop watchdog.
+    'LOOP_LAG_THRESHOLD': 0,
+    # JSON lines file of traced spans, rotated at TRACE_MAX_BYTES. Empty to
+    # disable.
+    'TRACE_PATH': '',
+    'TRACE_MAX_BYTES': 64 * 1024 * 1024,
+    'TRACE_BACKUPS': 3,
+    # Profile one head in PROFILE_SAMPLING with cProfile, per extension. 0
+    # disables. Profiles are saved in PROFILE_PATH directory, or logged.
+    'PROFILE_SAMPLING': 0,
+    'PROFILE_PATH': '',
+    # Seconds to spread first poll of repositories over, at startup.
+    'POLL_STARTUP_WINDOW': 120,
+    # Seconds of wait to raise queued tasks priority by one, e.g. from
+    # 99-poll to 98-poll, up to 11. 0 disables aging.
+    'PRIORITY_AGING': 10,
+    # Let webhook and urgent tasks preempt running tasks of lower priority.
+    'PREEMPT': False,
+    # Journal of queued tasks, replayed by bot on restart. Empty to disable.
+    'QUEUE_JOURNAL': '.epo-journal',
     'PORT': 2819,
     'RATE_LIMIT_THRESHOLD': 50,
     # List repositories: owner/repo1,owner/repo2
     'REPOSITORIES': '',
+    # Share of workers per repository: owner/repo1=3,owner/*=1. Default weight
+    # is 1.
+    'REPOSITORY_WEIGHTS': '',
     'SERVER_URL': 'http://localhost:2819',
+    # Set by bot --processes on worker processes: index/count, and frontend
+    # URL.
+    'SHARD': '',
+    'SHARD_FRONTEND': '',
     'URGENT': '[urgent*,[hotfix*,hotfix*',
     'VERBOSE': '',
-    # Jenkins baseurl, like http://jenkins.lan:8080/.
+    # Jenkins baseurl, like http://jenkins.lan:8080/. Separate several masters
+    # with comma. First one is the default master.
     'JENKINS_URL': '',
+    # Pin repositories to a master: owner/*=http://jenkins2.lan/,... Other
+    # repositories are placed on the least loaded master.
+    'JENKINS_RULES': '',
     'JENKINS_QUEUE': '*',
 }
 
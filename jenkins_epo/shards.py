@@ -0,0 +1,233 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file implements bot --processes: a frontend process receives webhooks
+# and routes heads to worker processes, each owning a shard of repositories.
+
+import asyncio
+from bisect import bisect
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from .metrics import METRICS, merge
+from .rest import Client
+from .settings import SETTINGS
+
+
+logger = logging.getLogger(__name__)
+
+
+def hash_key(value):
+    return int(hashlib.sha1(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def build_ring(count, replicas=64):
+    # Consistent hash ring: changing process count moves few repositories,
+    # keeping most cache shards warm.
+    return sorted(
+        (hash_key('%d-%d' % (index, replica)), index)
+        for index in range(count)
+        for replica in range(replicas)
+    )
+
+
+def aggregate_stats(stats):
+    # Merge stats of worker processes.
+    stats = [s for s in stats if s]
+    latencies = [
+        s['requests']['latency'] for s in stats
+        if s['requests']['latency'] is not None
+    ]
+    remainings = [
+        s['requests']['github_remaining'] for s in stats
+        if s['requests']['github_remaining'] is not None
+    ]
+    wait_times = {}
+    timeouts = {}
+    for s in stats:
+        wait_times.update(s['wait_times'])
+        timeouts.update(s.get('timeouts', {}))
+
+    return dict(
+        queue=sum(s['queue'] for s in stats),
+        workers=sum(s['workers'] for s in stats),
+        wait_times=wait_times,
+        timeouts=timeouts,
+        requests=dict(
+            latency=(
+                sum(latencies) / len(latencies) if latencies else None
+            ),
+            errors=(
+                sum(s['requests']['errors'] for s in stats) / len(stats)
+                if stats else 0.
+            ),
+            # All processes share the same token.
+            github_remaining=min(remainings) if remainings else None,
+        ),
+    )
+
+
+class Shards(object):
+    def __init__(self):
+        self.count = 0
+        # Index of current process, None for frontend or single process.
+        self.index = None
+        self.ring = []
+        self.processes = {}
+        self.setting = None
+        self.next_index = 0
+
+    def setup(self):
+        if self.setting == SETTINGS.SHARD:
+            return
+        self.setting = SETTINGS.SHARD
+        if SETTINGS.SHARD:
+            index, count = SETTINGS.SHARD.split('/')
+            self.index = int(index)
+            self.setup_ring(int(count))
+
+    def setup_ring(self, count):
+        self.count = count
+        self.ring = build_ring(count)
+
+    @property
+    def frontend(self):
+        self.setup()
+        return bool(self.count) and self.index is None
+
+    def owner(self, qualname):
+        self.setup()
+        position = bisect(self.ring, (hash_key(str(qualname)), 0))
+        return self.ring[position % len(self.ring)][1]
+
+    def owns(self, qualname):
+        self.setup()
+        if self.index is None:
+            return True
+        return self.owner(qualname) == self.index
+
+    def url(self, index):
+        return 'http://127.0.0.1:%d/' % (SETTINGS.PORT + 1 + index)
+
+    def client(self, url):
+        # Tagged apart so that shard calls don't skew Jenkins stats.
+        return Client(url, service='shard')
+
+    def environ(self, index):
+        env = dict(
+            os.environ,
+            EPO_SHARD='%d/%d' % (index, self.count),
+            EPO_SHARD_FRONTEND='http://127.0.0.1:%d/' % (SETTINGS.PORT,),
+            EPO_HOST='127.0.0.1',
+            EPO_PORT=str(SETTINGS.PORT + 1 + index),
+            EPO_CACHE_PATH='%s-%d' % (SETTINGS.CACHE_PATH, index),
+            # Each process watches its own loop.
+            EPO_LOOP_LAG_THRESHOLD=str(SETTINGS.LOOP_LAG_THRESHOLD),
+        )
+        if SETTINGS.QUEUE_JOURNAL:
+            env['EPO_QUEUE_JOURNAL'] = '%s-%d' % (
+                SETTINGS.QUEUE_JOURNAL, index,
+            )
+        return env
+
+    @asyncio.coroutine
+    def supervise(self, index):
+        # Run worker process, restarting it on exit.
+        asyncio.Task.current_task().logging_id = 'sh%02d' % (index,)
+        while True:
+            logger.info("Starting worker process %d.", index)
+            process = yield from asyncio.create_subprocess_exec(
+                sys.executable, '-c',
+                'from jenkins_epo.script import entrypoint; entrypoint()',
+                'bot', env=self.environ(index),
+            )
+            self.processes[index] = process
+            code = yield from process.wait()
+            logger.error("Worker process %d exited with %s.", index, code)
+            yield from asyncio.sleep(5)
+
+    @asyncio.coroutine
+    def shutdown(self, *a):
+        for index, process in self.processes.items():
+            if process.returncode is None:
+                logger.info("Stopping worker process %d.", index)
+                process.terminate()
+        for process in self.processes.values():
+            yield from process.wait()
+
+    @asyncio.coroutine
+    def forward(self, route, qualname=None, **params):
+        # Forward a webhook to the process owning qualname, or any process.
+        if qualname is None:
+            index = self.next_index % self.count
+            self.next_index += 1
+        else:
+            index = self.owner(qualname)
+        logger.debug("Forwarding %s to worker process %d.", params, index)
+        yield from self.client(self.url(index))(route).apost(**params)
+
+    @asyncio.coroutine
+    def forward_frontend(self, route, **params):
+        yield from self.client(SETTINGS.SHARD_FRONTEND)(route).apost(**params)
+
+    @asyncio.coroutine
+    def fetch_all(self, route, decode=json.loads, **params):
+        # GET route of each worker process. Returns decoded payloads by
+        # process index, None on failure.
+        loop = asyncio.get_event_loop()
+        tasks = [
+            loop.create_task(asyncio.wait_for(
+                getattr(self.client(self.url(index)), route).aget(**params),
+                timeout=5,
+            ))
+            for index in range(self.count)
+        ]
+        payloads = yield from asyncio.gather(*tasks, return_exceptions=True)
+        results = {}
+        for index, payload in enumerate(payloads):
+            if isinstance(payload, Exception):
+                logger.warn(
+                    "Failed to get %s of %d: %s", route, index, payload,
+                )
+                payload = None
+            else:
+                payload = decode(str(payload))
+            results[index] = payload
+        return results
+
+    @asyncio.coroutine
+    def fetch_stats(self):
+        stats = yield from self.fetch_all('stats')
+        return dict(
+            aggregate_stats(stats.values()),
+            processes=stats,
+        )
+
+    @asyncio.coroutine
+    def fetch_metrics(self):
+        # Prometheus scrapes only the frontend. Label samples by process.
+        texts = yield from self.fetch_all('metrics', decode=str)
+        return merge(
+            [('frontend', METRICS.render())] + [
+                (str(index), text)
+                for index, text in sorted(texts.items()) if text is not None
+            ],
+            label='process',
+        )
+
+
+SHARDS = Shards()
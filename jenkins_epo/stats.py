@@ -0,0 +1,87 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file collects statistics of HTTP requests to GitHub and Jenkins.
+
+from collections import deque
+from contextlib import contextmanager
+import time
+
+from .metrics import REQUEST_ERRORS, REQUEST_SECONDS
+
+
+def is_failure(exception):
+    # Client errors are answers of a healthy service, e.g. Jenkins always
+    # answers 404 to cancelItem. Only server and transport errors count.
+    code = getattr(exception, 'code', None)
+    return not (isinstance(code, int) and code < 500)
+
+
+class RequestStats(object):
+    # Sliding window of requests duration and outcome, per service. Calls
+    # between EPO processes are left out of overall stats.
+
+    INTERNAL = {'shard'}
+
+    def __init__(self, window=120):
+        self.window = window
+        self.samples = deque()
+        # Last known GitHub rate limit remaining calls.
+        self.github_remaining = None
+
+    def prune(self, now=None):
+        limit = (now or time.time()) - self.window
+        while self.samples and self.samples[0][0] < limit:
+            self.samples.popleft()
+
+    def record(self, service, duration, error=False, now=None):
+        now = now or time.time()
+        self.samples.append((now, service, duration, error))
+        self.prune(now)
+        REQUEST_SECONDS.observe(duration, service=service)
+        if error:
+            REQUEST_ERRORS.inc(service=service)
+
+    @contextmanager
+    def measure(self, service):
+        start = time.time()
+        try:
+            yield
+        except Exception as e:
+            self.record(service, time.time() - start, error=is_failure(e))
+            raise
+        else:
+            self.record(service, time.time() - start)
+
+    def select(self, service=None):
+        self.prune()
+        if service is None:
+            return [s for s in self.samples if s[1] not in self.INTERNAL]
+        return [s for s in self.samples if s[1] == service]
+
+    def latency(self, service=None):
+        # Mean duration in seconds, None without samples.
+        samples = self.select(service)
+        if not samples:
+            return None
+        return sum(s[2] for s in samples) / len(samples)
+
+    def error_rate(self, service=None):
+        samples = self.select(service)
+        if not samples:
+            return 0.
+        return len([s for s in samples if s[3]]) / len(samples)
+
+
+REQUESTS = RequestStats()
@@ -15,7 +15,8 @@
 import asyncio
 import logging
 
-from .repository import Repository, REPOSITORIES
+from .journal import qualify, resolve
+from .repository import Head, Repository, REPOSITORIES
 from .workers import WORKERS, Task
 
 
@@ -23,10 +24,13 @@ logger = logging.getLogger(__name__)
 
 
 class RepositoryPollerTask(Task):
-    def __init__(self, qualname, task_factory):
+    deadline_setting = 'POLLER_DEADLINE'
+
+    def __init__(self, qualname, task_factory, jobs_task_factory=None):
         super(RepositoryPollerTask, self).__init__(('99-poll', qualname))
         self.qualname = qualname
         self.task_factory = task_factory
+        self.jobs_task_factory = jobs_task_factory
 
     def __str__(self):
         return self.qualname
@@ -41,14 +45,56 @@ class RepositoryPollerTask(Task):
             REPOSITORIES[str(repository)] = repository
             logger.debug("Managing %s.", repository)
 
-        yield from WORKERS.enqueue(QueuerTask(repository, self.task_factory))
+        queuer = yield from WORKERS.enqueue(QueuerTask(
+            repository, self.task_factory, self.jobs_task_factory,
+        ))
+        # Let poller watch heads.
+        return queuer
 
 
 class ProcessUrlTask(Task):
+    deadline_setting = 'PROCESS_DEADLINE'
+
     def __init__(self, priority, url, callable_):
         super(ProcessUrlTask, self).__init__(priority)
         self.url = url
         self.callable_ = callable_
+        match = Head._url_re.match(url)
+        if match:
+            self.qualname = '%(owner)s/%(name)s' % match.groupdict()
+
+    @property
+    def key(self):
+        return self.callable_, self.url
+
+    @property
+    def urgent(self):
+        # Head sort key starts with not urgent.
+        return (
+            super(ProcessUrlTask, self).urgent or
+            len(self.priority) > 1 and self.priority[1] is False
+        )
+
+    def clone(self, priority):
+        return ProcessUrlTask(priority, self.url, self.callable_)
+
+    def as_journal(self):
+        callable_ = qualify(self.callable_)
+        if not callable_:
+            return None
+        return dict(
+            task=qualify(ProcessUrlTask),
+            priority=list(self.priority),
+            url=self.url,
+            callable=callable_,
+        )
+
+    @classmethod
+    def from_journal(cls, record):
+        return cls(
+            tuple(record['priority']), record['url'],
+            callable_=resolve(record['callable']),
+        )
 
     def __str__(self):
         return self.url
@@ -64,36 +110,61 @@ class ProcessTask(ProcessUrlTask):
         )
 
 
+class ReconcileJobsTask(Task):
+    def __init__(self, repository, callable_):
+        super(ReconcileJobsTask, self).__init__(('40-jobs', str(repository)))
+        self.repository = repository
+        self.qualname = str(repository)
+        self.callable_ = callable_
+
+    def __str__(self):
+        return str(self.repository)
+
+    def __call__(self):
+        return self.callable_(self.repository)
+
+
 class QueuerTask(Task):
-    def __init__(self, repository, task_factory):
+    deadline_setting = 'QUEUER_DEADLINE'
+
+    def __init__(self, repository, task_factory, jobs_task_factory=None):
         super(QueuerTask, self).__init__(('99-poll', str(repository)))
         self.repository = repository
+        self.qualname = str(repository)
         self.task_factory = task_factory
+        self.jobs_task_factory = jobs_task_factory
 
     def __str__(self):
         return str(self.repository)
 
     @asyncio.coroutine
     def queue_heads(self, heads):
-        for head in heads:
-            logger.debug("Queuing %s.", head)
-            yield from WORKERS.enqueue(self.task_factory(head))
+        logger.debug("Queuing %d heads of %s.", len(heads), self.repository)
+        yield from WORKERS.enqueue_many([
+            self.task_factory(head) for head in heads
+        ])
 
     @asyncio.coroutine
     def __call__(self):
+        if self.jobs_task_factory:
+            # Jobs task has precedence over heads.
+            yield from WORKERS.enqueue(self.jobs_task_factory(self.repository))
+
         logger.info("Fetching %s heads.", self.repository)
         branches = yield from self.repository.fetch_protected_branches()
-        heads = self.repository.process_protected_branches(branches)
+        heads = list(self.repository.process_protected_branches(branches))
         yield from self.queue_heads(heads)
         pulls = yield from self.repository.fetch_pull_requests()
-        heads = self.repository.process_pull_requests(pulls)
-        yield from self.queue_heads(heads)
+        pulls = list(self.repository.process_pull_requests(pulls))
+        yield from self.queue_heads(pulls)
+        return heads + pulls
 
 
 class PrinterTask(Task):
     def __init__(self, head):
         super(PrinterTask, self).__init__(('50-head', ) + head.sort_key())
         self.head = head
+        self.qualname = str(head.repository)
 
     def __str__(self):
         return str(self.head)
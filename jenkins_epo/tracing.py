@@ -0,0 +1,201 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file traces spans of work: worker task, head, extension step and HTTP
+# request. Spans are written as JSON lines to TRACE_PATH.
+
+import asyncio
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import count
+import json
+import logging.handlers
+import os
+import time
+
+from .settings import SETTINGS
+from . import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+def current_span():
+    return getattr(asyncio.Task.current_task(), 'span', None)
+
+
+class Span(object):
+    ids = count(1)
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.id = '%d-%d' % (os.getpid(), next(self.ids))
+        self.parent_id = parent.id if parent else None
+        self.trace_id = parent.trace_id if parent else self.id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        # API calls made within this span.
+        self.calls = 0
+        if name == 'http' and parent:
+            for ancestor in parent.lineage():
+                ancestor.calls += 1
+
+    def finish(self, **attrs):
+        self.attrs.update(attrs)
+        self.duration = time.time() - self.start
+        TRACER.emit(self)
+
+    def lineage(self):
+        # Yields this span and its ancestors, innermost first.
+        span = self
+        while span:
+            yield span
+            span = span.parent
+
+    def as_dict(self):
+        return dict(
+            self.attrs,
+            name=self.name,
+            id=self.id,
+            parent=self.parent_id,
+            trace=self.trace_id,
+            calls=self.calls,
+            start=round(self.start, 6),
+            duration=round(self.duration, 6),
+        )
+
+
+def task_factory(loop, coro):
+    # Child tasks inherit span of the task creating them, to attribute API
+    # calls of gathered coroutines.
+    task = utils.task_factory(loop, coro)
+    parent = asyncio.Task.current_task(loop=loop)
+    if hasattr(parent, 'span'):
+        task.span = parent.span
+    return task
+
+
+@contextmanager
+def span(name, **attrs):
+    # Trace a block as a child of current task span.
+    task = asyncio.Task.current_task()
+    parent = getattr(task, 'span', None)
+    child = Span(name, parent, **attrs)
+    if task:
+        task.span = child
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        if task:
+            task.span = parent
+        child.finish()
+
+
+class Tracer(object):
+    def __init__(self):
+        self.path = None
+        self.handler = None
+
+    def setup(self):
+        if self.path == SETTINGS.TRACE_PATH:
+            return
+        self.close()
+        self.path = SETTINGS.TRACE_PATH
+        if self.path:
+            logger.debug("Tracing to %s.", self.path)
+            self.handler = logging.handlers.RotatingFileHandler(
+                self.path,
+                maxBytes=SETTINGS.TRACE_MAX_BYTES,
+                backupCount=SETTINGS.TRACE_BACKUPS,
+            )
+
+    @property
+    def enabled(self):
+        self.setup()
+        return bool(self.handler)
+
+    def emit(self, span):
+        if not self.enabled:
+            return
+        record = logging.makeLogRecord(dict(
+            msg=json.dumps(span.as_dict(), default=str),
+        ))
+        self.handler.emit(record)
+
+    def close(self):
+        if self.handler:
+            self.handler.close()
+            self.handler = None
+
+
+TRACER = Tracer()
+
+
+def read(path):
+    # Yields spans of rotated files first, oldest first.
+    paths = ['%s.%d' % (path, i) for i in range(SETTINGS.TRACE_BACKUPS, 0, -1)]
+    for path_ in paths + [path]:
+        try:
+            fo = open(path_)
+        except FileNotFoundError:
+            continue
+        with fo:
+            for line in fo:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.debug("Skipping corrupted trace line %r.", line)
+
+
+def summarize(spans, top=10):
+    spans = list(spans)
+    tasks = [s for s in spans if s['name'] == 'task']
+    heads = [s for s in spans if s['name'] == 'head']
+    requests = [s for s in spans if s['name'] == 'http']
+
+    extensions = defaultdict(lambda: dict(count=0, total=0.))
+    for s in spans:
+        if s['name'] != 'extension':
+            continue
+        stats = extensions['%s.%s' % (s['extension'], s['step'])]
+        stats['count'] += 1
+        stats['total'] += s['duration']
+
+    elapsed = 0.
+    if spans:
+        elapsed = (
+            max(s['start'] + s['duration'] for s in spans) -
+            min(s['start'] for s in spans)
+        )
+
+    return dict(
+        elapsed=elapsed,
+        tasks=len(tasks),
+        heads=len(heads),
+        throughput=len(heads) / elapsed * 60 if elapsed else 0.,
+        requests=len(requests),
+        cached=len([s for s in requests if s.get('status') == 304]),
+        cost=sum(s.get('cost') or 0 for s in requests),
+        extensions=sorted(
+            extensions.items(), key=lambda i: i[1]['total'], reverse=True,
+        ),
+        slowest=sorted(
+            heads, key=lambda s: s['duration'], reverse=True,
+        )[:top],
+    )
@@ -19,6 +19,7 @@ import aiohttp.errors
 import pdb
 import collections
 from concurrent.futures import TimeoutError
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 import fnmatch
 import logging
@@ -30,6 +31,8 @@ from http.client import HTTPException
 import tenacity
 from requests import HTTPError
 
+from .metrics import RETRIES
+
 
 logger = logging.getLogger(__name__)
 
@@ -40,12 +43,19 @@ def utcnow():
 
 def retry(callable_):
     defaults = dict(
-        retry=tenacity.retry_if_exception(filter_exception_for_retry),
+        retry=tenacity.retry_if_exception(count_retry),
         wait=tenacity.wait_exponential(max=300),
     )
     return tenacity.retry(**defaults)(callable_)
 
 
+def count_retry(exception):
+    retried = filter_exception_for_retry(exception)
+    if retried:
+        RETRIES.inc(exception=type(exception).__name__)
+    return retried
+
+
 _retryable_exception = (
     IOError,
     HTTPException,
@@ -178,3 +188,49 @@ def deepupdate(self, other):
 def switch_coro(_seconds=.005):
     """Tiny helper lettting loop switch to another coroutine."""
     yield from asyncio.sleep(_seconds)
+
+
+def deadline_timeout(timeout):
+    """Shrink timeout to the deadline of current task, if any."""
+    task = asyncio.Task.current_task()
+    deadline = getattr(task, 'deadline', None)
+    if deadline is None:
+        return timeout
+    remaining = deadline - asyncio.get_event_loop().time()
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Deadline exceeded.")
+    return min(timeout, remaining)
+
+
+@contextmanager
+def deadline_paused():
+    """Don't count waits in block against the deadline of current task.
+
+    The deadline is pushed back by the time spent in block, e.g. throttling
+    GitHub calls or waiting for a slot in queue.
+    """
+    task = asyncio.Task.current_task()
+    deadline = getattr(task, 'deadline', None)
+    if deadline is None:
+        yield
+        return
+
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    task.deadline = None
+    try:
+        yield
+    finally:
+        task.deadline = deadline + loop.time() - start
+
+
+def task_factory(loop, coro):
+    """Create task inheriting deadline of the task creating it.
+
+    Thus requests of gathered coroutines are bound to the deadline too.
+    """
+    task = asyncio.Task(coro, loop=loop)
+    parent = asyncio.Task.current_task(loop=loop)
+    if hasattr(parent, 'deadline'):
+        task.deadline = parent.deadline
+    return task
@@ -0,0 +1,160 @@
+# This file is part of jenkins-epo
+#
+# jenkins-epo is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or any later version.
+#
+# jenkins-epo is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file measures event loop lag and finds synchronous code blocking the
+# loop.
+
+import asyncio
+from collections import Counter, deque
+import logging
+import os.path
+import sys
+import threading
+import time
+import traceback
+
+from .metrics import METRICS
+from .settings import SETTINGS
+
+
+logger = logging.getLogger(__name__)
+
+
+LAG = METRICS.histogram(
+    'epo_loop_lag_seconds', "Event loop lag.",
+    buckets=(.001, .005, .01, .05, .1, .25, .5, 1, 5, 30),
+)
+BLOCKED = METRICS.counter(
+    'epo_loop_blocked_total', "Loop blocked over LOOP_LAG_THRESHOLD, by site.",
+    ['site'],
+)
+
+
+def percentile(values, rank):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * rank))]
+
+
+def blocking_site(stack):
+    # Returns innermost jenkins-epo frame of a stack, blaming our code rather
+    # than the library it calls.
+    package = os.path.dirname(__file__)
+    frame = ([f for f in stack if f.filename.startswith(package)] or stack)[-1]
+    return '%s:%d:%s' % (
+        os.path.basename(frame.filename), frame.lineno, frame.name,
+    )
+
+
+class LoopWatchdog(object):
+    # A coroutine ticks a heartbeat and measures how late it wakes up. A
+    # thread checks the heartbeat and captures the loop thread stack when it
+    # is late by more than threshold.
+
+    def __init__(self, window=3000):
+        self.lags = deque(maxlen=window)
+        self.sites = Counter()
+        self.beat = None
+        self.capture = None
+        self.thread = None
+        self.loop_thread_id = None
+
+    def sample(self, threshold):
+        # Runs in watchdog thread.
+        while self.beat is not None:
+            time.sleep(threshold / 2)
+            beat = self.beat
+            if beat is None or time.monotonic() - beat < threshold:
+                continue
+            if self.capture and self.capture[0] == beat:
+                continue  # Already captured.
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame:
+                self.capture = beat, traceback.extract_stack(frame)
+
+    def start(self, threshold):
+        self.loop_thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self.thread = threading.Thread(
+            target=self.sample, args=(threshold,), name='watchdog',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.beat = None
+
+    def record(self, lag, threshold, capture=None):
+        self.lags.append(lag)
+        LAG.observe(lag)
+        if lag < threshold:
+            return
+
+        site = blocking_site(capture) if capture else 'unknown'
+        if site not in self.sites:
+            # Log stack of new blocking sites only.
+            logger.warning(
+                "Loop blocked %.2fs at %s.\n%s", lag, site,
+                ''.join(traceback.format_list(capture or [])).rstrip(),
+            )
+        self.sites[site] += 1
+        BLOCKED.inc(site=site)
+
+    def percentiles(self):
+        return dict(
+            p50=percentile(self.lags, .5),
+            p90=percentile(self.lags, .9),
+            p99=percentile(self.lags, .99),
+            max=max(self.lags) if self.lags else None,
+        )
+
+    def log_summary(self):
+        stats = self.percentiles()
+        if stats['max'] is None:
+            return
+        logger.info(
+            "Loop lag p50=%.3fs p90=%.3fs p99=%.3fs max=%.3fs.",
+            stats['p50'], stats['p90'], stats['p99'], stats['max'],
+        )
+        for site, count in self.sites.most_common(5):
+            logger.info("Loop blocked %d times at %s.", count, site)
+
+    @asyncio.coroutine
+    def run(self, report_interval=300):
+        asyncio.Task.current_task().logging_id = 'wdog'
+        loop = asyncio.get_event_loop()
+        # Environment gives '0.25' as a string.
+        threshold = float(SETTINGS.LOOP_LAG_THRESHOLD)
+        tick = min(.1, threshold / 2)
+        next_report = loop.time() + report_interval
+        self.start(threshold)
+        logger.info("Watching loop lag over %ss.", threshold)
+        try:
+            while True:
+                start = loop.time()
+                self.beat = time.monotonic()
+                yield from asyncio.sleep(tick)
+                lag = max(0, loop.time() - start - tick)
+                capture = self.capture
+                self.capture = None
+                self.record(lag, threshold, capture and capture[1])
+                if loop.time() > next_report:
+                    self.log_summary()
+                    next_report = loop.time() + report_interval
+        finally:
+            self.stop()
+
+
+WATCHDOG = LoopWatchdog()
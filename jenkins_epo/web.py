@@ -13,6 +13,7 @@
 # jenkins-epo.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+from functools import partial
 import hmac
 import hashlib
 import json
@@ -20,9 +21,15 @@ import logging
 
 from aiohttp import web
 
-from .procedures import process_url
+from .cache import CACHE
+from .github import GITHUB
+from .metrics import METRICS
+from .procedures import process_build, process_url
+from .profiling import PROFILER
 from .repository import REPOSITORIES, Repository, WebHook
 from .settings import SETTINGS
+from .shards import SHARDS
+from .stats import REQUESTS
 from .tasks import ProcessUrlTask
 from .workers import WORKERS, Task
 
@@ -30,13 +37,24 @@ app = web.Application()
 logger = logging.getLogger(__name__)
 
 
+@asyncio.coroutine
+def dispatch(task, route, **params):
+    # With bot --processes, the frontend forwards the webhook to the worker
+    # process owning the repository.
+    if SHARDS.frontend:
+        yield from SHARDS.forward(route, task.qualname, **params)
+    else:
+        yield from WORKERS.enqueue(task)
+
+
 @asyncio.coroutine
 def simple_webhook(request):
     logger.info("Processing simple webhook event.")
     url = request.GET['head']
     priority = ('10-webhook', url)
-    yield from WORKERS.enqueue(
-        ProcessUrlTask(priority, url, callable_=process_url)
+    yield from dispatch(
+        ProcessUrlTask(priority, url, callable_=process_url),
+        'simple-webhook', head=url,
     )
     return web.json_response({'message': 'Event processing in progress.'})
 
@@ -44,6 +62,38 @@ def simple_webhook(request):
 app.router.add_post('/simple-webhook', simple_webhook, name='simple-webhook')
 
 
+@asyncio.coroutine
+def build_webhook(request):
+    # Import here to avoid circular import with jenkins.
+    from .jenkins import JENKINS
+
+    logger.info("Processing build notification.")
+    try:
+        url = request.GET['build']
+    except KeyError:
+        try:
+            job, number = request.GET['job'], request.GET['number']
+        except KeyError:
+            return web.json_response(
+                {'message': 'Missing build or job and number.'}, status=400,
+            )
+        # Optional repository routes job like its other jobs.
+        master = yield from JENKINS.for_job(
+            job, request.GET.get('repository'),
+        )
+        url = '%sjob/%s/%s/' % (master.url, job, number)
+
+    priority = ('10-webhook', url)
+    yield from dispatch(
+        ProcessUrlTask(priority, url, callable_=process_build),
+        'build-webhook', build=url,
+    )
+    return web.json_response({'message': 'Build processing in progress.'})
+
+
+app.router.add_post('/build-webhook', build_webhook, name='build-webhook')
+
+
 def compute_signature(payload, secret):
     return "sha1=%s" % (
         hmac.new(key=secret, msg=payload, digestmod=hashlib.sha1)
@@ -141,8 +191,9 @@ def github_webhook(request):
 
     priority = ('10-webhook', url)
     logger.info("Queuing %s.", url)
-    yield from WORKERS.enqueue(
-        ProcessUrlTask(priority, url, callable_=process_url)
+    yield from dispatch(
+        ProcessUrlTask(priority, url, callable_=process_url),
+        'simple-webhook', head=url,
     )
 
     return web.json_response({'message': 'Event processing in progress.'})
@@ -151,6 +202,67 @@ def github_webhook(request):
 app.router.add_post('/github-webhook', github_webhook, name='github-webhook')
 
 
+@asyncio.coroutine
+def stats(request):
+    if SHARDS.frontend:
+        payload = yield from SHARDS.fetch_stats()
+    else:
+        payload = WORKERS.stats()
+    return web.json_response(payload)
+
+
+app.router.add_get('/stats', stats, name='stats')
+
+
+@asyncio.coroutine
+def metrics(request):
+    if SHARDS.frontend:
+        text = yield from SHARDS.fetch_metrics()
+    else:
+        text = METRICS.render()
+    return web.Response(text=text, content_type='text/plain')
+
+
+app.router.add_get('/metrics', metrics, name='metrics')
+
+
+@asyncio.coroutine
+def introspect(request):
+    try:
+        limit = int(request.GET.get('limit', 100))
+        if limit < 0:
+            raise ValueError(limit)
+    except ValueError:
+        return web.json_response(
+            {'message': 'limit must be a positive integer.'}, status=400,
+        )
+
+    if SHARDS.frontend:
+        payload = yield from SHARDS.fetch_all('introspect', limit=limit)
+        payload = dict(processes=payload)
+    else:
+        payload = dict(
+            WORKERS.snapshot(limit),
+            github=dict(
+                remaining=REQUESTS.github_remaining,
+                reset=getattr(GITHUB._instance, 'x_ratelimit_reset', None),
+                latency=REQUESTS.latency('github'),
+            ),
+            cache=CACHE.stats(),
+            extensions=PROFILER.report(),
+        )
+    # Payload is plain data built for this request, encode it out of the
+    # loop.
+    loop = asyncio.get_event_loop()
+    body = yield from loop.run_in_executor(
+        None, partial(json.dumps, payload, default=str),
+    )
+    return web.Response(text=body, content_type='application/json')
+
+
+app.router.add_get('/introspect', introspect, name='introspect')
+
+
 @asyncio.coroutine
 def register_webhook():
     futures = []
@@ -12,22 +12,121 @@
 # This file implements a simple async worker pool.
 
 import asyncio
+from collections import Counter, deque
 from concurrent.futures import Future, CancelledError
+import heapq
+from itertools import count
 import logging
+import time
 
 from .compat import PriorityQueue
+from .journal import Journal
+from .metrics import METRICS, TASKS, TASK_SECONDS
 from .settings import SETTINGS
-from .utils import switch_coro
+from .stats import REQUESTS
+from .tracing import Span, current_span, task_factory
+from .utils import Bunch, deadline_paused, match, parse_patterns, switch_coro
 
 
 logger = logging.getLogger(__name__)
 
 
+def class_rank(priority_class):
+    # '10-webhook' ranks 10. Lower rank is served first.
+    if isinstance(priority_class, str):
+        prefix = priority_class.partition('-')[0]
+        if prefix.isdigit():
+            return int(prefix)
+    return priority_class
+
+
+def outcome(future):
+    if not future.done():
+        return 'pending'
+    if future.cancelled():
+        return 'cancelled'
+    if future.exception():
+        return type(future.exception()).__name__
+    return 'done'
+
+
+def describe(item):
+    return dict(
+        task=item.__class__.__name__,
+        item=str(item),
+        qualname=item.qualname,
+        priority=str(item.priority_class),
+        followers=len(item.followers),
+        attempt=item.attempt,
+    )
+
+
 class Task(Future):
-    # A priorized task class.
+    # A priorized task class. qualname is the repository the task works on,
+    # used to share workers fairly between repositories. Tasks with the same
+    # key are coalesced by WorkerPool, if they define clone(priority) to
+    # re-run a task dirtied while running or expired. deadline_setting names
+    # the setting of seconds before the task is cancelled.
+    qualname = None
+    key = None
+    clone = None
+    deadline_setting = None
+
     def __init__(self, priority=('50-default',)):
         super(Task, self).__init__()
         self.priority = priority
+        self.queued_at = None
+        # Coalesced tasks, resolved with the outcome of this one.
+        self.followers = []
+        # Priority of events received while running, if any.
+        self.rerun_priority = None
+        self.journal_id = None
+        # Set by WorkerPool to yield worker to an urgent task.
+        self.preempt_requested = False
+        # Retries after deadline exceeded.
+        self.attempt = 0
+
+    def as_journal(self):
+        # Returns a JSON dict to rebuild the task on restart, with
+        # from_journal classmethod of task class at module:qualname path. None
+        # means task is not journaled.
+        return None
+
+    def notify_followers(self):
+        for follower in self.followers:
+            if self.cancelled():
+                follower.cancel()
+            elif self.exception():
+                follower.set_exception(self.exception())
+            else:
+                follower.set_result(self.result())
+        self.followers[:] = []
+
+    @property
+    def coalesce_key(self):
+        if self.clone is None:
+            return None
+        return self.key
+
+    @property
+    def timeout(self):
+        if self.deadline_setting:
+            return getattr(SETTINGS, self.deadline_setting) or None
+        return None
+
+    @property
+    def priority_class(self):
+        if isinstance(self.priority, tuple):
+            return self.priority[0]
+        return self.priority
+
+    @property
+    def urgent(self):
+        return self.priority_class == '10-webhook'
+
+    @property
+    def rank(self):
+        return class_rank(self.priority_class), not self.urgent
 
     def __lt__(self, other):
         return self.priority < other.priority
@@ -37,64 +136,657 @@ class Task(Future):
         pass
 
 
+class FairScheduler(object):
+    # Holds queued tasks. Priority classes (10-webhook, 50-poll, 99-poll, etc.)
+    # are served strictly in order. Inside a class, each repository has its
+    # own sub-queue, ordered by task priority, and sub-queues are served with
+    # deficit round robin weighted by REPOSITORY_WEIGHTS.
+
+    def __init__(self):
+        self.classes = {}
+        self.sequence = count()
+        self.size = 0
+        self.waits = {}
+        self.weights_setting = None
+        self.weights = []
+
+    def __iter__(self):
+        for klass in self.classes.values():
+            for flow in klass.flows.values():
+                for entry in sorted(flow):
+                    yield entry[-1]
+
+    def __len__(self):
+        return self.size
+
+    def parse_weights(self):
+        if self.weights_setting == SETTINGS.REPOSITORY_WEIGHTS:
+            return self.weights
+        self.weights_setting = SETTINGS.REPOSITORY_WEIGHTS
+        self.weights = []
+        raw = SETTINGS.REPOSITORY_WEIGHTS or ''
+        for rule in parse_patterns(raw.replace(' ', ',')):
+            pattern, _, weight = rule.partition('=')
+            try:
+                weight = float(weight)
+            except ValueError:
+                weight = 0
+            if weight <= 0:
+                logger.warn("Ignoring invalid repository weight %s.", rule)
+                continue
+            self.weights.append((pattern, weight))
+        return self.weights
+
+    def weight(self, qualname):
+        if qualname is None:
+            return 1
+        for pattern, weight in self.parse_weights():
+            if match(qualname, [pattern]):
+                return weight
+        return 1
+
+    def push(self, item, now):
+        item.queued_at = now
+        klass = self.classes.setdefault(item.priority_class, Bunch(
+            active=deque(), arrivals=deque(), deficits={}, flows={},
+        ))
+        klass.arrivals.append(item)
+        flow = klass.flows.get(item.qualname)
+        if flow is None:
+            flow = klass.flows[item.qualname] = []
+            klass.deficits[item.qualname] = 0
+            klass.active.append(item.qualname)
+        heapq.heappush(flow, (item.priority, next(self.sequence), item))
+        self.size += 1
+
+    def remove(self, item):
+        key = item.priority_class
+        klass = self.classes[key]
+        flow = klass.flows[item.qualname]
+        flow[:] = [entry for entry in flow if entry[-1] is not item]
+        heapq.heapify(flow)
+        if not flow:
+            klass.active.remove(item.qualname)
+            del klass.flows[item.qualname], klass.deficits[item.qualname]
+        if not klass.active:
+            del self.classes[key]
+        self.size -= 1
+
+    def oldest(self, key):
+        # Returns enqueue time of the oldest task of a priority class.
+        arrivals = self.classes[key].arrivals
+        while arrivals:
+            item = arrivals[0]
+            if item.queued_at is not None and item.priority_class == key:
+                return item.queued_at
+            arrivals.popleft()
+
+    def select_class(self, now):
+        # Priority classes age: waiting PRIORITY_AGING seconds gains one
+        # rank. Thus 99-poll tasks are not starved by long 50-poll rounds.
+        # Aging stops one rank below webhooks, which are always served first.
+        aging = SETTINGS.PRIORITY_AGING
+        if not aging or len(self.classes) < 2:
+            return min(self.classes)
+        floor = class_rank('10-webhook') + 1
+
+        def effective_rank(key):
+            rank = class_rank(key) - (now - self.oldest(key)) / aging
+            return max(rank, min(class_rank(key), floor)), class_rank(key)
+
+        return min(self.classes, key=effective_rank)
+
+    def pop(self, now):
+        key = self.select_class(now)
+        klass = self.classes[key]
+        while True:
+            qualname = klass.active[0]
+            if klass.deficits[qualname] < 1:
+                klass.deficits[qualname] += self.weight(qualname)
+                if klass.deficits[qualname] < 1:
+                    klass.active.rotate(-1)
+                    continue
+
+            flow = klass.flows[qualname]
+            item = heapq.heappop(flow)[-1]
+            klass.deficits[qualname] -= 1
+            if not flow:
+                # Idle flows don't save credit for later.
+                klass.active.popleft()
+                del klass.flows[qualname], klass.deficits[qualname]
+            elif klass.deficits[qualname] < 1:
+                klass.active.rotate(-1)
+            break
+
+        if not klass.active:
+            del self.classes[key]
+        self.size -= 1
+        self.record_wait(qualname, now - item.queued_at)
+        item.queued_at = None
+        return item
+
+    def record_wait(self, qualname, wait):
+        stats = self.waits.setdefault(qualname, Bunch(
+            average=wait, count=0, last=wait, max=wait,
+        ))
+        stats.count += 1
+        stats.last = wait
+        stats.max = max(stats.max, wait)
+        # Exponential moving average, to follow load changes.
+        stats.average += (wait - stats.average) * .2
+
+    def wait_times(self, now):
+        oldest = {}
+        for klass in self.classes.values():
+            for qualname, flow in klass.flows.items():
+                queued_at = min(entry[-1].queued_at for entry in flow)
+                oldest[qualname] = max(
+                    oldest.get(qualname, 0), now - queued_at,
+                )
+
+        times = {}
+        for qualname in set(self.waits) | set(oldest):
+            stats = self.waits.get(qualname, Bunch(
+                average=0, count=0, last=0, max=0,
+            ))
+            times[qualname] = dict(
+                stats, pending=oldest.get(qualname, 0),
+            )
+        return times
+
+
+class FairQueue(PriorityQueue):
+    # A PriorityQueue sharing slots between repositories. See FairScheduler.
+
+    def _init(self, maxsize):
+        self._queue = FairScheduler()
+
+    def _put(self, item):
+        self._queue.push(item, self._loop_time())
+
+    def _get(self):
+        return self._queue.pop(self._loop_time())
+
+    def _loop_time(self):
+        return asyncio.get_event_loop().time()
+
+    def unget(self, item):
+        # Put back an item just got, without counting a new task.
+        self._put(item)
+
+    def reprioritize(self, item, priority):
+        # Move a queued item, keeping its enqueue time.
+        self._queue.remove(item)
+        item.priority = priority
+        self._queue.push(item, item.queued_at)
+
+    def wait_times(self):
+        # Returns wait stats per repository, in seconds: average, last and max
+        # wait of dequeued tasks, and age of the oldest pending task.
+        return self._queue.wait_times(self._loop_time())
+
+
+class Autoscaler(object):
+    # Resizes WorkerPool between CONCURRENCY_MIN and CONCURRENCY_MAX. Grows
+    # while queue is deep and requests latency holds, shrinks when idle, on
+    # errors, and near GitHub rate limit.
+
+    def __init__(self, pool, interval=10):
+        self.pool = pool
+        self.interval = interval
+        # Lowest latency seen, slowly forgotten.
+        self.baseline = None
+        # (timestamp, size) of last hour.
+        self.history = deque(maxlen=3600 // interval)
+
+    def compute(self, size, depth, latency, errors, remaining):
+        # Returns new pool size and the reason.
+        if latency is not None:
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline *= 1.01
+
+        floor = SETTINGS.RATE_LIMIT_THRESHOLD * 4
+        if remaining is not None and 0 <= remaining < floor:
+            target, reason = size // 2, 'GitHub rate limit near'
+        elif errors > .2:
+            target, reason = size - 1, 'errors at %d%%' % (errors * 100,)
+        elif depth > size:
+            if latency is not None and latency > 2 * self.baseline:
+                target, reason = size, 'latency degraded'
+            else:
+                target = size + max(1, size // 4)
+                reason = '%d tasks queued' % (depth,)
+        elif depth == 0:
+            target, reason = size - 1, 'queue empty'
+        else:
+            target, reason = size, 'steady'
+
+        target = max(SETTINGS.CONCURRENCY_MIN, target)
+        target = min(SETTINGS.CONCURRENCY_MAX, target)
+        return target, reason
+
+    def tick(self):
+        size = self.pool.size
+        target, reason = self.compute(
+            size,
+            depth=self.pool.queue.qsize(),
+            latency=REQUESTS.latency(),
+            errors=REQUESTS.error_rate(),
+            remaining=REQUESTS.github_remaining,
+        )
+        self.history.append((time.time(), target))
+        if target != size:
+            logger.info(
+                "Resizing worker pool from %d to %d: %s.",
+                size, target, reason,
+            )
+            self.pool.resize(target)
+        return target
+
+    @asyncio.coroutine
+    def run(self):
+        asyncio.Task.current_task().logging_id = 'scal'
+        while True:
+            yield from asyncio.sleep(self.interval)
+            self.tick()
+
+
 class WorkerPool(object):
     def __init__(self):
         self.tasks = []
-        self.queue = PriorityQueue(maxsize=1024)
+        # Alive workers by id, and ids waiting for a task.
+        self.workers = {}
+        self.idle = set()
+        self.size = 0
+        self.autoscaler = Autoscaler(self)
+        self.queue = FairQueue(maxsize=1024)
+        # Keyed tasks waiting in queue and running.
+        self.pending = {}
+        self.running = {}
+        # Running items by asyncio task.
+        self.current = {}
+        # Deadline exceeded count per repository.
+        self.timeouts = Counter()
+        self.journal = None
+        # Set by terminate(), while cancelling workers.
+        self.stopping = False
+
+    def stats(self):
+        return dict(
+            queue=self.queue.qsize(),
+            workers=self.size,
+            wait_times={
+                str(k): v for k, v in self.queue.wait_times().items()
+            },
+            timeouts={str(k): v for k, v in self.timeouts.items()},
+            requests=dict(
+                latency=REQUESTS.latency(),
+                errors=REQUESTS.error_rate(),
+                github_remaining=REQUESTS.github_remaining,
+            ),
+        )
+
+    def snapshot(self, limit=100):
+        # Returns plain data of queued and running tasks, safe to serialize out
+        # of the loop. Queued tasks are sorted by priority. Lists hold at most
+        # limit entries.
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        queued = heapq.nsmallest(
+            limit, list(self.queue._queue),
+            key=lambda i: (str(i.priority_class), i),
+        )
+        running = []
+        for task, item in list(self.current.items()):
+            spans = list(task.span.lineage())
+            extension = [s for s in spans if s.name == 'extension'][:1]
+            running.append(dict(
+                describe(item),
+                elapsed=time.time() - spans[-1].start,
+                # Span goes on, copy its attributes.
+                extension=dict(extension[0].attrs) if extension else None,
+                dirty=item.rerun_priority is not None,
+            ))
+        return dict(
+            queue=self.queue.qsize(),
+            workers=self.size,
+            idle=len(self.idle),
+            queued=[
+                dict(
+                    describe(item),
+                    age=now - item.queued_at if item.queued_at else None,
+                )
+                for item in queued
+            ],
+            running=sorted(running, key=lambda t: -t['elapsed']),
+            # Keys of tasks coalescing new events.
+            pending_keys=[str(k) for k in list(self.pending)[:limit]],
+            running_keys=[str(k) for k in list(self.running)[:limit]],
+        )
+
+    def log_wait_times(self):
+        wait_times = getattr(self.queue, 'wait_times', None)
+        if not wait_times:
+            return
+        for qualname, stats in sorted(wait_times().items(), key=str):
+            logger.info(
+                "%s waited %.1fs on average, %.1fs at most.",
+                qualname or 'Global queue', stats['average'], stats['max'],
+            )
 
     @asyncio.coroutine
-    def start(self):
+    def start(self, replay=False):
         loop = asyncio.get_event_loop()
-        for i in range(SETTINGS.CONCURRENCY):
-            task = loop.create_task(self.worker(i))
-            self.tasks.append(task)
-            yield from switch_coro()  # Let worker start
+        if loop.get_task_factory() is None:
+            loop.set_task_factory(task_factory)
+        self.resize(SETTINGS.CONCURRENCY)
+        yield from switch_coro()  # Let workers start
+
+        if SETTINGS.CONCURRENCY_MAX > SETTINGS.CONCURRENCY_MIN:
+            self.tasks.append(loop.create_task(self.autoscaler.run()))
+
+        if replay and SETTINGS.QUEUE_JOURNAL:
+            yield from self.replay(Journal(SETTINGS.QUEUE_JOURNAL))
         return self.queue
 
+    def resize(self, size):
+        # Exceeding workers stop once their current task is done.
+        loop = asyncio.get_event_loop()
+        self.size = size
+        self.tasks[:] = [t for t in self.tasks if not t.done()]
+        for id_ in range(size):
+            task = self.workers.get(id_)
+            if not task or task.done():
+                task = self.workers[id_] = loop.create_task(self.worker(id_))
+                self.tasks.append(task)
+
+        for id_, task in list(self.workers.items()):
+            if id_ < size:
+                continue
+            if id_ in self.idle:
+                task.cancel()
+            if task.done() or id_ in self.idle:
+                del self.workers[id_]
+
+    @asyncio.coroutine
+    def replay(self, journal):
+        tasks = journal.open()
+        self.journal = journal
+        if tasks:
+            logger.info("Replaying %d task(s) from journal.", len(tasks))
+        yield from self.enqueue_many(tasks)
+
+    def coalesce(self, item):
+        # Returns whether item is merged with a queued or running task.
+        key = item.coalesce_key
+        if key is None:
+            return False
+
+        queued = self.pending.get(key)
+        if queued:
+            logger.debug("Coalescing %s with queued task.", item)
+            if item.priority < queued.priority:
+                if queued.queued_at is None:
+                    # Waiting for a slot in full queue, or just got by a
+                    # worker.
+                    queued.priority = item.priority
+                else:
+                    self.queue.reprioritize(queued, item.priority)
+                self.journal_put(queued)
+            queued.followers.append(item)
+            self.journal_done(item)
+            return True
+
+        running = self.running.get(key)
+        if running:
+            logger.debug("Marking %s dirty.", item)
+            if running.rerun_priority is None:
+                running.rerun_priority = item.priority
+            else:
+                running.rerun_priority = min(
+                    running.rerun_priority, item.priority,
+                )
+            running.followers.append(item)
+            self.journal_done(item)
+            return True
+
+        return False
+
     @asyncio.coroutine
     def enqueue(self, item):
-        logger.debug("Queuing %s %s.", item.__class__.__name__, item)
-        yield from self.queue.put(item)
-        yield from switch_coro()
+        yield from self.enqueue_many([item])
         return item
 
+    @asyncio.coroutine
+    def enqueue_many(self, items):
+        # Queue items without yielding to other coroutines, unless queue is
+        # full. Then producer waits for workers to free a slot.
+        for item in items:
+            if self.coalesce(item):
+                continue
+
+            logger.debug("Queuing %s %s.", item.__class__.__name__, item)
+            if item.coalesce_key is not None:
+                self.pending[item.coalesce_key] = item
+            self.journal_put(item)
+            if self.queue.full():
+                logger.debug("Queue full. Waiting for workers.")
+                with deadline_paused():
+                    yield from self.queue.put(item)
+            else:
+                self.queue.put_nowait(item)
+            self.request_preemption(item)
+        return items
+
+    @asyncio.coroutine
+    def rerun(self, item):
+        logger.debug("Running %s again.", item)
+        clone = item.clone(item.rerun_priority)
+        clone.followers.extend(item.followers)
+        item.followers[:] = []
+        self.pending[clone.coalesce_key] = clone
+        self.journal_put(clone)
+        yield from self.queue.put(clone)
+
+    def journal_put(self, item):
+        if self.journal:
+            self.journal.put(item)
+
+    def journal_done(self, item):
+        if self.journal:
+            self.journal.done(item)
+
     @asyncio.coroutine
     def worker(self, id_):
-        loop = asyncio.get_event_loop()
         asyncio.Task.current_task().logging_id = 'wk%02d' % (id_,)
 
-        while True:
+        while id_ < self.size:
             logger.debug("Worker %d waiting.", id_)
-            item = yield from self.queue.get()
+            self.idle.add(id_)
+            try:
+                item = yield from self.queue.get()
+            finally:
+                self.idle.discard(id_)
             logger.debug(
                 "Worker %d working on %s %s.",
                 id_, item.__class__.__name__, item,
             )
-            task = loop.create_task(item())
-            try:
-                res = yield from task
-                item.set_result(res)
-            except CancelledError:
-                item.cancel()
-                logger.warn("Cancel of %s", item)
-            except Exception as e:
-                item.set_exception(e)
-                if SETTINGS.VERBOSE or SETTINGS.DEBUG:
-                    logger.exception("Failed to process %s: %s", item, e)
+            yield from self.process(item)
+
+        logger.debug("Worker %d stopped.", id_)
+
+    @asyncio.coroutine
+    def process(self, item):
+        loop = asyncio.get_event_loop()
+        key = item.coalesce_key
+        if key is not None:
+            self.pending.pop(key, None)
+            self.running[key] = item
+        task = loop.create_task(item())
+        task.span = Span(
+            'task', current_span(), task=item.__class__.__name__,
+            item=str(item), qualname=item.qualname, priority=item.priority,
+        )
+        timeout = item.timeout
+        if timeout:
+            # Read by deadline_timeout() to shrink HTTP timeouts.
+            task.deadline = loop.time() + timeout
+        self.current[task] = item
+        try:
+            res = yield from self.wait_deadline(task, timeout)
+            item.set_result(res)
+        except CancelledError:
+            item.cancel()
+            logger.warn("Cancel of %s", item)
+        except Exception as e:
+            item.set_exception(e)
+            if timeout and loop.time() >= task.deadline:
+                self.expire(item)
+            elif SETTINGS.VERBOSE or SETTINGS.DEBUG:
+                logger.exception("Failed to process %s: %s", item, e)
+            else:
+                logger.error("Failed to process %s: %s", item, e)
+        finally:
+            task.span.finish(outcome=outcome(item))
+            name = item.__class__.__name__
+            TASKS.inc(task=name, outcome=task.span.attrs['outcome'])
+            TASK_SECONDS.observe(task.span.duration, task=name)
+            del self.current[task]
+            if key is not None:
+                self.running.pop(key, None)
+            # Task cancelled by shutdown stays in journal, to run again on
+            # next start.
+            interrupted = self.stopping and (
+                item.cancelled() or not item.done()
+            )
+            # Queue clone before task_done to not release queue.join().
+            if item.rerun_priority is not None and not interrupted:
+                yield from self.rerun(item)
+            item.notify_followers()
+            if not interrupted:
+                self.journal_done(item)
+            self.queue.task_done()
+
+    @asyncio.coroutine
+    def wait_deadline(self, task, timeout):
+        # Like asyncio.wait_for, but task.deadline is pushed back, or cleared
+        # while task waits in deadline_paused().
+        if not timeout:
+            res = yield from asyncio.wait_for(task, None)
+            return res
+
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                if task.deadline is None:
+                    # Paused, check again later.
+                    timeout = 1
                 else:
-                    logger.error("Failed to process %s: %s", item, e)
-            finally:
-                self.queue.task_done()
+                    timeout = max(0, task.deadline - loop.time())
+                yield from asyncio.wait([task], timeout=timeout)
+                if task.done():
+                    return task.result()
+                deadline = task.deadline
+                if deadline is not None and loop.time() >= deadline:
+                    break
+        except CancelledError:
+            task.cancel()
+            raise
+
+        task.cancel()
+        yield from asyncio.wait([task])
+        raise asyncio.TimeoutError()
+
+    def expire(self, item):
+        # Count deadline exceeded and retry head later.
+        logger.warn("%s exceeded its %ss deadline.", item, item.timeout)
+        self.timeouts[item.qualname] += 1
+        if item.coalesce_key is None or item.rerun_priority is not None:
+            return
+        if item.attempt >= SETTINGS.DEADLINE_RETRIES:
+            logger.error("Giving up %s after %d retries.", item, item.attempt)
+            return
+
+        clone = item.clone(item.priority)
+        clone.attempt = item.attempt + 1
+        delay = SETTINGS.DEADLINE_BACKOFF * 2 ** item.attempt
+        logger.info("Retrying %s in %ss.", item, delay)
+        loop = asyncio.get_event_loop()
+        loop.call_later(delay, lambda: loop.create_task(self.enqueue(clone)))
+
+    def request_preemption(self, item):
+        # Ask the least priority running task to yield its worker to an
+        # urgent item.
+        if not SETTINGS.PREEMPT or not item.urgent or self.idle:
+            return
+
+        candidates = [
+            t for t in self.current.values()
+            if not t.preempt_requested and t.rank > item.rank
+        ]
+        if not candidates:
+            return
+        victim = max(candidates, key=lambda t: t.rank)
+        logger.debug("Requesting %s to yield to %s.", victim, item)
+        victim.preempt_requested = True
+
+    @asyncio.coroutine
+    def checkpoint(self):
+        # Safe point of a running task. If preempted, suspend current task
+        # until the urgent task is processed in place of this worker.
+        item = self.current.get(asyncio.Task.current_task())
+        if not item or not item.preempt_requested:
+            return
+
+        item.preempt_requested = False
+        try:
+            urgent = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        if not urgent.rank < item.rank:
+            # Urgent task is already taken by another worker.
+            self.queue.unget(urgent)
+            return
+
+        logger.info("Suspending %s for %s.", item, urgent)
+        loop = asyncio.get_event_loop()
+        task = loop.create_task(self.process(urgent))
+        # Urgent task is not bound to the span and deadline of current task.
+        task.span = task.deadline = None
+        self.tasks.append(task)
+        # Cancelling current task on deadline must not cancel urgent one.
+        yield from asyncio.shield(task)
+        logger.info("Resuming %s.", item)
 
     @asyncio.coroutine
     def terminate(self):
         pending_workers = [t for t in self.tasks if not t.done()]
         logger.info("Stopping pending workers.")
+        self.stopping = True
         for task in pending_workers:
             if not task.done():
                 task.cancel()
         yield from asyncio.gather(*self.tasks, return_exceptions=True)
+        self.stopping = False
         self.tasks[:] = []
+        self.workers.clear()
+        self.size = 0
+        if self.journal:
+            # Keep pending tasks in journal for next start.
+            self.journal.close()
+            self.journal = None
 
 
 WORKERS = WorkerPool()
+METRICS.gauge(
+    'epo_queue_depth', "Tasks waiting for a worker.",
+    lambda: WORKERS.queue.qsize(),
+)
+METRICS.gauge(
+    'epo_tasks_in_flight', "Tasks being processed.",
+    lambda: len(WORKERS.current),
+)
+METRICS.gauge('epo_workers', "Worker pool size.", lambda: WORKERS.size)
@@ -61,6 +61,7 @@ if __name__ == '__main__':
                 'autocancel = jenkins_epo.extensions.core:AutoCancelExtension',
                 'jenkins-backed = jenkins_epo.extensions.jenkins:BackedExtension',  # noqa
                 'jenkins-poll = jenkins_epo.extensions.jenkins:PollExtension',
+                'jenkins-queue-canceller = jenkins_epo.extensions.jenkins:QueueCancellerExtension',  # noqa
                 'jenkins-builder = jenkins_epo.extensions.jenkins:BuilderExtension',  # noqa
                 'jenkins-canceller = jenkins_epo.extensions.jenkins:CancellerExtension',  # noqa
                 'jenkins-createjobs = jenkins_epo.extensions.jenkins:CreateJobsExtension',  # noqa
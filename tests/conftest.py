@@ -25,6 +25,7 @@ def WORKERS():
     patcher = patch('jenkins_epo.workers.WORKERS')
     WORKERS = patcher.start()
     WORKERS.enqueue = CoroutineMock()
+    WORKERS.enqueue_many = CoroutineMock()
     WORKERS.queue.join = CoroutineMock()
     yield WORKERS
     patcher.stop()
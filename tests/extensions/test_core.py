@@ -211,10 +211,12 @@ def test_skip_instruction():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_skip_run():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.core import CommitStatus, SkipExtension
 
     ext = SkipExtension('ext', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.cancel_queue = []
     ext.current.jobs_match = ['matching']
     ext.current.job_specs = dict(job=Mock())
@@ -250,10 +252,12 @@ def test_skip_run():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_unskip():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.core import CommitStatus, UnskipExtension
 
     ext = UnskipExtension('ext', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.jobs_match = ['m-*']
     ext.current.all_job_specs = dict(job=Mock())
     ext.current.all_job_specs['job'].name = 'job'
@@ -214,6 +214,73 @@ def test_job_update():
     assert action == job.update
 
 
+def test_job_reconciled():
+    from jenkins_epo.extensions.jenkins import CreateJobsExtension
+
+    ext = CreateJobsExtension('createjob', Mock())
+    ext.current = ext.bot.current
+    ext.current.refresh_jobs = None
+    ext.current.job_specs = {'job': Mock(config=dict(a=1))}
+    ext.current.job_specs['job'].name = 'job'
+    ext.current.repository.job_configs = {'job': dict(a=1)}
+    job = Mock()
+    job.spec.contains.return_value = False
+    ext.current.jobs = {'job': job}
+
+    assert not list(ext.process_job_specs())
+
+    # Ephemeral overlay is still applied.
+    ext.current.job_specs['job'].config = dict(a=2)
+    assert list(ext.process_job_specs())
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_reconcile(mocker):
+    JENKINS = mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    from jenkins_epo.extensions.jenkins import CreateJobsExtension, UnknownJob
+
+    ext = CreateJobsExtension('createjob', Mock())
+    repository = Mock(jobs={})
+    specs = {
+        'new': Mock(config=dict(new=True)),
+        'outdated': Mock(config=dict()),
+        'uptodate': Mock(config=dict()),
+    }
+    for name, spec in specs.items():
+        spec.name = name
+
+    outdated = Mock()
+    outdated.name = 'outdated'
+    outdated.spec.contains.return_value = False
+    outdated.update = CoroutineMock(return_value=Mock())
+    outdated.update.return_value.name = 'outdated'
+    uptodate = Mock()
+    uptodate.spec.contains.return_value = True
+    uptodate.update = CoroutineMock()
+    jobs = dict(outdated=outdated, uptodate=uptodate)
+
+    def aget_job(name, repository=None):
+        if name not in jobs:
+            raise UnknownJob(name)
+        return jobs[name]
+
+    JENKINS.aget_job = CoroutineMock(side_effect=aget_job)
+    JENKINS.create_job = CoroutineMock(side_effect=Exception('POUET'))
+
+    yield from ext.reconcile(repository, specs)
+
+    # Failed creation is left to heads.
+    assert 'new' not in repository.job_configs
+    assert {} == repository.job_configs['outdated']
+    assert {} == repository.job_configs['uptodate']
+    assert JENKINS.create_job.mock_calls
+    assert outdated.update.mock_calls
+    assert not uptodate.update.mock_calls
+    assert repository.jobs['outdated'] is outdated.update.return_value
+    assert 'new' not in repository.jobs
+
+
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_jenkins_create_success(mocker):
@@ -1,4 +1,5 @@
 import asyncio
+from datetime import datetime
 from unittest.mock import Mock
 
 from asynctest import CoroutineMock
@@ -8,10 +9,12 @@ import pytest
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_backed():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import BackedExtension
 
     ext = BackedExtension('b', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.job_specs = {'job': Mock()}
     ext.current.job_specs['job'].name = 'job'
     ext.current.jobs = {'job': Mock()}
@@ -39,24 +42,26 @@ def test_compute_rebuild():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_build_queue_full(mocker):
-    JENKINS = mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    # Dispatcher refuses builds while Jenkins queue is full.
+    DISPATCHER.admit = CoroutineMock(return_value=0)
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import BuilderExtension
 
     ext = BuilderExtension('builder', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     job = Mock()
+    job.list_contexts.return_value = ['job']
     spec = Mock(config=dict())
     spec.name = 'job'
     ext.current.head.ref = 'refs/heads/pr'
-    ext.current.last_commit.filter_not_built_contexts.return_value = ['job']
     ext.current.last_commit.maybe_update_status = CoroutineMock()
     ext.current.jobs_match = []
     ext.current.job_specs = {'job': spec}
     ext.current.jobs = {'job': job}
     ext.current.statuses = {}
 
-    JENKINS.is_queue_empty = CoroutineMock(return_value=False)
-
     yield from ext.run()
 
     assert ext.current.last_commit.maybe_update_status.mock_calls
@@ -66,17 +71,24 @@ def test_build_queue_full(mocker):
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_build_queue_empty(mocker):
-    JENKINS = mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    DISPATCHER.admit = CoroutineMock(return_value=1)
+    QUEUE_TRACKER = mocker.patch(
+        'jenkins_epo.extensions.jenkins.QUEUE_TRACKER'
+    )
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import BuilderExtension
 
     ext = BuilderExtension('builder', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     job = Mock()
+    job.list_contexts.return_value = ['job']
     job.build = CoroutineMock()
     spec = Mock(config=dict())
     spec.name = 'job'
     ext.current.head.ref = 'refs/heads/pr'
-    ext.current.last_commit.filter_not_built_contexts.return_value = ['job']
     ext.current.last_commit.maybe_update_status = CoroutineMock(return_value={
         'description': 'Queued'
     })
@@ -85,30 +97,140 @@ def test_build_queue_empty(mocker):
     ext.current.jobs = {'job': job}
     ext.current.statuses = {}
 
-    JENKINS.is_queue_empty = CoroutineMock(return_value=True)
-
     yield from ext.run()
 
     assert ext.current.last_commit.maybe_update_status.mock_calls
     assert job.build.mock_calls
+    assert QUEUE_TRACKER.track.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_build_not_admitted(mocker):
+    mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    DISPATCHER.admit = CoroutineMock(return_value=0)
+    from jenkins_epo.bot import ContextTable
+    from jenkins_epo.extensions.jenkins import BuilderExtension
+
+    ext = BuilderExtension('builder', Mock())
+    ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
+    job = Mock()
+    job.list_contexts.return_value = ['job']
+    job.build = CoroutineMock()
+    spec = Mock(config=dict())
+    spec.name = 'job'
+    ext.current.head.ref = 'refs/heads/pr'
+    ext.current.last_commit.maybe_update_status = CoroutineMock()
+    ext.current.jobs_match = []
+    ext.current.job_specs = {'job': spec}
+    ext.current.jobs = {'job': job}
+    ext.current.statuses = {}
+
+    yield from ext.run()
+
+    assert DISPATCHER.admit.mock_calls
+    calls = ext.current.last_commit.maybe_update_status.mock_calls
+    assert 'Backed' == calls[0][1][0]['description']
+    assert not job.build.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_build_partially_admitted(mocker):
+    mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    DISPATCHER.admit = CoroutineMock(return_value=1)
+    mocker.patch('jenkins_epo.extensions.jenkins.QUEUE_TRACKER')
+    from jenkins_epo.bot import ContextTable
+    from jenkins_epo.extensions.jenkins import BuilderExtension, CommitStatus
+
+    ext = BuilderExtension('builder', Mock())
+    ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
+    job = Mock()
+    job.list_contexts.return_value = ['job-a', 'job-b']
+    job.build = CoroutineMock()
+    spec = Mock(config=dict())
+    spec.name = 'job'
+    ext.current.last_commit.maybe_update_status = CoroutineMock()
+    ext.current.job_specs = {'job': spec}
+    ext.current.jobs = {'job': job}
+    ext.current.statuses = {
+        'job-b': CommitStatus(state='pending', description='Queued'),
+    }
+
+    yield from ext.run()
+
+    # job-b is already queued, but over capacity.
+    job.build.assert_called_once_with(ext.current.head, spec, ['job-a'])
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_build_rebuild(mocker):
+    mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    DISPATCHER.admit = CoroutineMock(return_value=3)
+    mocker.patch('jenkins_epo.extensions.jenkins.QUEUE_TRACKER')
+    from jenkins_epo.bot import ContextTable
+    from jenkins_epo.extensions.jenkins import BuilderExtension, CommitStatus
+
+    ext = BuilderExtension('builder', Mock())
+    ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
+    job = Mock()
+    job.list_contexts.return_value = [
+        'job-failed', 'job-green', 'job-new', 'job-running',
+    ]
+    job.build = CoroutineMock()
+    spec = Mock(config=dict())
+    spec.name = 'job'
+    ext.current.last_commit.maybe_update_status = CoroutineMock(return_value={
+        'description': 'Queued'
+    })
+    ext.current.job_specs = {'job': spec}
+    ext.current.jobs = {'job': job}
+    ext.current.rebuild_failed = datetime(2016, 8, 11, 12)
+    ext.current.statuses = {
+        'job-failed': CommitStatus(
+            state='failure', updated_at=datetime(2016, 8, 11, 10),
+        ),
+        'job-green': CommitStatus(state='success', description='Success!'),
+        'job-running': CommitStatus(state='pending', description='#1'),
+    }
+
+    yield from ext.run()
+
+    DISPATCHER.admit.assert_called_once_with(
+        ext.current.repository, spec, 2, url=job.baseurl,
+    )
+    job.build.assert_called_once_with(
+        ext.current.head, spec, ['job-failed', 'job-new'],
+    )
 
 
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_build_failed(mocker, SETTINGS):
-    JENKINS = mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    DISPATCHER.admit = CoroutineMock(return_value=1)
 
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import BuilderExtension
 
     ext = BuilderExtension('builder', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     job = Mock()
+    job.list_contexts.return_value = ['job']
     job.build = CoroutineMock(side_effect=Exception('POUET'))
     spec = Mock(config=dict())
     spec.name = 'job'
     ext.current.SETTINGS = SETTINGS
     ext.current.head.ref = 'refs/heads/pr'
-    ext.current.last_commit.filter_not_built_contexts.return_value = ['job']
     ext.current.last_commit.maybe_update_status = CoroutineMock(return_value={
         'description': 'Queued'
     })
@@ -117,8 +239,6 @@ def test_build_failed(mocker, SETTINGS):
     ext.current.jobs = {'job': job}
     ext.current.statuses = {}
 
-    JENKINS.is_queue_empty = CoroutineMock(return_value=True)
-
     yield from ext.run()
 
     assert ext.current.last_commit.maybe_update_status.mock_calls
@@ -129,19 +249,23 @@ def test_build_failed(mocker, SETTINGS):
 @asyncio.coroutine
 def test_build_failed_debug(mocker, SETTINGS):
     SETTINGS.DEBUG = 1
-    JENKINS = mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    DISPATCHER = mocker.patch('jenkins_epo.extensions.jenkins.DISPATCHER')
+    DISPATCHER.admit = CoroutineMock(return_value=1)
 
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import BuilderExtension
 
     ext = BuilderExtension('builder', Mock())
     ext.current = ext.bot.current
+    ext.current.contexts = ContextTable(ext.current)
     job = Mock()
+    job.list_contexts.return_value = ['job']
     job.build = CoroutineMock(side_effect=Exception('POUET'))
     spec = Mock(config=dict())
     spec.name = 'job'
     ext.current.SETTINGS = SETTINGS
     ext.current.head.ref = 'refs/heads/pr'
-    ext.current.last_commit.filter_not_built_contexts.return_value = ['job']
     ext.current.last_commit.maybe_update_status = CoroutineMock(return_value={
         'description': 'Queued'
     })
@@ -150,8 +274,6 @@ def test_build_failed_debug(mocker, SETTINGS):
     ext.current.jobs = {'job': job}
     ext.current.statuses = {}
 
-    JENKINS.is_queue_empty = CoroutineMock(return_value=True)
-
     with pytest.raises(Exception):
         yield from ext.run()
 
@@ -343,3 +465,56 @@ def test_poll_lost_build(mocker):
 
     assert Build.from_url.mock_calls
     assert commit.maybe_update_status.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_queue_canceller(mocker, SETTINGS):
+    JENKINS = mocker.patch('jenkins_epo.extensions.jenkins.JENKINS')
+    QUEUE_TRACKER = mocker.patch(
+        'jenkins_epo.extensions.jenkins.QUEUE_TRACKER'
+    )
+    from jenkins_epo.extensions.jenkins import QueueCancellerExtension
+    from jenkins_epo.jenkins import QueueItem
+
+    def item(id_, head_url, sha=None):
+        parameters = [
+            dict(name='YML_NOTIFY_URL', value='epo://?head=' + head_url),
+            dict(name='R', value='refs/heads/pr'),
+        ]
+        if sha:
+            parameters.append(dict(name='YML_SHA', value=sha))
+        return QueueItem(dict(
+            id=id_, inQueueSince=0, task=dict(name='job'),
+            actions=[dict(parameters=parameters)],
+        ))
+
+    ext = QueueCancellerExtension('test', Mock())
+    ext.current = ext.bot.current
+    ext.current.SETTINGS = SETTINGS
+    ext.current.head.url = 'url://pr'
+    ext.current.head.sha = 'cafed0d0'
+    ext.current.head.fullref = 'refs/heads/pr'
+    ext.current.jobs = {'job': Mock(revision_param='R')}
+    QUEUE_TRACKER.items = {
+        (None, 1): ('url://', Mock(sha='cafed0d0'), ['job']),
+        (None, 2): ('url://', Mock(sha='d0d0cafe'), ['job/a', 'job/b']),
+    }
+
+    items = [
+        item(1, 'url://pr'),
+        item(2, 'url://pr'),
+        item(3, 'url://pr', sha='d0d0cafe'),
+        item(4, 'url://other', sha='d0d0cafe'),
+        # Without SHA, item may build current commit.
+        item(5, 'url://pr'),
+        item(6, 'url://pr', sha='cafed0d0'),
+    ]
+    for i in items:
+        i.cancel = CoroutineMock()
+    JENKINS.fetch_queue = CoroutineMock(return_value=items)
+
+    yield from ext.run()
+
+    cancelled = [i.id for i in items if i.cancel.mock_calls]
+    assert [2, 3] == cancelled
@@ -7,10 +7,12 @@ import pytest
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_first_stage():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['build', 'test']
     ext.current.job_specs = specs = {
@@ -32,15 +34,19 @@ def test_first_stage():
     yield from ext.run()
 
     assert ext.current.current_stage.name == 'build'
+    entry, = ext.current.contexts.for_spec(specs['test'])
+    assert 'test' == entry.stage
 
 
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_second_stage():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['build', 'test']
     ext.current.job_specs = specs = {
@@ -65,10 +71,12 @@ def test_second_stage():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_no_test_stage():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['build', 'deploy']
     ext.current.job_specs = specs = {
@@ -92,10 +100,12 @@ def test_no_test_stage():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_periodic_ignored():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['deploy', 'test']
     ext.current.job_specs = specs = {
@@ -122,10 +132,12 @@ def test_periodic_ignored():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_periodic_required():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['deploy', 'test']
     ext.current.job_specs = specs = {
@@ -152,10 +164,12 @@ def test_periodic_required():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_branches_limit():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['test']
     ext.current.job_specs = specs = {
@@ -177,10 +191,12 @@ def test_branches_limit():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_external_context():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = [
         dict(name='deploy', external=['deploy/prod']),
@@ -204,10 +220,12 @@ def test_external_context():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_nostages():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension, SkipHead
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['test', 'deploy']
     ext.current.job_specs = {}
@@ -221,10 +239,12 @@ def test_nostages():
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_complete():
+    from jenkins_epo.bot import ContextTable
     from jenkins_epo.extensions.jenkins import StagesExtension
 
     ext = StagesExtension('stages', Mock())
     ext.current = Mock()
+    ext.current.contexts = ContextTable(ext.current)
     ext.current.head.ref = 'pr'
     ext.current.SETTINGS.STAGES = ['test', 'deploy']
     ext.current.job_specs = specs = {
@@ -161,6 +161,41 @@ def test_run_extension(mocker):
     assert ext.run.mock_calls
 
 
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_run_hooks(mocker):
+    pkg_resources = mocker.patch('jenkins_epo.bot.pkg_resources')
+
+    from jenkins_epo.bot import Bot, SkipHead
+
+    ep = Mock()
+    ep.name = 'ext'
+    pkg_resources.iter_entry_points.return_value = [ep]
+    ext = ep.resolve.return_value.return_value
+    ext.DEFAULTS = {}
+    ext.SETTINGS = {}
+    ext.run.side_effect = SkipHead()
+
+    pr = Mock(name='pr', payload=dict())
+    pr.fetch_commits = CoroutineMock()
+    commits = [Mock()]
+    pr.repository.process_commits.return_value = commits
+    pr.fetch_comments = CoroutineMock(return_value=[])
+    commits[0].fetch_statuses = CoroutineMock()
+
+    bot = Bot()
+    hook = Mock()
+    bot.hooks = [hook]
+    yield from bot.run(pr)
+
+    hook.start.assert_called_once_with(bot)
+    hook.finish.assert_called_once_with(bot)
+    assert 2 == len(hook.pre.mock_calls)
+    assert 2 == len(hook.post.mock_calls)
+    _, args, _ = hook.post.mock_calls[-1]
+    assert (bot, ext, 'run') == args[:3]
+
+
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_begin_skip_head(mocker):
@@ -282,3 +317,64 @@ def test_process_instructions():
 
     assert 1 == len(ext.process_instruction.mock_calls)
     assert 1 == len(bot.current.denied_instructions)
+
+
+def test_context_table():
+    from jenkins_epo.bot import ContextTable
+    from jenkins_epo.repository import CommitStatus
+
+    current = Mock()
+    current.statuses = {}
+    current.jobs = {'job': Mock()}
+    current.jobs['job'].list_contexts.return_value = ['job-a', 'job-b']
+    spec = Mock()
+    spec.name = 'job'
+    table = ContextTable(current)
+
+    entries = table.for_spec(spec)
+    assert ['job-a', 'job-b'] == [e.name for e in entries]
+    assert entries is table.for_spec(spec)
+    assert 1 == len(current.jobs['job'].list_contexts.mock_calls)
+    assert table['job-a'].job is current.jobs['job']
+    assert not table['job-a'].has_status
+    assert not table['job-a'].is_skipped
+
+    current.statuses['job-a'] = CommitStatus(
+        context='job-a', state='success', description='Skipped!',
+    )
+    assert table['job-a'].has_status
+    assert table['job-a'].is_skipped
+    assert not table['job-a'].is_running
+    assert not table['job-a'].is_queueable
+    assert not table['job-a'].is_rebuildable
+    assert not table['job-a'].needs_build()
+    assert table['job-b'].needs_build()
+    assert table['job-a'].stage is None
+    table.stages['job'] = 'test'
+    assert 'test' == table['job-a'].stage
+
+    spec = Mock()
+    spec.name = 'job'
+    table.for_spec(spec)
+    assert 2 == len(current.jobs['job'].list_contexts.mock_calls)
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_context_update_status():
+    from jenkins_epo.bot import ContextTable
+
+    current = Mock()
+    current.jobs = {'job': Mock()}
+    current.jobs['job'].list_contexts.return_value = ['job-a']
+    current.last_commit.maybe_update_status = CoroutineMock()
+    spec = Mock()
+    spec.name = 'job'
+    table = ContextTable(current)
+    entry, = table.for_spec(spec)
+
+    yield from entry.update_status(dict(state='pending'))
+
+    status, = current.last_commit.maybe_update_status.call_args[0]
+    assert 'job-a' == status['context']
+    assert 'pending' == status['state']
@@ -10,6 +10,8 @@ import pytest
 def test_from_url(SETTINGS, mocker):
     SETTINGS.JENKINS_URL = 'jenkins://'
     Client = mocker.patch('jenkins_epo.jenkins.rest.Client')
+    from jenkins_epo.cache import MemoryCache
+    mocker.patch('jenkins_epo.jenkins.CACHE', MemoryCache())
 
     from jenkins_epo.jenkins import Build, NotOnJenkins
 
@@ -23,6 +25,40 @@ def test_from_url(SETTINGS, mocker):
     assert 1 == build.number
 
 
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_from_url_cache(SETTINGS, mocker):
+    SETTINGS.JENKINS_URL = 'jenkins://'
+    SETTINGS.BUILD_CACHE_LIFE = 10
+    Client = mocker.patch('jenkins_epo.jenkins.rest.Client')
+    from jenkins_epo.cache import MemoryCache
+    CACHE = mocker.patch('jenkins_epo.jenkins.CACHE', MemoryCache())
+
+    from jenkins_epo.jenkins import Build
+
+    aget = Client().api.python.aget = CoroutineMock(
+        return_value=dict(number=1, result=None),
+    )
+
+    yield from Build.from_url('jenkins://job/1')
+    yield from Build.from_url('jenkins://job/1/')
+    # Running build is cached a short time.
+    assert 1 == len(aget.mock_calls)
+    yield from Build.from_url('jenkins://job/1', fresh=True)
+    assert 2 == len(aget.mock_calls)
+
+    CACHE.set('jenkins_build_jenkins://job/1', (0, dict(number=1)))
+    aget.return_value = dict(number=1, result='SUCCESS')
+    yield from Build.from_url('jenkins://job/1')
+    assert 3 == len(aget.mock_calls)
+
+    # Finished build is cached forever.
+    CACHE.set('jenkins_build_jenkins://job/1', (0, aget.return_value))
+    build = yield from Build.from_url('jenkins://job/1', fresh=True)
+    assert 3 == len(aget.mock_calls)
+    assert 'SUCCESS' == build.result
+
+
 def test_props():
     from jenkins_epo.jenkins import Build
 
@@ -122,3 +158,32 @@ def test_stop(SETTINGS, mocker):
     yield from build.stop()
 
     assert Client().stop.apost.mock_calls
+
+
+def test_context():
+    from jenkins_epo.jenkins import Build
+
+    build = Build(Mock(), payload=dict(url='jenkins://job/app-units/3/'))
+    assert 'app-units' == build.context
+
+    build = Build(Mock(), payload=dict(
+        url='jenkins://job/app-matrix/P%3Dpython2,T%3Dunits/3/'
+    ))
+    assert 'app-matrix/P=python2,T=units' == build.context
+
+    build = Build(Mock(), payload=dict(url='jenkins://job/app-units/'))
+    with pytest.raises(Exception):
+        build.context
+
+
+def test_head_url():
+    from jenkins_epo.jenkins import Build
+
+    build = Build(Mock(), payload={})
+    assert build.head_url is None
+
+    build = Build(Mock(), payload={'actions': [{'parameters': [{
+        'name': 'YML_NOTIFY_URL',
+        'value': 'http://epo/simple-webhook?head=https://github.com/o/r/pull/1'
+    }]}]})
+    assert 'https://github.com/o/r/pull/1' == build.head_url
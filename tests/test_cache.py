@@ -24,6 +24,40 @@ def test_purge(SETTINGS):
             cache.get('key')
 
 
+def test_touch(SETTINGS):
+    SETTINGS.CACHE_LIFE = 10
+    SETTINGS.REPOSITORIES = 'owner/repository1 owner/repository2'
+
+    from jenkins_epo.cache import MemoryCache
+
+    cache = MemoryCache()
+    cache.touch('missing')
+    with fake_time('2012-12-21 00:00:00 UTC') as time:
+        cache.set('key', 'data')
+        last_seen_date, _ = cache.storage['key']
+
+        time.tick(timedelta(seconds=60))
+        cache.touch('key')
+        assert last_seen_date == cache.storage['key'][0]
+
+        time.tick(timedelta(seconds=200))
+        cache.touch('key')
+        assert last_seen_date < cache.storage['key'][0]
+        assert 'data' == cache.get('key')
+
+
+def test_stats():
+    from jenkins_epo.cache import MemoryCache
+
+    cache = MemoryCache()
+    cache.set('key', 'data')
+    cache.get('key')
+    with pytest.raises(KeyError):
+        cache.get('missing')
+
+    assert dict(hits=1, misses=1) == cache.stats()
+
+
 @patch('jenkins_epo.cache.fcntl')
 @patch('jenkins_epo.cache.shelve.open')
 def test_corruptions(dbopen, fcntl):
@@ -61,3 +95,45 @@ def test_destroy(close, unlink):
 
     assert unlink.mock_calls
     assert close.mock_calls
+
+
+def test_hot_tier():
+    from jenkins_epo.cache import HotTier
+
+    db = MagicMock()
+    db.__getitem__.side_effect = {b'cold': b'a', b'warm': b'b'}.__getitem__
+    db.keys.return_value = [b'cold', b'warm']
+    tier = HotTier(db)
+
+    assert b'b' == tier[b'warm']
+    assert b'b' == tier[b'warm']
+    assert 1 == len(db.__getitem__.mock_calls)
+
+    assert [b'cold', b'warm'] == list(tier.preload())
+    assert {b'cold': b'a', b'warm': b'b'} == tier.hot
+    assert 2 == len(db.__getitem__.mock_calls)
+
+    tier[b'new'] = b'c'
+    assert b'c' == tier[b'new']
+    del tier[b'cold']
+    assert b'cold' not in tier.hot
+    assert db.__delitem__.mock_calls
+
+    tier.close()
+    assert not tier.hot
+    assert db.close.mock_calls
+
+
+@patch('jenkins_epo.cache.fcntl')
+def test_preload(fcntl, SETTINGS, tmpdir):
+    from jenkins_epo.cache import FileCache
+
+    SETTINGS.CACHE_PATH = str(tmpdir.join('cache'))
+    my = FileCache()
+    my.set('key', 'data')
+    my.close()
+
+    my = FileCache()
+    assert ['key'] == list(my.preload())
+    assert 'data' == my.get('key')
+    my.close()
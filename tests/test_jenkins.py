@@ -78,7 +78,7 @@ def test_freestyle_build(mocker, SETTINGS):
     xml.findall.return_value = []
     xml.find.return_value = None
 
-    pr = Mock(url='url://')
+    pr = Mock(url='url://', sha='cafed0d0')
     spec = Mock()
     spec.config = {
         'node': 'slave',
@@ -91,7 +91,9 @@ def test_freestyle_build(mocker, SETTINGS):
     SETTINGS.DRY_RUN = 0
     yield from job.build(pr, spec, 'freestyle')
 
-    assert JENKINS.rest.job().buildWithParameters.apost.mock_calls
+    apost = JENKINS.for_url().rest.job().buildWithParameters.apost
+    _, kwargs = apost.call_args
+    assert 'cafed0d0' == kwargs['YML_SHA']
 
 
 @pytest.mark.asyncio
@@ -118,7 +120,8 @@ def test_freestyle_build_dry(mocker, SETTINGS):
 
     yield from job.build(pr, spec, 'freestyle')
 
-    assert not JENKINS.rest.job().buildWithParameters.apost.mock_calls
+    url = JENKINS.for_url().rest.job().buildWithParameters
+    assert not url.apost.mock_calls
 
 
 def test_freestyle_node_param():
@@ -270,6 +273,60 @@ def test_matrix_list_context_superset(JobSpec):
     assert 2 == len(contexts)
 
 
+def test_matrix_list_context_memoized():
+    from jenkins_yml import Job
+    from jenkins_epo.jenkins import MatrixJob
+
+    api_instance = Mock(spec=['_get_config_element_tree', 'get_params'])
+    api_instance.name = 'matrix'
+    api_instance._data = dict(activeConfigurations=[
+        {'name': 'P=a'}, {'name': 'P=b'},
+    ])
+
+    job = MatrixJob(api_instance)
+    job._node_axis = None
+    job._spec = Job('matrix', dict(axis={}))
+    job.compute_contexts = Mock(wraps=job.compute_contexts)
+
+    spec = Job('matrix', dict(axis={'P': ['a', 'b']}))
+    assert ('matrix/P=a', 'matrix/P=b') == job.list_contexts(spec)
+    assert ('matrix/P=a', 'matrix/P=b') == job.list_contexts(spec)
+    assert 1 == len(job.compute_contexts.mock_calls)
+
+    spec = Job('matrix', dict(axis={'P': ['a']}))
+    assert ('matrix/P=a',) == job.list_contexts(spec)
+    assert 2 == len(job.compute_contexts.mock_calls)
+
+
+def test_combination_filter():
+    from jenkins_epo.jenkins import combination_filter
+
+    assert 'A == "0"' == combination_filter(['A=0'])
+    assert 'A == "0" || A == "1"' == combination_filter(['A=1', 'A=0'])
+    assert (
+        '(A == "0" || A == "1") && (B == "a" || B == "b")' ==
+        combination_filter(['A=0,B=a', 'A=1,B=a', 'A=0,B=b', 'A=1,B=b'])
+    )
+    assert (
+        '(A == "0" && B == "a") || (A == "1" && (B == "b" || B == "c"))' ==
+        combination_filter(['A=0,B=a', 'A=1,B=b', 'A=1,B=c'])
+    )
+
+
+def test_combination_filter_large():
+    from jenkins_epo.jenkins import combination_filter
+
+    names = [
+        'A=%d,B=%d,C=%d' % (a, b, c)
+        for a in range(5) for b in range(10) for c in range(20)
+    ]
+    expression = combination_filter(names)
+
+    assert 1 == expression.count('A == "0"')
+    assert 1 == expression.count('C == "19"')
+    assert expression.count('==') == 5 + 10 + 20
+
+
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_matrix_build(mocker, SETTINGS):
@@ -297,7 +354,7 @@ def test_matrix_build(mocker, SETTINGS):
         Mock(url='url://', fullref='refs/heads/master'), spec, 'matrix',
     )
 
-    assert JENKINS.rest.job().buildWithParameters.mock_calls
+    assert JENKINS.for_url().rest.job().buildWithParameters.mock_calls
 
 
 @pytest.mark.asyncio
@@ -324,7 +381,7 @@ def test_matrix_build_dry(mocker, SETTINGS):
 
     yield from job.build(Mock(url='url://'), spec, 'matrix')
 
-    assert not JENKINS.rest.job().buildWithParameters.mock_calls
+    assert not JENKINS.for_url().rest.job().buildWithParameters.mock_calls
 
 
 @pytest.mark.asyncio
@@ -344,6 +401,7 @@ def test_create_job(mocker, SETTINGS):
 
     spec = Mock(config=dict())
     spec.name = 'job'
+    spec.as_xml.return_value = '<project/>'
 
     SETTINGS.DRY_RUN = 1
     job = yield from JENKINS.create_job(spec)
@@ -360,6 +418,27 @@ def test_create_job(mocker, SETTINGS):
     assert JENKINS.rest.job().api.python.aget.mock_calls
     assert JENKINS.rest.job()().aget.mock_calls
 
+    # A concurrent head does not create the job twice.
+    JENKINS.rest.createItem.apost.reset_mock()
+    job2 = yield from JENKINS.create_job(spec)
+
+    assert job2 is job
+    assert not JENKINS.rest.createItem.apost.mock_calls
+
+    # A changed spec updates the job created meanwhile.
+    job.update = CoroutineMock()
+    spec.as_xml.return_value = '<project><disabled/></project>'
+    job3 = yield from JENKINS.create_job(spec)
+
+    assert job3 is job.update.return_value
+    assert not JENKINS.rest.createItem.apost.mock_calls
+
+    # A job deleted on Jenkins is created again.
+    JENKINS.updates.clear()
+    yield from JENKINS.create_job(spec)
+
+    assert JENKINS.rest.createItem.apost.mock_calls
+
 
 @patch('jenkins_epo.jenkins.JobSpec.from_xml')
 def test_job_managed(from_xml, SETTINGS):
@@ -412,10 +491,13 @@ def test_aget_job_404(mocker, SETTINGS):
         side_effect=HttpProcessingError(code=404)
     )
     my.rest.job()().aget = CoroutineMock()
+    my.updates['name'] = 'fingerprint', Mock()
 
     with pytest.raises(UnknownJob):
         yield from my.aget_job('name')
 
+    assert 'name' not in my.updates
+
 
 @pytest.mark.asyncio
 @asyncio.coroutine
@@ -425,6 +507,7 @@ def test_update_job(mocker, SETTINGS):
         CoroutineMock(),
     )
     rest = mocker.patch('jenkins_epo.jenkins.JENKINS.rest')
+    mocker.patch('jenkins_epo.jenkins.JENKINS.updates', {})
 
     url = rest.job()
     url.api.python.aget = CoroutineMock()
@@ -437,6 +520,7 @@ def test_update_job(mocker, SETTINGS):
 
     spec = Mock(config=dict())
     spec.name = 'job'
+    spec.as_xml.return_value = '<project/>'
 
     job = Job(Mock(_data=dict()))
     new_job = yield from job.update(spec)
@@ -446,6 +530,31 @@ def test_update_job(mocker, SETTINGS):
     new_job = yield from job.update(spec)
     assert new_job is not job
     assert aget_job.mock_calls
+    assert 'fingerprint' in spec.config['description']
+
+    # Same config is not pushed again.
+    url().apost.reset_mock()
+    aget_job.reset_mock()
+    newer_job = yield from job.update(spec)
+    assert newer_job is new_job
+    assert not url().apost.mock_calls
+    assert not aget_job.mock_calls
+
+
+def test_job_fingerprint():
+    from jenkins_epo.jenkins import Job
+
+    job = Job(Mock(_data=dict(description="""\
+Description
+
+<!--
+epo:
+  fingerprint: 0123abcd
+  updated_at: 2017-01-01 00:00:00
+-->
+""")))
+
+    assert '0123abcd' == job.fingerprint
 
 
 @pytest.mark.asyncio
@@ -486,7 +595,9 @@ epo:
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_from_url_removes_suffix(mocker, SETTINGS):
+    from jenkins_epo.cache import MemoryCache
     from jenkins_epo.jenkins import Build
+    mocker.patch('jenkins_epo.jenkins.CACHE', MemoryCache())
     Client = mocker.patch('jenkins_epo.jenkins.rest.Client')
     Client().api.python.aget = aget = CoroutineMock(
         return_value={}
@@ -501,3 +612,335 @@ def test_from_url_removes_suffix(mocker, SETTINGS):
     assert build.job is None
     assert build.payload == {}
     assert Client.mock_calls[1] == mocker.call(correct_url)
+
+
+def test_queue_tracker_track():
+    from jenkins_epo.jenkins import QueueTracker
+
+    tracker = QueueTracker()
+    tracker.track(None, Mock(), ['job'])
+    tracker.track('jenkins://job/job/', Mock(), ['job'])
+    assert not tracker.items
+
+    tracker.track('jenkins://queue/item/12/', Mock(), ['job'])
+    assert ('jenkins://', 12) in tracker.items
+
+
+def test_queue_tracker_target_url():
+    from jenkins_epo.jenkins import QueueTracker
+
+    executable = dict(number=3, url='jenkins://job/matrix/3/')
+    url = QueueTracker.target_url(executable, 'matrix')
+    assert 'jenkins://job/matrix/3/' == url
+    url = QueueTracker.target_url(executable, 'matrix/A=1,B=2')
+    assert 'jenkins://job/matrix/A=1,B=2/3/' == url
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_queue_tracker_poll(mocker, SETTINGS):
+    JENKINS = mocker.patch('jenkins_epo.jenkins.JENKINS')
+    Client = mocker.patch('jenkins_epo.jenkins.rest.Client')
+    from jenkins_epo.jenkins import QueueTracker
+
+    JENKINS.for_url.return_value = None
+    Client().queue.api.python.aget = CoroutineMock(return_value=dict(
+        items=[
+            dict(id=1, stuck=False),
+            dict(id=2, stuck=True, why='No node'),
+        ],
+    ))
+    Client().api.python.aget = CoroutineMock(side_effect=[
+        dict(executable=dict(number=4, url='jenkins://job/job/4/')),
+        dict(cancelled=True),
+        dict(id=5),
+    ])
+
+    tracker = QueueTracker()
+    commit = Mock()
+    commit.maybe_update_status = CoroutineMock()
+    for id_ in range(1, 6):
+        tracker.track('jenkins://queue/item/%d/' % id_, commit, ['job'])
+
+    yield from tracker.poll()
+
+    assert ('jenkins://', 2) in tracker.stuck
+    # 1 and 2 are queued, 5 is leaving the queue.
+    assert [1, 2, 5] == sorted(id_ for _, id_ in tracker.items)
+    assert 2 == len(commit.maybe_update_status.mock_calls)
+    calls = commit.maybe_update_status.mock_calls
+    started, cancelled = [c[1][0] for c in calls]
+    assert 'jenkins://job/job/4/' == started['target_url']
+    assert 'error' == cancelled['state']
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_queue_item(mocker, SETTINGS):
+    JENKINS = mocker.patch('jenkins_epo.jenkins.JENKINS')
+    from aiohttp.errors import HttpProcessingError
+    from jenkins_epo.jenkins import QueueItem
+
+    item = QueueItem(dict(
+        id=12, inQueueSince=0, task=dict(name='job'), actions=[],
+    ))
+    assert 'job' == item.job_name
+    assert 1970 == item.queued_at.year
+    assert item.head_url is None
+    assert item.sha is None
+    assert str(item)
+    assert repr(item)
+
+    JENKINS.rest.queue.cancelItem.apost = CoroutineMock(
+        side_effect=HttpProcessingError(code=404),
+    )
+    yield from item.cancel()
+
+    JENKINS.rest.queue.cancelItem.apost.side_effect = HttpProcessingError(
+        code=500,
+    )
+    with pytest.raises(HttpProcessingError):
+        yield from item.cancel()
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_fetch_queue_shared(mocker):
+    mocker.patch('jenkins_epo.jenkins.LazyJenkins.load')
+    from jenkins_epo.jenkins import LazyJenkins
+
+    jenkins = LazyJenkins(url='http://jenkins.lan/')
+    jenkins.rest = Mock()
+    jenkins.rest.queue.api.python.aget = aget = CoroutineMock(
+        return_value=dict(items=[
+            dict(id=1, inQueueSince=0, task=dict(name='job'), actions=[]),
+        ]),
+    )
+
+    items = yield from asyncio.gather(
+        jenkins.fetch_queue(), jenkins.fetch_queue(),
+    )
+
+    assert items[0] is items[1]
+    assert 1 == items[0][0].id
+    assert 1 == len(aget.mock_calls)
+    assert 'tree' in aget.call_args[1]
+
+
+def test_dispatcher_label():
+    from jenkins_epo.jenkins import Dispatcher
+
+    assert Dispatcher.label(Mock(config=dict())) is None
+    assert 'a' == Dispatcher.label(Mock(config=dict(node='a')))
+    assert 'b' == Dispatcher.label(Mock(config=dict(merged_nodes=['c', 'b'])))
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_dispatcher_admit(mocker, SETTINGS):
+    JENKINS = mocker.patch('jenkins_epo.jenkins.JENKINS')
+    from jenkins_epo.jenkins import Dispatcher
+
+    SETTINGS.LABEL_QUEUE_MAX = 1
+    SETTINGS.REPOSITORY_QUOTA = 0
+    JENKINS.rest.computer.api.python.aget = CoroutineMock(return_value=dict(
+        computer=[
+            dict(
+                offline=False,
+                assignedLabels=[dict(name='slave1'), dict(name='docker')],
+                executors=[dict(idle=True), dict(idle=True)],
+            ),
+            dict(
+                offline=True,
+                assignedLabels=[dict(name='slave2'), dict(name='docker')],
+                executors=[dict(idle=True)],
+            ),
+        ],
+    ))
+
+    JENKINS.rest.queue.api.python.aget = CoroutineMock(
+        return_value=dict(items=[]),
+    )
+
+    dispatcher = Dispatcher()
+    spec = Mock(config=dict(node='docker'))
+
+    admitted = yield from dispatcher.admit('owner/repo1', spec, 2)
+    assert 2 == admitted
+    admitted = yield from dispatcher.admit('owner/repo2', spec, 2)
+    assert 1 == admitted
+    admitted = yield from dispatcher.admit('owner/repo2', spec, 2)
+    assert 0 == admitted
+    assert 1 == len(JENKINS.rest.computer.api.python.aget.mock_calls)
+
+    # Unknown label is left to Jenkins.
+    spec = Mock(config=dict(node='slave2'))
+    admitted = yield from dispatcher.admit('owner/repo2', spec, 2)
+    assert 2 == admitted
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_dispatcher_quota(mocker, SETTINGS):
+    JENKINS = mocker.patch('jenkins_epo.jenkins.JENKINS')
+    from jenkins_epo.jenkins import Dispatcher
+
+    SETTINGS.LABEL_QUEUE_MAX = 0
+    SETTINGS.REPOSITORY_QUOTA = 1
+    JENKINS.rest.computer.api.python.aget = CoroutineMock(return_value=dict(
+        computer=[dict(
+            assignedLabels=[dict(name='master')],
+            executors=[dict(idle=True)] * 4,
+        )],
+    ))
+
+    JENKINS.rest.queue.api.python.aget = CoroutineMock(
+        return_value=dict(items=[]),
+    )
+
+    dispatcher = Dispatcher()
+    spec = Mock(config=dict(node='master'))
+
+    admitted = yield from dispatcher.admit('owner/repo1', spec, 4)
+    assert 1 == admitted
+    admitted = yield from dispatcher.admit('owner/repo2', spec, 4)
+    assert 1 == admitted
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_dispatcher_queue(mocker, SETTINGS):
+    JENKINS = mocker.patch('jenkins_epo.jenkins.JENKINS')
+    from jenkins_epo.jenkins import Dispatcher
+
+    SETTINGS.LABEL_QUEUE_MAX = 0
+    SETTINGS.REPOSITORY_QUOTA = 2
+    SETTINGS.QUEUE_MAX = 2
+    JENKINS.rest.computer.api.python.aget = CoroutineMock(return_value=dict(
+        computer=[dict(
+            assignedLabels=[dict(name='docker')],
+            executors=[dict(idle=True)] * 4,
+        )],
+    ))
+    JENKINS.rest.queue.api.python.aget = CoroutineMock(return_value=dict(
+        items=[],
+    ))
+
+    dispatcher = Dispatcher()
+    spec = Mock(config=dict(node='docker'))
+    spec.name = 'app'
+    admitted = yield from dispatcher.admit('owner/repo', spec, 2)
+    assert 2 == admitted
+
+    # Builds still queued consume capacity after next listing.
+    JENKINS.rest.queue.api.python.aget.return_value = dict(items=[
+        dict(stuck=False, task=dict(name='app')),
+        dict(stuck=False, task=dict(name='app')),
+        dict(stuck=False, task=dict(name='other')),
+        dict(stuck=True, task=dict(name='stuck')),
+    ])
+    dispatcher.masters[JENKINS.url].refreshed_at = 0
+    admitted = yield from dispatcher.admit('owner/repo', spec, 2)
+    assert 0 == admitted
+    admitted = yield from dispatcher.admit('owner/other', spec, 4)
+    assert 2 == admitted
+
+    # Unknown labels wait for Jenkins queue to shrink under QUEUE_MAX.
+    spec = Mock(config=dict(node='windows'))
+    admitted = yield from dispatcher.admit('owner/repo', spec, 1)
+    assert 0 == admitted
+
+
+def test_masters_for_url(SETTINGS):
+    from jenkins_epo.jenkins import JenkinsMasters
+
+    SETTINGS.JENKINS_URL = 'http://jenkins1.lan, http://jenkins2.lan/ci/'
+    masters = JenkinsMasters()
+
+    assert 'http://jenkins1.lan/' == masters.default.url
+    assert 2 == len(list(masters))
+    master = masters.for_url('http://jenkins2.lan/ci/job/app/1/')
+    assert 'http://jenkins2.lan/ci/' == master.url
+    assert masters.for_url('http://jenkins2.lan/ci') is master
+    assert masters.for_url('http://jenkins3.lan/job/app/1/') is None
+
+    SETTINGS.JENKINS_URL = ''
+    assert masters.for_url('http://jenkins3.lan/job/app/1/') is masters.default
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_masters_for_job(mocker, SETTINGS):
+    mocker.patch('jenkins_epo.jenkins.LazyJenkins.load')
+    from jenkins_epo.jenkins import JenkinsMasters
+
+    SETTINGS.JENKINS_URL = 'http://jenkins1.lan'
+    masters = JenkinsMasters()
+    master = yield from masters.for_job('app')
+    assert master is masters.default
+
+    SETTINGS.JENKINS_URL = 'http://jenkins1.lan,http://jenkins2.lan'
+    jenkins1, jenkins2 = list(masters)
+    for master in masters:
+        master.rest = Mock()
+    jenkins1.rest.job().api.python.aget = CoroutineMock(
+        side_effect=Exception('404'),
+    )
+    jenkins2.rest.job().api.python.aget = CoroutineMock()
+
+    master = yield from masters.for_job('app')
+    assert master is jenkins2
+
+    jenkins1.updates['app'] = 'fingerprint', Mock()
+    master = yield from masters.for_job('app')
+    assert master is jenkins1
+
+    masters.for_repository = CoroutineMock(return_value=jenkins2)
+    master = yield from masters.for_job('app', 'owner/repo')
+    assert master is jenkins2
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_masters_placement(mocker, SETTINGS):
+    CACHE = mocker.patch('jenkins_epo.jenkins.CACHE')
+    CACHE.get.side_effect = KeyError('miss')
+    from jenkins_epo.jenkins import JenkinsMasters
+
+    SETTINGS.JENKINS_URL = 'http://jenkins1.lan,http://jenkins2.lan'
+    SETTINGS.JENKINS_RULES = 'owner/pinned*=http://jenkins1.lan'
+    masters = JenkinsMasters()
+    jenkins1, jenkins2 = list(masters)
+    jenkins1.fetch_load = CoroutineMock(return_value=4)
+    jenkins2.fetch_load = CoroutineMock(return_value=-2)
+
+    master = yield from masters.for_repository('owner/pinned')
+    assert master is jenkins1
+    assert not jenkins1.fetch_load.mock_calls
+
+    master = yield from masters.for_repository('owner/repo')
+    assert master is jenkins2
+    assert CACHE.set.mock_calls
+
+    # Placement is sticky.
+    jenkins2.fetch_load.return_value = 10
+    master = yield from masters.for_repository('owner/repo')
+    assert master is jenkins2
+    assert 1 == len(jenkins2.fetch_load.mock_calls)
+    CACHE.touch.assert_called_once_with('jenkins_master_owner/repo')
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_masters_fetch_queue(SETTINGS):
+    from jenkins_epo.jenkins import JenkinsMasters
+
+    SETTINGS.JENKINS_URL = 'http://jenkins1.lan,http://jenkins2.lan'
+    masters = JenkinsMasters()
+    jenkins1, jenkins2 = list(masters)
+    jenkins1.fetch_queue = CoroutineMock(return_value=[1])
+    jenkins2.fetch_queue = CoroutineMock(return_value=[2, 3])
+
+    items = yield from masters.fetch_queue()
+
+    assert [1, 2, 3] == items
@@ -0,0 +1,75 @@
+from unittest.mock import Mock
+
+
+def test_qualify():
+    from jenkins_epo.journal import qualify, resolve
+    from jenkins_epo.procedures import process_url
+
+    assert 'jenkins_epo.procedures:process_url' == qualify(process_url)
+    assert resolve(qualify(process_url)) is process_url
+    assert qualify(Mock()) is None
+    assert qualify(lambda: None) is None
+
+
+def test_replay(tmpdir):
+    from jenkins_epo.journal import Journal
+    from jenkins_epo.procedures import process_url
+    from jenkins_epo.tasks import ProcessUrlTask
+
+    path = str(tmpdir.join('journal'))
+    journal = Journal(path)
+    assert [] == journal.open()
+
+    url = 'https://github.com/owner/repo/tree/master'
+    done = ProcessUrlTask(('10-webhook', url), url, process_url)
+    pending = ProcessUrlTask(('10-webhook', url + '2'), url + '2', process_url)
+    untracked = ProcessUrlTask(('10-webhook', url), url, Mock())
+    for task in done, pending, untracked:
+        journal.put(task)
+    journal.done(done)
+    journal.done(untracked)
+    journal.close()
+
+    with open(path, 'a') as fo:
+        fo.write('{"op": "put", "id"')  # Crashed while writing.
+
+    journal = Journal(path)
+    tasks = journal.open()
+    journal.close()
+
+    assert 1 == len(tasks)
+    task, = tasks
+    assert ('10-webhook', url + '2') == task.priority
+    assert url + '2' == task.url
+    assert process_url is task.callable_
+    assert pending.journal_id == task.journal_id
+    assert 2 == journal.next_id
+    with open(path) as fo:
+        assert 1 == len(fo.readlines())
+
+
+def test_compact(tmpdir):
+    from jenkins_epo.journal import Journal
+
+    path = str(tmpdir.join('journal'))
+    journal = Journal(path, compact_threshold=4)
+    journal.open()
+
+    task = Mock(journal_id=None)
+    task.as_journal.return_value = dict(task='unknown:Task')
+    for i in range(3):
+        task.journal_id = None
+        journal.put(task)
+        journal.done(task)
+
+    assert 0 == journal.lines
+    journal.close()
+    with open(path) as fo:
+        assert '' == fo.read()
+
+    # Unknown task is dropped on replay.
+    journal = Journal(path)
+    journal.open()
+    journal.put(task)
+    journal.close()
+    assert [] == Journal(path).open()
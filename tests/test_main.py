@@ -84,6 +84,24 @@ def test_bot(mocker):
     assert run_app.mock_calls
 
 
+def test_bot_watchdog(mocker, SETTINGS):
+    mocker.patch('jenkins_epo.main.asyncio.get_event_loop')
+    mocker.patch('jenkins_epo.main.run_app')
+    mocker.patch('jenkins_epo.main.procedures')
+    WORKERS = mocker.patch('jenkins_epo.main.WORKERS')
+    WORKERS.start = CoroutineMock()
+    WATCHDOG = mocker.patch('jenkins_epo.main.WATCHDOG')
+
+    from jenkins_epo.main import bot
+
+    # As run by worker processes.
+    SETTINGS.SHARD = '0/2'
+    SETTINGS.LOOP_LAG_THRESHOLD = '0.25'
+    bot()
+
+    assert WATCHDOG.run.mock_calls
+
+
 @pytest.mark.asyncio
 def test_list_heads(mocker):
     procedures = mocker.patch('jenkins_epo.main.procedures')
@@ -182,3 +200,44 @@ def test_register_failure(mocker, SETTINGS, WORKERS):
     assert WORKERS.start.mock_calls
     assert register_webhook.mock_calls
     assert WORKERS.terminate.mock_calls
+
+
+def test_trace_summary_missing_path(SETTINGS):
+    SETTINGS.TRACE_PATH = ''
+
+    from jenkins_epo.main import trace_summary
+
+    with pytest.raises(SystemExit):
+        trace_summary()
+
+
+def test_trace_summary(mocker, SETTINGS, capsys):
+    SETTINGS.TRACE_PATH = 'trace.log'
+    read = mocker.patch('jenkins_epo.main.tracing.read')
+    read.return_value = [
+        dict(name='head', start=0, duration=30, url='https://github.com/o/r'),
+        dict(
+            name='extension', start=0, duration=20,
+            extension='jenkins-builder', step='run',
+        ),
+    ]
+
+    from jenkins_epo.main import trace_summary
+
+    trace_summary()
+
+    out, _ = capsys.readouterr()
+    assert 'jenkins-builder.run' in out
+    assert 'https://github.com/o/r' in out
+
+
+def test_trace_summary_cli(mocker, SETTINGS):
+    SETTINGS.TRACE_PATH = ''
+    read = mocker.patch('jenkins_epo.main.tracing.read')
+    read.return_value = []
+
+    from jenkins_epo.main import main
+
+    main(argv=['trace-summary', '--path', 'trace.log'])
+
+    read.assert_called_once_with('trace.log')
@@ -0,0 +1,71 @@
+def test_counter():
+    from jenkins_epo.metrics import Registry
+
+    registry = Registry()
+    counter = registry.counter('tasks_total', "Tasks.", ['task'])
+    counter.inc(task='Process"Task')
+    counter.inc(2, task='Process"Task')
+
+    assert 3 == counter.get(task='Process"Task')
+    assert registry.render().splitlines() == [
+        '# HELP tasks_total Tasks.',
+        '# TYPE tasks_total counter',
+        'tasks_total{task="Process\\"Task"} 3',
+    ]
+
+
+def test_gauge():
+    from jenkins_epo.metrics import Registry
+
+    registry = Registry()
+    value = [None]
+    registry.gauge('depth', "Depth.", lambda: value[0])
+
+    assert 2 == len(registry.render().splitlines())
+    value[0] = 4
+    assert 'depth 4' in registry.render().splitlines()
+
+
+def test_histogram():
+    from jenkins_epo.metrics import Registry
+
+    registry = Registry()
+    histogram = registry.histogram(
+        'duration_seconds', "Duration.", ['step'], buckets=(1, 5),
+    )
+    histogram.observe(.5, step='run')
+    histogram.observe(1, step='run')
+    histogram.observe(10, step='run')
+    with histogram.time(step='begin'):
+        pass
+
+    lines = registry.render().splitlines()
+    assert 'duration_seconds_bucket{step="run",le="1"} 2' in lines
+    assert 'duration_seconds_bucket{step="run",le="5"} 2' in lines
+    assert 'duration_seconds_bucket{step="run",le="+Inf"} 3' in lines
+    assert 'duration_seconds_sum{step="run"} 11.5' in lines
+    assert 'duration_seconds_count{step="run"} 3' in lines
+    assert 'duration_seconds_count{step="begin"} 1' in lines
+
+
+def test_merge():
+    from jenkins_epo.metrics import Registry, merge
+
+    registry = Registry()
+    counter = registry.counter('tasks_total', "Tasks.", ['task'])
+    registry.gauge('depth', "Depth.", lambda: 2)
+    counter.inc(task='Poll')
+    first = registry.render()
+    counter.inc(task='Poll')
+    second = registry.render()
+
+    assert merge([('0', first), ('1', second)], 'process').splitlines() == [
+        '# HELP tasks_total Tasks.',
+        '# TYPE tasks_total counter',
+        'tasks_total{task="Poll",process="0"} 1',
+        'tasks_total{task="Poll",process="1"} 2',
+        '# HELP depth Depth.',
+        '# TYPE depth gauge',
+        'depth{process="0"} 2',
+        'depth{process="1"} 2',
+    ]
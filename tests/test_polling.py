@@ -0,0 +1,127 @@
+import asyncio
+from concurrent.futures import Future
+
+from asynctest import CoroutineMock, Mock
+import pytest
+
+
+def test_wheel():
+    from jenkins_epo.polling import TimerWheel
+
+    wheel = TimerWheel(tick=5, size=4)
+    wheel.schedule(0, 'first')
+    wheel.schedule(10, 'second')
+    wheel.schedule(30, 'late')
+
+    assert 3 == len(wheel)
+    assert ['first'] == wheel.advance()
+    assert ['second'] == wheel.advance()
+    assert [] == wheel.advance()
+    assert [] == wheel.advance()
+    assert [] == wheel.advance()
+    assert ['late'] == wheel.advance()
+    assert 0 == len(wheel)
+
+
+def test_observe(SETTINGS):
+    from jenkins_epo.polling import PollScheduler
+
+    SETTINGS.POLL_INTERVAL = 600
+    SETTINGS.POLL_INTERVAL_MIN = 200
+    SETTINGS.POLL_INTERVAL_MAX = 1000
+    scheduler = PollScheduler(Mock())
+
+    def heads(sha):
+        return [Mock(url='https://github.com/owner/repo/tree/master', sha=sha)]
+
+    assert 600 == scheduler.observe('owner/repo', heads('a'))
+    assert 300 == scheduler.observe('owner/repo', heads('b'))
+    assert 200 == scheduler.observe('owner/repo', heads('c'))
+    assert 300 == scheduler.observe('owner/repo', heads('c'))
+    assert 450 == scheduler.observe('owner/repo', heads('c'))
+    assert 675 == scheduler.observe('owner/repo', heads('c'))
+    assert 1000 == scheduler.observe('owner/repo', heads('c'))
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_poll_repository(mocker, SETTINGS, WORKERS):
+    mocker.patch('jenkins_epo.polling.WORKERS', WORKERS)
+    from jenkins_epo.polling import PollScheduler
+
+    SETTINGS.POLL_INTERVAL = 600
+    queuer = Future()
+    queuer.set_result([Mock(url='url', sha='a')])
+    poller = Future()
+    poller.set_result(queuer)
+    WORKERS.enqueue = CoroutineMock(return_value=poller)
+
+    scheduler = PollScheduler(Mock())
+    yield from scheduler.poll_repository('owner/repo')
+
+    assert WORKERS.enqueue.mock_calls
+    assert 'owner/repo' in scheduler.repositories
+    assert 1 == len(scheduler.wheel)
+
+    WORKERS.enqueue = CoroutineMock(side_effect=Exception('Down'))
+    yield from scheduler.poll_repository('owner/repo')
+
+    assert 2 == len(scheduler.wheel)
+
+
+def test_stagger(SETTINGS):
+    from jenkins_epo.polling import PollScheduler
+
+    SETTINGS.POLL_STARTUP_WINDOW = 40
+    scheduler = PollScheduler(Mock())
+    scheduler.wheel.tick = 5
+    scheduler.stagger(['owner/repo%d' % i for i in range(4)])
+
+    assert ['owner/repo0'] == scheduler.wheel.advance()
+    assert ['owner/repo1'] == scheduler.wheel.advance()
+    assert [] == scheduler.wheel.advance()
+    assert ['owner/repo2'] == scheduler.wheel.advance()
+    assert [] == scheduler.wheel.advance()
+    assert ['owner/repo3'] == scheduler.wheel.advance()
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_preload(mocker):
+    CACHE = mocker.patch('jenkins_epo.polling.CACHE')
+    CACHE.preload.return_value = ['key%d' % i for i in range(5)]
+    switch_coro = mocker.patch(
+        'jenkins_epo.polling.switch_coro', CoroutineMock(),
+    )
+    from jenkins_epo.polling import PollScheduler
+
+    scheduler = PollScheduler(Mock())
+    yield from scheduler.preload(batch=2)
+
+    assert 2 == len(switch_coro.mock_calls)
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_run(mocker, SETTINGS, event_loop):
+    SETTINGS.POLL_INTERVAL = 0
+    SETTINGS.POLL_STARTUP_WINDOW = 0
+    mocker.patch(
+        'jenkins_epo.polling.REPOSITORIES', ['owner/repo1', 'owner/repo2'],
+    )
+    CACHE = mocker.patch('jenkins_epo.polling.CACHE')
+    CACHE.preload.return_value = []
+    mocker.patch('jenkins_epo.polling.WORKERS')
+    asyncio_ = mocker.patch('jenkins_epo.polling.asyncio')
+    asyncio_.get_event_loop.return_value = event_loop
+    asyncio_.sleep = sleep = CoroutineMock(side_effect=[None, ValueError()])
+    from jenkins_epo.polling import PollScheduler
+
+    scheduler = PollScheduler(Mock())
+    scheduler.poll_repository = CoroutineMock()
+
+    with pytest.raises(ValueError):
+        yield from scheduler.run()
+
+    assert 2 == len(scheduler.poll_repository.mock_calls)
+    assert sleep.mock_calls
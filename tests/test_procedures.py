@@ -7,22 +7,16 @@ import pytest
 
 @pytest.mark.asyncio
 @asyncio.coroutine
-def test_poll(mocker, SETTINGS, WORKERS):
-    SETTINGS.REPOSITORIES = 'owner/repo'
-    mocker.patch('jenkins_epo.procedures.WORKERS', WORKERS)
+def test_poll(mocker, SETTINGS):
     whoami = mocker.patch('jenkins_epo.procedures.whoami', CoroutineMock())
-    asyncio = mocker.patch('jenkins_epo.procedures.asyncio')
-    asyncio.sleep = CoroutineMock()
-
-    WORKERS.queue.join.side_effect = [None, ValueError()]
+    PollScheduler = mocker.patch('jenkins_epo.procedures.PollScheduler')
+    PollScheduler.return_value.run = CoroutineMock()
     from jenkins_epo.procedures import poll
 
-    with pytest.raises(ValueError):
-        yield from poll()
+    yield from poll()
 
     assert whoami.mock_calls
-    assert asyncio.sleep.mock_calls
-    assert WORKERS.queue.join.mock_calls
+    assert PollScheduler.return_value.run.mock_calls
 
 
 def test_task_factory():
@@ -131,58 +125,150 @@ def test_process_url_repo_denied(mocker, SETTINGS):
 
 @pytest.mark.asyncio
 @asyncio.coroutine
-def test_process_url_exclusive(mocker, SETTINGS, event_loop):
+def test_process_url_unmanaged(mocker, SETTINGS, event_loop):
     REPOSITORIES = mocker.patch(
         'jenkins_epo.procedures.REPOSITORIES', MagicMock()
     )
-    REPOSITORIES.__contains__.return_value = True
+    REPOSITORIES.__contains__.return_value = False
     Bot = mocker.patch('jenkins_epo.procedures.Bot')
     from_url = mocker.patch(
         'jenkins_epo.procedures.Head.from_url', CoroutineMock()
     )
 
-    from jenkins_epo.procedures import process_url, _task_map
+    from jenkins_epo.procedures import process_url
 
     bot = Bot.return_value
     bot.run = CoroutineMock()
     head = from_url.return_value
     head.url = 'url://test_process_url_exclusive'
-    head.sha = 'cafed0d0'
     head.repository.load_settings = CoroutineMock()
 
-    _task_map[head.url] = running = Mock()
-    running.done.return_value = False
-
     yield from process_url(head.url, throttle=False)
 
-    assert running.cancel.mock_calls
-    assert bot.run.mock_calls
+    assert not head.repository.load_settings.mock_calls
+    assert not bot.run.mock_calls
 
 
 @pytest.mark.asyncio
 @asyncio.coroutine
-def test_process_url_unmanaged(mocker, SETTINGS, event_loop):
+def test_process_build_success(mocker, SETTINGS, WORKERS):
+    mocker.patch('jenkins_epo.procedures.WORKERS', WORKERS)
+    REPOSITORIES = mocker.patch(
+        'jenkins_epo.procedures.REPOSITORIES', MagicMock()
+    )
+    REPOSITORIES.__contains__.return_value = True
+    from_url = mocker.patch(
+        'jenkins_epo.jenkins.Build.from_url', CoroutineMock()
+    )
+    Commit = mocker.patch('jenkins_epo.procedures.Commit')
+
+    from jenkins_epo.procedures import process_build
+
+    build = from_url.return_value
+    build.head_url = 'https://github.com/owner/name/pull/1'
+    build.context = 'app-units'
+    build.commit_status = dict(state='success', description='Success!')
+    commit = Commit.return_value
+    commit.push_status = CoroutineMock()
+
+    yield from process_build('jenkins://job/app-units/1/')
+
+    from_url.assert_called_once_with('jenkins://job/app-units/1/', fresh=True)
+    assert commit.push_status.mock_calls
+    assert WORKERS.enqueue.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_process_build_failure(mocker, SETTINGS, WORKERS):
+    mocker.patch('jenkins_epo.procedures.WORKERS', WORKERS)
+    REPOSITORIES = mocker.patch(
+        'jenkins_epo.procedures.REPOSITORIES', MagicMock()
+    )
+    REPOSITORIES.__contains__.return_value = True
+    from_url = mocker.patch(
+        'jenkins_epo.jenkins.Build.from_url', CoroutineMock()
+    )
+    Commit = mocker.patch('jenkins_epo.procedures.Commit')
+
+    from jenkins_epo.procedures import process_build
+
+    build = from_url.return_value
+    build.head_url = 'https://github.com/owner/name/pull/1'
+    build.context = 'app-units'
+    build.commit_status = dict(state='failure', description='Failed!')
+    commit = Commit.return_value
+    commit.push_status = CoroutineMock()
+
+    yield from process_build('jenkins://job/app-units/1/')
+
+    assert commit.push_status.mock_calls
+    assert not WORKERS.enqueue.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_process_build_skip(mocker, SETTINGS, WORKERS):
+    mocker.patch('jenkins_epo.procedures.WORKERS', WORKERS)
     REPOSITORIES = mocker.patch(
         'jenkins_epo.procedures.REPOSITORIES', MagicMock()
     )
     REPOSITORIES.__contains__.return_value = False
-    Bot = mocker.patch('jenkins_epo.procedures.Bot')
     from_url = mocker.patch(
-        'jenkins_epo.procedures.Head.from_url', CoroutineMock()
+        'jenkins_epo.jenkins.Build.from_url', CoroutineMock()
     )
 
-    from jenkins_epo.procedures import process_url
+    from jenkins_epo.procedures import process_build
 
-    bot = Bot.return_value
-    bot.run = CoroutineMock()
-    head = from_url.return_value
-    head.url = 'url://test_process_url_exclusive'
-    head.repository.load_settings = CoroutineMock()
+    build = from_url.return_value
+    build.head_url = None
+    yield from process_build('jenkins://job/app-units/1/')
 
-    yield from process_url(head.url, throttle=False)
+    build.head_url = 'https://github.com/owner/name/pull/1'
+    yield from process_build('jenkins://job/app-units/1/')
 
-    assert not head.repository.load_settings.mock_calls
-    assert not bot.run.mock_calls
+    assert not WORKERS.enqueue.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_reconcile_jobs(mocker):
+    Bot = mocker.patch('jenkins_epo.procedures.Bot')
+    GITHUB = mocker.patch('jenkins_epo.procedures.GITHUB')
+    GITHUB.fetch_file_contents = CoroutineMock(return_value='job: build')
+
+    from jenkins_epo.procedures import reconcile_jobs
+
+    jobs_ext = Mock()
+    jobs_ext.reconcile = CoroutineMock()
+    yaml_ext = Mock()
+    Bot.return_value.extensions_map = {
+        'jenkins-createjobs': jobs_ext, 'yaml': yaml_ext,
+    }
+    repository = Mock()
+
+    yield from reconcile_jobs(repository)
+
+    assert yaml_ext.list_job_specs.mock_calls
+    jobs_ext.reconcile.assert_called_once_with(
+        repository, yaml_ext.list_job_specs.return_value,
+    )
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_reconcile_jobs_disabled(mocker):
+    Bot = mocker.patch('jenkins_epo.procedures.Bot')
+    GITHUB = mocker.patch('jenkins_epo.procedures.GITHUB')
+    GITHUB.fetch_file_contents = CoroutineMock()
+
+    from jenkins_epo.procedures import reconcile_jobs
+
+    Bot.return_value.extensions_map = {}
+
+    yield from reconcile_jobs(Mock())
+
+    assert not GITHUB.fetch_file_contents.mock_calls
 
 
 @pytest.mark.asyncio
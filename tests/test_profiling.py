@@ -0,0 +1,68 @@
+from unittest.mock import Mock
+
+
+def test_aggregate():
+    from jenkins_epo.profiling import ExtensionProfiler
+
+    profiler = ExtensionProfiler()
+    bot = Mock()
+    builder = Mock(stage='30')
+    builder.name = 'builder'
+    merger = Mock(stage='90')
+    merger.name = 'merger'
+
+    profiler.start(bot)
+    profiler.pre(bot, merger, 'run')
+    profiler.post(bot, merger, 'run', 1., 3)
+    profiler.post(bot, builder, 'run', 2., 1)
+    profiler.post(bot, builder, 'run', 4., 2)
+    profiler.post(bot, builder, 'begin', 0., 0)
+    profiler.finish(bot)
+
+    report = profiler.report()
+    assert ['builder', 'builder', 'merger'] == [
+        r['extension'] for r in report
+    ]
+    assert 'begin' == report[0]['step']
+    builder_run = report[1]
+    assert 2 == builder_run['count']
+    assert 6. == builder_run['wall']
+    assert 4. == builder_run['max']
+    assert 3. == builder_run['mean']
+    assert 3 == builder_run['calls']
+    assert not profiler.profiles
+
+
+def test_sampling(SETTINGS, tmpdir):
+    from jenkins_epo.profiling import ExtensionProfiler
+
+    SETTINGS.PROFILE_SAMPLING = 2
+    profiler = ExtensionProfiler()
+    ext = Mock(stage='50')
+    ext.name = 'ext'
+
+    sampled, other = Mock(), Mock()
+    profiler.start(sampled)
+    profiler.start(other)
+    assert profiler.sampled is sampled
+
+    profiler.pre(other, ext, 'run')
+    assert not profiler.profile
+    profiler.pre(sampled, ext, 'run')
+    assert profiler.profile
+    sum(range(1000))
+    profiler.post(sampled, ext, 'run', 1., 0)
+    assert not profiler.profile
+    assert 'ext' in profiler.profiles
+
+    profiler.finish(other)
+    assert profiler.sampled is sampled
+    profiler.finish(sampled)
+    assert profiler.sampled is None
+
+    SETTINGS.PROFILE_PATH = str(tmpdir.join('profiles'))
+    profiler.start(other)
+    assert profiler.sampled is None
+    profiler.start(sampled)
+    profiler.finish(sampled)
+    assert tmpdir.join('profiles', 'ext.prof').check()
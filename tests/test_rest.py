@@ -13,6 +13,15 @@ def test_repr():
     assert '/path/subpath' in repr(client)
 
 
+def test_service():
+    from jenkins_epo.rest import Client
+
+    client = Client('http://127.0.0.1:2820/', service='shard')
+    assert 'shard' == client('stats').service
+    assert 'shard' == client.metrics.service
+    assert 'jenkins' == Client().service
+
+
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_get(mocker):
@@ -0,0 +1,144 @@
+from collections import Counter
+
+from asynctest import CoroutineMock, Mock
+import pytest
+
+
+def test_ring_consistent():
+    from jenkins_epo.shards import Shards
+
+    qualnames = ['owner/repo%d' % i for i in range(200)]
+    shards = Shards()
+    shards.setup_ring(4)
+    owners = {q: shards.owner(q) for q in qualnames}
+    counts = Counter(owners.values())
+    assert {0, 1, 2, 3} == set(counts)
+    assert min(counts.values()) > 20
+
+    shards.setup_ring(5)
+    moved = [q for q in qualnames if shards.owner(q) != owners[q]]
+    # Only repositories moving to the new process change owner.
+    assert len(moved) < 100
+    assert {4} == {shards.owner(q) for q in moved}
+
+
+def test_owns(SETTINGS):
+    from jenkins_epo.shards import Shards
+
+    shards = Shards()
+    assert shards.owns('owner/repo')
+    assert not shards.frontend
+
+    SETTINGS.SHARD = '1/2'
+    owner = shards.owner('owner/repo')
+    assert (owner == 1) == shards.owns('owner/repo')
+    assert not shards.frontend
+
+
+def test_environ(SETTINGS):
+    from jenkins_epo.shards import Shards
+
+    SETTINGS.PORT = 2819
+    SETTINGS.CACHE_PATH = '.epo-cache'
+    SETTINGS.QUEUE_JOURNAL = '.epo-journal'
+    SETTINGS.LOOP_LAG_THRESHOLD = '0.25'
+    shards = Shards()
+    shards.setup_ring(2)
+
+    assert shards.frontend
+    env = shards.environ(1)
+    assert '1/2' == env['EPO_SHARD']
+    assert '2821' == env['EPO_PORT']
+    assert '.epo-cache-1' == env['EPO_CACHE_PATH']
+    assert '.epo-journal-1' == env['EPO_QUEUE_JOURNAL']
+    assert '0.25' == env['EPO_LOOP_LAG_THRESHOLD']
+    assert 'http://127.0.0.1:2819/' == env['EPO_SHARD_FRONTEND']
+
+
+@pytest.mark.asyncio
+def test_forward(mocker, SETTINGS):
+    Client = mocker.patch('jenkins_epo.shards.Client')
+    Client.return_value.return_value.apost = CoroutineMock()
+    from jenkins_epo.shards import Shards
+
+    SETTINGS.PORT = 2819
+    shards = Shards()
+    shards.setup_ring(2)
+
+    yield from shards.forward('simple-webhook', 'owner/repo', head='url')
+    url = shards.url(shards.owner('owner/repo'))
+    Client.assert_called_with(url, service='shard')
+    Client.return_value.assert_called_with('simple-webhook')
+
+    yield from shards.forward('build-webhook', build='url')
+    yield from shards.forward('build-webhook', build='url')
+    urls = [c[1][0] for c in Client.mock_calls if c[0] == '']
+    assert {shards.url(0), shards.url(1)} == set(urls[1:])
+
+
+@pytest.mark.asyncio
+def test_fetch_stats(mocker):
+    Client = mocker.patch('jenkins_epo.shards.Client')
+    Client.return_value.stats.aget = CoroutineMock(side_effect=[
+        '{"queue": 2, "workers": 4, "wait_times": {"owner/repo1": {}},'
+        ' "requests": {"latency": 0.5, "errors": 0.5,'
+        ' "github_remaining": 100}}',
+        Exception('Down'),
+        '{"queue": 1, "workers": 4, "wait_times": {"owner/repo2": {}},'
+        ' "requests": {"latency": null, "errors": 0,'
+        ' "github_remaining": 90}}',
+    ])
+    from jenkins_epo.shards import Shards
+
+    shards = Shards()
+    shards.setup_ring(3)
+    stats = yield from shards.fetch_stats()
+
+    assert stats['processes'][1] is None
+    assert 3 == stats['queue']
+    assert 8 == stats['workers']
+    assert {'owner/repo1', 'owner/repo2'} == set(stats['wait_times'])
+    assert .5 == stats['requests']['latency']
+    assert .25 == stats['requests']['errors']
+    assert 90 == stats['requests']['github_remaining']
+
+
+@pytest.mark.asyncio
+def test_fetch_metrics(mocker):
+    Client = mocker.patch('jenkins_epo.shards.Client')
+    Client.return_value.metrics.aget = CoroutineMock(side_effect=[
+        '# HELP depth Depth.\n# TYPE depth gauge\ndepth 2\n',
+        Exception('Down'),
+    ])
+    METRICS = mocker.patch('jenkins_epo.shards.METRICS')
+    METRICS.render.return_value = (
+        '# HELP depth Depth.\n# TYPE depth gauge\ndepth 0\n'
+    )
+    from jenkins_epo.shards import Shards
+
+    shards = Shards()
+    shards.setup_ring(2)
+    text = yield from shards.fetch_metrics()
+
+    assert text.splitlines() == [
+        '# HELP depth Depth.',
+        '# TYPE depth gauge',
+        'depth{process="frontend"} 0',
+        'depth{process="0"} 2',
+    ]
+
+
+@pytest.mark.asyncio
+def test_shutdown():
+    from jenkins_epo.shards import Shards
+
+    shards = Shards()
+    shards.processes[0] = running = Mock(returncode=None)
+    running.wait = CoroutineMock()
+    shards.processes[1] = dead = Mock(returncode=1)
+    dead.wait = CoroutineMock()
+
+    yield from shards.shutdown(Mock())
+
+    assert running.terminate.mock_calls
+    assert not dead.terminate.mock_calls
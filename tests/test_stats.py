@@ -0,0 +1,36 @@
+import pytest
+
+
+class HTTPError(Exception):
+    def __init__(self, code=None):
+        self.code = code
+
+
+def test_measure_errors():
+    from jenkins_epo.stats import RequestStats
+
+    stats = RequestStats()
+    with stats.measure('jenkins'):
+        pass
+
+    for code in (404, 503, None):
+        with pytest.raises(HTTPError):
+            with stats.measure('jenkins'):
+                raise HTTPError(code)
+
+    # 404 is an answer, 503 and transport errors are failures.
+    assert .5 == stats.error_rate('jenkins')
+
+
+def test_internal_ignored():
+    from jenkins_epo.stats import RequestStats
+
+    stats = RequestStats()
+    with stats.measure('jenkins'):
+        pass
+    with pytest.raises(HTTPError):
+        with stats.measure('shard'):
+            raise HTTPError()
+
+    assert 0 == stats.error_rate()
+    assert 1 == stats.error_rate('shard')
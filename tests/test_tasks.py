@@ -89,12 +89,42 @@ def test_queuer(mocker, WORKERS):
     yield from task()
 
     assert str(task)
-    assert WORKERS.enqueue.mock_calls
+    assert WORKERS.enqueue_many.mock_calls
     assert task.task_factory.mock_calls
     assert repo.fetch_protected_branches.mock_calls
     assert repo.fetch_pull_requests.mock_calls
 
 
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_queuer_jobs_first(mocker, WORKERS):
+    mocker.patch('jenkins_epo.tasks.WORKERS', WORKERS)
+    from jenkins_epo.tasks import QueuerTask, ReconcileJobsTask
+
+    repo = Mock()
+    repo.__str__ = Mock(return_value='owner/repo')
+    repo.fetch_protected_branches = CoroutineMock()
+    repo.process_protected_branches.return_value = []
+    repo.fetch_pull_requests = CoroutineMock()
+    repo.process_pull_requests.return_value = []
+
+    callable_ = CoroutineMock()
+    task = QueuerTask(
+        repo, Mock(), lambda r: ReconcileJobsTask(r, callable_=callable_),
+    )
+
+    yield from task()
+
+    jobs_task = WORKERS.enqueue.mock_calls[0][1][0]
+    assert isinstance(jobs_task, ReconcileJobsTask)
+    assert 'owner/repo' == str(jobs_task)
+    assert jobs_task.priority < ('50-poll',)
+
+    yield from jobs_task()
+
+    assert callable_.mock_calls
+
+
 @pytest.mark.asyncio
 @asyncio.coroutine
 def test_printer():
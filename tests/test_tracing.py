@@ -0,0 +1,113 @@
+import asyncio
+import json
+from unittest.mock import Mock
+
+import pytest
+
+
+def test_span_nesting(mocker):
+    asyncio = mocker.patch('jenkins_epo.tracing.asyncio')
+    task = asyncio.Task.current_task.return_value = Mock(span=None)
+    TRACER = mocker.patch('jenkins_epo.tracing.TRACER')
+    from jenkins_epo.tracing import span
+
+    with span('head', url='url') as head:
+        assert head is task.span
+        with pytest.raises(ValueError):
+            with span('http', service='github') as request:
+                raise ValueError()
+
+    assert task.span is None
+    assert head.id == request.parent_id
+    assert head.trace_id == request.trace_id
+    assert 'ValueError' == request.attrs['error']
+    assert request.duration is not None
+    assert 2 == len(TRACER.emit.mock_calls)
+
+
+def test_span_calls(mocker):
+    mocker.patch('jenkins_epo.tracing.TRACER')
+    from jenkins_epo.tracing import Span
+
+    head = Span('head')
+    extension = Span('extension', head)
+    Span('http', extension)
+    Span('http', head)
+
+    assert 2 == head.calls
+    assert 1 == extension.calls
+    head.duration = 1
+    assert 2 == head.as_dict()['calls']
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_task_factory(event_loop):
+    from jenkins_epo.tracing import current_span, task_factory
+
+    @asyncio.coroutine
+    def child():
+        return current_span()
+
+    task = asyncio.Task.current_task()
+    task.span = span = Mock()
+    event_loop.set_task_factory(task_factory)
+    try:
+        assert span is (yield from event_loop.create_task(child()))
+    finally:
+        event_loop.set_task_factory(None)
+        del task.span
+
+
+def test_tracer(SETTINGS, tmpdir):
+    from jenkins_epo.tracing import Span, Tracer, read
+
+    path = str(tmpdir.join('trace'))
+    tracer = Tracer()
+    assert not tracer.enabled
+
+    SETTINGS.TRACE_PATH = path
+    span = Span('task', item='url')
+    span.duration = 1.5
+    tracer.emit(span)
+    tracer.close()
+
+    with open(path, 'a') as fo:
+        fo.write('{"corrupted\n')
+
+    spans = list(read(path))
+    assert 1 == len(spans)
+    assert 'task' == spans[0]['name']
+    assert 'url' == spans[0]['item']
+    assert 1.5 == spans[0]['duration']
+
+
+def test_summarize():
+    from jenkins_epo.tracing import summarize
+
+    def span(name, start, duration, **attrs):
+        return json.loads(json.dumps(dict(
+            attrs, name=name, start=start, duration=duration,
+        )))
+
+    summary = summarize([
+        span('task', 0, 60),
+        span('head', 0, 50, url='slow'),
+        span('head', 50, 10, url='fast'),
+        span('extension', 1, 40, extension='jenkins-builder', step='run'),
+        span('extension', 51, 2, extension='jenkins-builder', step='run'),
+        span('extension', 0, 1, extension='merger', step='begin'),
+        span('http', 1, 1, status=200, cost=1),
+        span('http', 2, 1, status=304, cost=0),
+    ])
+
+    assert 60 == summary['elapsed']
+    assert 2 == summary['heads']
+    assert 2 == summary['throughput']
+    assert 2 == summary['requests']
+    assert 1 == summary['cached']
+    assert 1 == summary['cost']
+    name, stats = summary['extensions'][0]
+    assert 'jenkins-builder.run' == name
+    assert dict(count=2, total=42) == stats
+    assert ['slow', 'fast'] == [s['url'] for s in summary['slowest']]
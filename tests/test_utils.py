@@ -1,5 +1,8 @@
+import asyncio
 from unittest.mock import Mock, patch
 
+import pytest
+
 
 def test_duration_format():
     from jenkins_epo.utils import format_duration
@@ -113,3 +116,39 @@ def test_post_mortem(mocker):
     post_mortem()
 
     assert pdb.post_mortem.mock_calls
+
+
+def test_deadline_timeout(mocker):
+    asyncio = mocker.patch('jenkins_epo.utils.asyncio')
+    asyncio.TimeoutError = TimeoutError
+    asyncio.get_event_loop.return_value.time.return_value = 100.
+    from jenkins_epo.utils import deadline_timeout
+
+    asyncio.Task.current_task.return_value = None
+    assert 10 == deadline_timeout(10)
+
+    asyncio.Task.current_task.return_value = Mock(deadline=104.)
+    assert 4 == deadline_timeout(10)
+
+    asyncio.Task.current_task.return_value = Mock(deadline=99.)
+    with pytest.raises(TimeoutError):
+        deadline_timeout(10)
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_task_factory(event_loop):
+    from jenkins_epo.utils import deadline_timeout, task_factory
+
+    @asyncio.coroutine
+    def child():
+        return deadline_timeout(10)
+
+    task = asyncio.Task.current_task()
+    task.deadline = event_loop.time() + 4
+    event_loop.set_task_factory(task_factory)
+    try:
+        assert 4 >= (yield from event_loop.create_task(child()))
+    finally:
+        event_loop.set_task_factory(None)
+        del task.deadline
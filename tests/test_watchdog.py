@@ -0,0 +1,62 @@
+import asyncio
+import time
+import traceback
+
+import pytest
+
+
+def test_percentiles():
+    from jenkins_epo.watchdog import LoopWatchdog
+
+    watchdog = LoopWatchdog()
+    assert watchdog.percentiles()['max'] is None
+    watchdog.log_summary()
+
+    for i in range(100):
+        watchdog.record(i / 1000., threshold=1)
+
+    stats = watchdog.percentiles()
+    assert .05 == stats['p50']
+    assert .099 == stats['p99']
+    assert not watchdog.sites
+    watchdog.log_summary()
+
+
+def test_record_blocking():
+    from jenkins_epo.watchdog import LoopWatchdog
+
+    def blocking():
+        return traceback.extract_stack()
+
+    watchdog = LoopWatchdog()
+    watchdog.record(2., threshold=1, capture=blocking())
+    watchdog.record(2., threshold=1)
+
+    (site, count), = watchdog.sites.most_common(1)
+    assert 'test_watchdog.py' in site
+    assert 'blocking' in site
+    assert 1 == watchdog.sites['unknown']
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_run(SETTINGS, event_loop):
+    from jenkins_epo.watchdog import LoopWatchdog
+
+    SETTINGS.LOOP_LAG_THRESHOLD = '0.05'
+    watchdog = LoopWatchdog()
+    task = event_loop.create_task(watchdog.run())
+    yield from asyncio.sleep(.1)
+
+    def sleeper():
+        time.sleep(.3)
+
+    sleeper()
+    yield from asyncio.sleep(.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        yield from task
+
+    assert watchdog.beat is None
+    assert watchdog.percentiles()['max'] >= .2
+    assert any('sleeper' in site for site in watchdog.sites)
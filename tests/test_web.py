@@ -1,4 +1,5 @@
 import asyncio
+import json
 
 from asynctest import CoroutineMock, Mock
 import pytest
@@ -303,3 +304,127 @@ def test_register_task_noop(SETTINGS, mocker):
     assert repo.fetch_hooks.mock_calls
     assert repo.process_hooks.mock_calls
     assert not repo.set_hook.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_build_webhook(mocker, SETTINGS, WORKERS):
+    SETTINGS.JENKINS_URL = 'http://jenkins.lan/'
+    mocker.patch('jenkins_epo.web.WORKERS', WORKERS)
+    from jenkins_epo.web import build_webhook
+
+    req = Mock(GET=dict(build='http://jenkins.lan/job/app/1/'))
+    res = yield from build_webhook(req)
+
+    assert 200 == res.status
+    assert WORKERS.enqueue.mock_calls
+
+    WORKERS.enqueue.reset_mock()
+    req = Mock(GET=dict(job='app', number='1'))
+    res = yield from build_webhook(req)
+
+    assert 200 == res.status
+    task = WORKERS.enqueue.mock_calls[0][1][0]
+    assert 'http://jenkins.lan/job/app/1/' == task.url
+
+    WORKERS.enqueue.reset_mock()
+    req = Mock(GET=dict(job='app'))
+    res = yield from build_webhook(req)
+
+    assert 400 == res.status
+    assert not WORKERS.enqueue.mock_calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_simple_frontend(mocker, WORKERS):
+    mocker.patch('jenkins_epo.web.WORKERS', WORKERS)
+    SHARDS = mocker.patch('jenkins_epo.web.SHARDS')
+    SHARDS.frontend = True
+    SHARDS.forward = CoroutineMock()
+    from jenkins_epo.web import simple_webhook
+
+    url = 'https://github.com/owner/repo/tree/master'
+    req = Mock(GET=dict(head=url))
+    res = yield from simple_webhook(req)
+
+    assert 200 == res.status
+    assert not WORKERS.enqueue.mock_calls
+    SHARDS.forward.assert_called_once_with(
+        'simple-webhook', 'owner/repo', head=url,
+    )
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_stats(mocker, WORKERS):
+    mocker.patch('jenkins_epo.web.WORKERS', WORKERS)
+    SHARDS = mocker.patch('jenkins_epo.web.SHARDS')
+    SHARDS.frontend = False
+    WORKERS.stats.return_value = dict(queue=0)
+    from jenkins_epo.web import stats
+
+    res = yield from stats(Mock())
+
+    assert 200 == res.status
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_metrics():
+    from jenkins_epo.web import metrics
+
+    res = yield from metrics(Mock())
+
+    assert 200 == res.status
+    assert b'# TYPE epo_queue_depth gauge' in res.body
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_metrics_frontend(mocker):
+    SHARDS = mocker.patch('jenkins_epo.web.SHARDS')
+    SHARDS.frontend = True
+    SHARDS.fetch_metrics = CoroutineMock(return_value='depth{process="0"} 1\n')
+    from jenkins_epo.web import metrics
+
+    res = yield from metrics(Mock())
+
+    assert 200 == res.status
+    assert b'depth{process="0"} 1' in res.body
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_introspect(mocker, WORKERS):
+    mocker.patch('jenkins_epo.web.WORKERS', WORKERS)
+    SHARDS = mocker.patch('jenkins_epo.web.SHARDS')
+    SHARDS.frontend = False
+    CACHE = mocker.patch('jenkins_epo.web.CACHE')
+    CACHE.stats.return_value = dict(hits=1, misses=0)
+    WORKERS.snapshot.return_value = dict(queue=0, queued=[], running=[])
+    PROFILER = mocker.patch('jenkins_epo.web.PROFILER')
+    PROFILER.report.return_value = [dict(extension='ext', step='run')]
+    from jenkins_epo.web import introspect
+
+    res = yield from introspect(Mock(GET={'limit': '10'}))
+
+    assert 200 == res.status
+    payload = json.loads(res.text)
+    assert 0 == payload['queue']
+    assert 1 == payload['cache']['hits']
+    assert 'remaining' in payload['github']
+    assert 'ext' == payload['extensions'][0]['extension']
+    WORKERS.snapshot.assert_called_once_with(10)
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_introspect_bad_limit():
+    from jenkins_epo.web import introspect
+
+    res = yield from introspect(Mock(GET={'limit': 'x'}))
+    assert 400 == res.status
+
+    res = yield from introspect(Mock(GET={'limit': '-1'}))
+    assert 400 == res.status
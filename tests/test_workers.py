@@ -1,4 +1,5 @@
 import asyncio
+from unittest.mock import Mock
 
 from asynctest import CoroutineMock
 import pytest
@@ -67,3 +68,562 @@ def test_cancel(SETTINGS, mocker):
     yield from WORKERS.terminate()
 
     assert 1 == len(MockTask.__call__.mock_calls)
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_enqueue_many(SETTINGS, event_loop):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    calls = []
+
+    class MockTask(Task):
+        @asyncio.coroutine
+        def __call__(self):
+            calls.append(self)
+
+    WORKERS.queue = FairQueue(maxsize=2)
+    items = [MockTask(('50-poll', i)) for i in range(5)]
+    producer = event_loop.create_task(WORKERS.enqueue_many(items))
+    yield from asyncio.sleep(0)
+
+    # Producer waits for workers.
+    assert not producer.done()
+    assert 2 == WORKERS.queue.qsize()
+
+    yield from WORKERS.start()
+    yield from producer
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert items == calls
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_deadline(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    SETTINGS.PROCESS_DEADLINE = .01
+    SETTINGS.DEADLINE_BACKOFF = .01
+    SETTINGS.DEADLINE_RETRIES = 1
+    calls = []
+
+    class StuckTask(Task):
+        deadline_setting = 'PROCESS_DEADLINE'
+        qualname = 'owner/repo'
+        key = 'stuck'
+
+        def clone(self, priority):
+            return StuckTask(priority)
+
+        @asyncio.coroutine
+        def __call__(self):
+            calls.append(self)
+            yield from asyncio.sleep(1)
+
+    WORKERS.queue = FairQueue()
+    WORKERS.timeouts.clear()
+    yield from WORKERS.start()
+    first = yield from WORKERS.enqueue(StuckTask(('50-poll',)))
+    yield from WORKERS.queue.join()
+    # Wait for retry.
+    yield from asyncio.sleep(.05)
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert isinstance(first.exception(), asyncio.TimeoutError)
+    assert 2 == len(calls)
+    assert 1 == calls[1].attempt
+    assert 2 == WORKERS.timeouts['owner/repo']
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_deadline_paused(SETTINGS):
+    from jenkins_epo.utils import deadline_paused, deadline_timeout
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    SETTINGS.PROCESS_DEADLINE = .02
+    calls = []
+
+    class ThrottledTask(Task):
+        deadline_setting = 'PROCESS_DEADLINE'
+
+        @asyncio.coroutine
+        def __call__(self):
+            with deadline_paused():
+                # Throttling is not bound to deadline.
+                calls.append(deadline_timeout(10))
+                yield from asyncio.sleep(.05)
+            calls.append(deadline_timeout(10))
+            return 'done'
+
+    WORKERS.queue = FairQueue()
+    WORKERS.timeouts.clear()
+    yield from WORKERS.start()
+    task = yield from WORKERS.enqueue(ThrottledTask(('50-poll',)))
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert 'done' == task.result()
+    assert 10 == calls[0]
+    assert 0 < calls[1] <= .02
+    assert not WORKERS.timeouts
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_snapshot(SETTINGS):
+    from jenkins_epo.tracing import span
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    snapshots = []
+
+    class SnapshotTask(Task):
+        @asyncio.coroutine
+        def __call__(self):
+            with span('extension', extension='merger', step='run') as ext:
+                snapshots.append((WORKERS.snapshot(limit=1), ext))
+
+    class KeyedTask(Task):
+        key = 'owner/repo'
+
+        def clone(self, priority):
+            return KeyedTask(priority)
+
+    WORKERS.queue = FairQueue()
+    yield from WORKERS.enqueue(SnapshotTask(('10-webhook',)))
+    yield from WORKERS.enqueue(KeyedTask(('50-poll', 2)))
+    first = Task(('50-poll', 1))
+    first.qualname = 'owner/first'
+    yield from WORKERS.enqueue(first)
+    yield from WORKERS.start()
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    (snapshot, ext), = snapshots
+    assert 2 == snapshot['queue']
+    queued, = snapshot['queued']
+    assert 'owner/first' == queued['qualname']
+    assert '50-poll' == queued['priority']
+    assert queued['age'] >= 0
+    running, = snapshot['running']
+    assert 'SnapshotTask' == running['task']
+    assert 'merger' == running['extension']['extension']
+    assert running['extension'] is not ext.attrs
+    assert ['owner/repo'] == snapshot['pending_keys']
+    assert [] == snapshot['running_keys']
+    assert running['elapsed'] >= 0
+
+
+def test_fair_scheduler(SETTINGS):
+    from jenkins_epo.workers import FairScheduler, Task
+
+    SETTINGS.REPOSITORY_WEIGHTS = 'owner/big=2,bad=x'
+
+    def task(priority, qualname):
+        task = Task(priority)
+        task.qualname = qualname
+        return task
+
+    scheduler = FairScheduler()
+    for i in range(4):
+        scheduler.push(task(('50-poll', i), 'owner/big'), now=0)
+    for i in range(2):
+        scheduler.push(task(('50-poll', i), 'owner/small'), now=0)
+    scheduler.push(task(('99-poll',), 'owner/small'), now=0)
+    scheduler.push(task(('10-webhook',), 'owner/small'), now=1)
+
+    assert 8 == len(scheduler)
+    assert 8 == len(list(scheduler))
+
+    order = [scheduler.pop(now=2) for _ in range(8)]
+    assert [
+        ('10-webhook', 'owner/small'),
+        ('50-poll', 'owner/big'),
+        ('50-poll', 'owner/big'),
+        ('50-poll', 'owner/small'),
+        ('50-poll', 'owner/big'),
+        ('50-poll', 'owner/big'),
+        ('50-poll', 'owner/small'),
+        ('99-poll', 'owner/small'),
+    ] == [(t.priority_class, t.qualname) for t in order]
+    # Priority is kept inside a repository.
+    assert [0, 1, 2, 3] == [
+        t.priority[1] for t in order if t.qualname == 'owner/big'
+    ]
+    assert 0 == len(scheduler)
+    assert not scheduler.classes
+
+
+def test_fair_scheduler_wait_times(SETTINGS):
+    from jenkins_epo.workers import FairScheduler, Task
+
+    SETTINGS.REPOSITORY_WEIGHTS = ''
+    scheduler = FairScheduler()
+    scheduler.push(Task(0), now=0)
+    scheduler.push(Task(0), now=4)
+    scheduler.pop(now=10)
+
+    times = scheduler.wait_times(now=12)
+    assert 10 == times[None]['last']
+    assert 10 == times[None]['max']
+    assert 8 == times[None]['pending']
+    assert 1 == times[None]['count']
+
+
+def test_process_url_task_qualname():
+    from jenkins_epo.tasks import ProcessUrlTask
+
+    task = ProcessUrlTask(
+        ('10-webhook',), 'https://github.com/owner/repo/tree/master', Mock(),
+    )
+    assert 'owner/repo' == task.qualname
+
+    task = ProcessUrlTask(
+        ('10-webhook',), 'https://github.com/owner/my.repo/pull/1', Mock(),
+    )
+    assert 'owner/my.repo' == task.qualname
+
+    task = ProcessUrlTask(
+        ('10-webhook',), 'http://jenkins.lan/job/job/1/', Mock(),
+    )
+    assert task.qualname is None
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_coalesce_queued(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+
+    class KeyedTask(Task):
+        key = 'url'
+        __call__ = CoroutineMock(return_value='done')
+
+        def clone(self, priority):
+            return KeyedTask(priority)
+
+    class UncloneableTask(Task):
+        key = 'url'
+
+    WORKERS.queue = FairQueue()
+    WORKERS.pending.clear()
+    first = yield from WORKERS.enqueue(KeyedTask(('50-poll',)))
+    second = yield from WORKERS.enqueue(KeyedTask(('10-webhook',)))
+    # Coalescing requires clone.
+    yield from WORKERS.enqueue(UncloneableTask())
+
+    assert 2 == WORKERS.queue.qsize()
+    assert ('10-webhook',) == first.priority
+    assert [second] == first.followers
+
+    yield from WORKERS.start()
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert 1 == len(KeyedTask.__call__.mock_calls)
+    assert 'done' == second.result()
+    assert not WORKERS.pending
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_coalesce_queue_full(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    calls = []
+
+    class KeyedTask(Task):
+        key = 'owner/repo'
+
+        def clone(self, priority):
+            return KeyedTask(priority)
+
+        @asyncio.coroutine
+        def __call__(self):
+            calls.append(self.priority)
+
+    loop = asyncio.get_event_loop()
+    WORKERS.queue = FairQueue(maxsize=1)
+    yield from WORKERS.enqueue(Task(('50-poll',)))
+    # Blocks on full queue.
+    blocked = loop.create_task(WORKERS.enqueue(KeyedTask(('99-poll',))))
+    yield from asyncio.sleep(0)
+    follower = yield from WORKERS.enqueue(KeyedTask(('50-poll',)))
+
+    yield from WORKERS.start()
+    yield from blocked
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert [('50-poll',)] == calls
+    assert follower.done()
+    assert 0 == WORKERS.queue.qsize()
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_rerun_dirty(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 2
+    calls = []
+
+    class KeyedTask(Task):
+        key = 'url'
+
+        def clone(self, priority):
+            return KeyedTask(priority)
+
+        @asyncio.coroutine
+        def __call__(self):
+            calls.append(self)
+            if len(calls) == 1:
+                # A new event comes while running.
+                self.duplicate = yield from WORKERS.enqueue(
+                    KeyedTask(('10-webhook',))
+                )
+
+    WORKERS.queue = FairQueue()
+    yield from WORKERS.start()
+    first = yield from WORKERS.enqueue(KeyedTask(('50-poll',)))
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert 2 == len(calls)
+    assert not first.cancelled()
+    assert ('10-webhook',) == calls[1].priority
+    assert first.duplicate.done()
+    assert not WORKERS.running
+
+
+@asyncio.coroutine
+def hang(url):
+    yield from asyncio.sleep(3600)
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_journal_running_at_terminate(SETTINGS, tmpdir):
+    from jenkins_epo.journal import Journal
+    from jenkins_epo.tasks import ProcessUrlTask
+    from jenkins_epo.workers import WORKERS, FairQueue
+    SETTINGS.CONCURRENCY = 1
+    SETTINGS.QUEUE_JOURNAL = str(tmpdir.join('journal'))
+    url = 'https://github.com/owner/repo/tree/master'
+
+    WORKERS.queue = FairQueue()
+    yield from WORKERS.start(replay=True)
+    yield from WORKERS.enqueue(ProcessUrlTask(('50-poll', url), url, hang))
+    yield from asyncio.sleep(.01)
+    assert WORKERS.current
+    yield from WORKERS.terminate()
+
+    # Running task is replayed on restart.
+    journal = Journal(SETTINGS.QUEUE_JOURNAL)
+    tasks = journal.open()
+    journal.close()
+    assert [url] == [t.url for t in tasks]
+
+
+def test_autoscaler_compute(SETTINGS):
+    from jenkins_epo.workers import Autoscaler
+
+    SETTINGS.CONCURRENCY_MIN = 2
+    SETTINGS.CONCURRENCY_MAX = 16
+    SETTINGS.RATE_LIMIT_THRESHOLD = 50
+    scaler = Autoscaler(Mock())
+
+    def compute(size, depth=64, latency=.5, errors=0, remaining=None):
+        return scaler.compute(size, depth, latency, errors, remaining)[0]
+
+    assert 10 == compute(8)
+    assert 16 == compute(16)
+    assert 8 == compute(8, latency=2)
+    assert 7 == compute(8, errors=.5)
+    assert 4 == compute(8, remaining=10)
+    assert 2 == compute(2, depth=0, latency=None, remaining=0)
+
+
+def test_autoscaler_tick(SETTINGS, mocker):
+    REQUESTS = mocker.patch('jenkins_epo.workers.REQUESTS')
+    from jenkins_epo.workers import Autoscaler
+
+    SETTINGS.CONCURRENCY_MIN = 1
+    SETTINGS.CONCURRENCY_MAX = 4
+    REQUESTS.latency.return_value = None
+    REQUESTS.error_rate.return_value = 0
+    REQUESTS.github_remaining = None
+    pool = Mock(size=2)
+    pool.queue.qsize.return_value = 0
+    scaler = Autoscaler(pool)
+
+    assert 1 == scaler.tick()
+    pool.resize.assert_called_once_with(1)
+    assert 1 == scaler.history[-1][1]
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_resize(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue
+    SETTINGS.CONCURRENCY = 3
+
+    WORKERS.queue = FairQueue()
+    yield from WORKERS.start()
+    assert 3 == len(WORKERS.workers)
+    assert {0, 1, 2} == WORKERS.idle
+
+    WORKERS.resize(1)
+    yield from asyncio.sleep(0)
+    assert [0] == list(WORKERS.workers)
+    assert {0} == WORKERS.idle
+
+    WORKERS.resize(2)
+    yield from asyncio.sleep(0)
+    assert {0, 1} == WORKERS.idle
+    yield from WORKERS.terminate()
+
+
+def test_fair_scheduler_aging(SETTINGS):
+    from jenkins_epo.workers import FairScheduler, Task
+
+    SETTINGS.PRIORITY_AGING = 10
+    scheduler = FairScheduler()
+    scheduler.push(Task(('99-poll',)), now=0)
+    scheduler.push(Task(('50-poll',)), now=495)
+    scheduler.push(Task(('50-poll',)), now=495)
+
+    # 99-poll waited long enough to outrank fresh 50-poll.
+    assert '99-poll' == scheduler.pop(now=500).priority_class
+    assert '50-poll' == scheduler.pop(now=500).priority_class
+
+    SETTINGS.PRIORITY_AGING = 0
+    scheduler.push(Task(('99-poll',)), now=0)
+    assert '50-poll' == scheduler.pop(now=500).priority_class
+
+
+def test_fair_scheduler_aging_webhook(SETTINGS):
+    from jenkins_epo.workers import FairScheduler, Task
+
+    SETTINGS.PRIORITY_AGING = 10
+    scheduler = FairScheduler()
+    for _ in range(3):
+        scheduler.push(Task(('99-poll',)), now=0)
+        scheduler.push(Task(('50-poll',)), now=0)
+    scheduler.push(Task(('10-webhook',)), now=3600)
+
+    # Long poll backlog never outranks a fresh webhook.
+    assert '10-webhook' == scheduler.pop(now=3600).priority_class
+    # Fully aged classes are served in order.
+    assert '50-poll' == scheduler.pop(now=3600).priority_class
+
+
+def test_task_urgent():
+    from jenkins_epo.tasks import ProcessUrlTask
+
+    task = ProcessUrlTask(('10-webhook', 'url'), 'url', Mock())
+    assert task.urgent
+    task = ProcessUrlTask(('50-poll', False, 200, 1), 'url', Mock())
+    assert task.urgent
+    assert (50, False) == task.rank
+    task = ProcessUrlTask(('50-poll', True, 200, 1), 'url', Mock())
+    assert not task.urgent
+    assert (50, True) == task.rank
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_preemption(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    SETTINGS.PREEMPT = True
+    events = []
+
+    class SlowTask(Task):
+        @asyncio.coroutine
+        def __call__(self):
+            events.append('slow start')
+            yield from WORKERS.enqueue(UrgentTask(('10-webhook',)))
+            yield from WORKERS.checkpoint()
+            events.append('slow end')
+
+    class UrgentTask(Task):
+        @asyncio.coroutine
+        def __call__(self):
+            events.append('urgent')
+
+    WORKERS.queue = FairQueue()
+    yield from WORKERS.start()
+    slow = yield from WORKERS.enqueue(SlowTask(('50-poll',)))
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert ['slow start', 'urgent', 'slow end'] == events
+    assert slow.done()
+    assert not WORKERS.current
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_preemption_outranked(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    SETTINGS.PREEMPT = True
+    events = []
+
+    class SlowTask(Task):
+        @asyncio.coroutine
+        def __call__(self):
+            events.append('slow start')
+            yield from WORKERS.enqueue(Task(('99-poll',)))
+            WORKERS.current[asyncio.Task.current_task()].preempt_requested = (
+                True
+            )
+            yield from WORKERS.checkpoint()
+            events.append('slow end')
+            events.append(WORKERS.queue.qsize())
+
+    WORKERS.queue = FairQueue()
+    yield from WORKERS.start()
+    yield from WORKERS.enqueue(SlowTask(('50-poll',)))
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert ['slow start', 'slow end', 1] == events
+
+
+@pytest.mark.asyncio
+@asyncio.coroutine
+def test_preemption_deadline(SETTINGS):
+    from jenkins_epo.workers import WORKERS, FairQueue, Task
+    SETTINGS.CONCURRENCY = 1
+    SETTINGS.PREEMPT = True
+    SETTINGS.PROCESS_DEADLINE = .01
+    SETTINGS.DEADLINE_RETRIES = 0
+
+    class SlowTask(Task):
+        deadline_setting = 'PROCESS_DEADLINE'
+
+        @asyncio.coroutine
+        def __call__(self):
+            yield from WORKERS.enqueue(urgent)
+            yield from WORKERS.checkpoint()
+
+    class UrgentTask(Task):
+        @asyncio.coroutine
+        def __call__(self):
+            yield from asyncio.sleep(.05)
+            return 'done'
+
+    urgent = UrgentTask(('10-webhook',))
+    WORKERS.queue = FairQueue()
+    WORKERS.timeouts.clear()
+    yield from WORKERS.start()
+    slow = yield from WORKERS.enqueue(SlowTask(('50-poll',)))
+    yield from WORKERS.queue.join()
+    yield from WORKERS.terminate()
+
+    assert isinstance(slow.exception(), asyncio.TimeoutError)
+    assert 'done' == urgent.result()